@@ -0,0 +1,155 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from config import Config
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def _numbers_key(question: str) -> Tuple[str, ...]:
+    """Các con số trong câu hỏi (năm, mã ngành...): hai câu hỏi chỉ khác năm không được dùng chung câu trả lời"""
+    return tuple(sorted(set(re.findall(r'\d+', question))))
+
+
+class SemanticAnswerCache:
+    """Cache câu trả lời theo ngữ nghĩa đặt trước bước tìm kiếm + gọi LLM.
+
+    Câu hỏi mới được so sánh (cosine) với embedding các câu hỏi đã trả lời;
+    nếu độ tương đồng vượt ngưỡng thì trả lại câu trả lời đã lưu. Các mục có
+    TTL, bị loại theo LRU khi vượt giới hạn và bị xóa toàn bộ khi index được
+    xây dựng lại (đổi `index_version`).
+    """
+
+    def __init__(
+        self,
+        threshold: float = Config.ANSWER_CACHE_SIMILARITY,
+        ttl_seconds: float = Config.ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = Config.ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.index_version: Optional[str] = None
+
+        # entry id -> (câu hỏi đã chuẩn hóa, khóa số, vector đã chuẩn hóa, dữ liệu trả lời, thời điểm tạo)
+        self._entries: "OrderedDict[int, Tuple[str, Tuple[str, ...], np.ndarray, Dict, float]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _sync_version(self, index_version: Optional[str]):
+        """Xóa cache khi index đã được xây dựng lại (gọi khi đang giữ lock)"""
+        if index_version == self.index_version:
+            return
+        if self._entries:
+            logger.info(f"🧹 Index đã thay đổi, xóa {len(self._entries)} câu trả lời đã cache")
+            self._stats['invalidations'] += 1
+        self._entries.clear()
+        self._matrix = None
+        self.index_version = index_version
+
+    def _expire(self, now: float):
+        if self.ttl_seconds <= 0:
+            return
+        expired = [entry_id for entry_id, entry in self._entries.items() if now - entry[4] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._stats['expirations'] += len(expired)
+            self._matrix = None
+
+    def _ensure_matrix(self):
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            self._matrix = (
+                np.vstack([self._entries[entry_id][2] for entry_id in self._matrix_ids])
+                if self._matrix_ids else None
+            )
+
+    def lookup(self, question: str, vector, index_version: Optional[str] = None) -> Optional[Dict]:
+        """Tìm câu trả lời đã lưu cho câu hỏi tương tự; trả về None nếu không có"""
+        with self._lock:
+            self._sync_version(index_version)
+            self._expire(time.time())
+            self._ensure_matrix()
+
+            best_id, best_similarity = None, -1.0
+            if self._matrix is not None:
+                similarities = self._matrix @ self._unit(vector)
+                numbers = _numbers_key(question)
+                for position in np.argsort(-similarities):
+                    similarity = float(similarities[position])
+                    if similarity < self.threshold:
+                        break
+                    entry_id = self._matrix_ids[position]
+                    if self._entries[entry_id][1] == numbers:
+                        best_id, best_similarity = entry_id, similarity
+                        break
+
+            if best_id is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._stats['hits'] += 1
+            self._entries.move_to_end(best_id)
+            cached_question, _, _, payload, _ = self._entries[best_id]
+        logger.info(f"⚡ Dùng câu trả lời đã cache cho '{cached_question}' (similarity={best_similarity:.3f})")
+        return {**payload, 'cached_question': cached_question, 'similarity': round(best_similarity, 4)}
+
+    def store(self, question: str, vector, payload: Dict, index_version: Optional[str] = None):
+        """Lưu câu trả lời cho câu hỏi (thay thế mục cũ có cùng câu hỏi)"""
+        key = normalize_text(question).lower()
+        with self._lock:
+            self._sync_version(index_version)
+            for entry_id, entry in list(self._entries.items()):
+                if entry[0] == key:
+                    del self._entries[entry_id]
+            self._entries[self._next_id] = (key, _numbers_key(question), self._unit(vector), dict(payload), time.time())
+            self._next_id += 1
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get_statistics(self) -> Dict:
+        """Thống kê hit/miss của cache câu trả lời"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'lookups': lookups,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'ttl_seconds': self.ttl_seconds,
+        }
@@ -1,7 +1,9 @@
 import streamlit as st
 import time
+import uuid
 from datetime import datetime
-from chatbot import TuyenSinhBot
+from chat_client import ChatClient
+from chat_server import start_background_server
 from config import Config
 import logging
 
@@ -80,17 +82,23 @@ st.markdown(
 
 @st.cache_resource
 def initialize_bot():
-    """Khởi tạo bot với cache"""
-    with st.spinner("Đang khởi tạo bot..."):
-        bot = TuyenSinhBot()
-        return bot
+    """Client tới chat server (CHAT_SERVER_URL); nếu chưa cấu hình thì chạy server trong nền ngay trong process này.
+
+    Model và index nằm ở server, dùng chung cho mọi phiên; mỗi phiên trình duyệt có lịch sử riêng.
+    """
+    if Config.CHAT_SERVER_URL:
+        return ChatClient(Config.CHAT_SERVER_URL)
+    server = start_background_server()
+    host, port = server.server_address[:2]
+    return ChatClient(f"http://{host}:{port}")
 
 
-def display_chat_message(role, content, timestamp=None):
-    """Hiển thị tin nhắn chat"""
+def display_chat_message(role, content, timestamp=None, container=None):
+    """Hiển thị tin nhắn chat (trong `container`, ví dụ st.empty() khi đang stream)"""
+    container = container or st
     formatted_time = timestamp.strftime("%H:%M:%S") if timestamp else ""
     if role == "user":
-        st.markdown(
+        container.markdown(
             f"""
         <div class="chat-message user-message">
             <strong>👤 Bạn:</strong><br>
@@ -101,7 +109,7 @@ def display_chat_message(role, content, timestamp=None):
             unsafe_allow_html=True,
         )
     else:
-        st.markdown(
+        container.markdown(
             f"""
         <div class="chat-message bot-message">
             <strong>🤖 Bot:</strong><br>
@@ -127,6 +135,9 @@ def main():
 
     # Khởi tạo bot
     bot = initialize_bot()
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    session_id = st.session_state.session_id
 
     # Sidebar
     with st.sidebar:
@@ -140,6 +151,22 @@ def main():
             help="Sử dụng từ đồng nghĩa và context để cải thiện kết quả tìm kiếm"
         )
 
+        # Trạng thái khởi động
+        readiness = bot.get_readiness()
+        if readiness["state"] == "failed":
+            st.error(f"❌ Khởi động thất bại: {readiness['error']}")
+        elif readiness["state"] == "unreachable":
+            st.warning(f"⚠️ {readiness['error']}")
+            if st.button("🔄 Thử kết nối lại"):
+                st.rerun()
+        elif not readiness["ready"]:
+            st.info(
+                f"⏳ Đang khởi động ({readiness['state']})"
+                + (" - đã có thể trả lời dựa trên tìm kiếm" if readiness["retrieval_ready"] else "")
+            )
+            if st.button("🔄 Cập nhật trạng thái"):
+                st.rerun()
+
         # Thống kê
         stats = bot.get_statistics()
         st.markdown("#### 📊 Thống kê")
@@ -148,13 +175,35 @@ def main():
         <div class="stats-card">
             <strong>Vector Store:</strong> {stats['vector_store']['status']}<br>
             <strong>LLM:</strong> {'✅ Có sẵn' if stats['llm_available'] else '❌ Chưa cấu hình'}<br>
-            <strong>Lịch sử chat:</strong> {stats['conversation_history_length']} tin nhắn<br>
-            <strong>Query Expansion:</strong> {'✅ Bật' if use_query_expansion else '❌ Tắt'}
+            <strong>Lịch sử chat:</strong> {len(st.session_state.get('messages', []))} tin nhắn<br>
+            <strong>Query Expansion:</strong> {'✅ Bật' if use_query_expansion else '❌ Tắt'}<br>
+            <strong>⚡ Thời gian đến token đầu:</strong> {stats['latency']['ttft_ms_avg']:.0f} ms (p95 {stats['latency']['ttft_ms_p95']:.0f} ms)<br>
+            <strong>🚦 Máy chủ:</strong> {stats['server']['running']}/{stats['server']['workers']} đang xử lý, {stats['server']['waiting']} đang chờ
         </div>
         """,
             unsafe_allow_html=True,
         )
 
+        # Độ trễ theo giai đoạn (tracing)
+        if stats["tracing"]["enabled"] and st.checkbox("⏱️ Độ trễ theo giai đoạn", value=False):
+            stages = stats["tracing"]["stages"]
+            if stages:
+                st.table(
+                    [
+                        {"Giai đoạn": name, "n": s["count"], "p50 (ms)": s["p50_ms"],
+                         "p95 (ms)": s["p95_ms"], "p99 (ms)": s["p99_ms"]}
+                        for name, s in stages.items()
+                    ]
+                )
+            else:
+                st.caption("Chưa có request nào được ghi nhận.")
+            st.download_button(
+                label="📥 Xuất số liệu tracing (JSON)",
+                data=bot.export_traces(),
+                file_name="tracing.json",
+                mime="application/json",
+            )
+
         # Câu hỏi gợi ý
         st.markdown("#### 💡 Câu hỏi gợi ý")
         suggestions = bot.suggest_questions()
@@ -165,7 +214,7 @@ def main():
 
         # Nút xóa lịch sử
         if st.button("🗑️ Xóa lịch sử chat"):
-            bot.clear_history()
+            bot.clear_history(session_id)
             st.session_state.messages = []
             st.success("Đã xóa lịch sử chat!")
             st.rerun()
@@ -217,14 +266,24 @@ def main():
         # Hiển thị tin nhắn người dùng
         display_chat_message("user", user_input)
 
-        # Xử lý câu trả lời
-        with st.spinner("🤖 Bot đang suy nghĩ..."):
-            response = bot.chat(user_input, use_query_expansion=use_query_expansion)
-
-            if response["success"]:
-                bot_response = response["response"]
-            else:
-                bot_response = "Xin lỗi, có lỗi xảy ra. Vui lòng thử lại sau."
+        # Xử lý câu trả lời: hiển thị dần từng đoạn ngay khi LLM sinh ra
+        placeholder = st.empty()
+        display_chat_message("assistant", "🔍 Đang tìm thông tin liên quan...", container=placeholder)
+        streamed = ""
+        response = {}
+        for event in bot.chat_stream(user_input, use_query_expansion=use_query_expansion, session_id=session_id):
+            if event["type"] == "context":
+                display_chat_message("assistant", "🤖 Bot đang suy nghĩ...", container=placeholder)
+            elif event["type"] == "token":
+                streamed += event["text"]
+                display_chat_message("assistant", streamed + " ▌", container=placeholder)
+            elif event["type"] == "done":
+                response = event
+
+        if response.get("success") or response.get("error") in ("not_ready", "busy", "unreachable"):
+            bot_response = response["response"]
+        else:
+            bot_response = "Xin lỗi, có lỗi xảy ra. Vui lòng thử lại sau."
 
         # Thêm tin nhắn bot
         st.session_state.messages.append(
@@ -232,7 +291,7 @@ def main():
         )
 
         # Hiển thị tin nhắn bot
-        display_chat_message("assistant", bot_response)
+        display_chat_message("assistant", bot_response, container=placeholder)
 
         # Reset input bằng cách rerun
         st.rerun()
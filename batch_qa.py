@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Trả lời hàng loạt câu hỏi offline (tạo FAQ, rà soát chất lượng trước mùa tuyển sinh, kiểm thử hồi quy)
+
+Đọc câu hỏi từ file JSONL (mỗi dòng {"id": ..., "question": ...} hoặc một chuỗi),
+embed và tìm kiếm FAISS theo từng lô lớn (một lần tìm kiếm dạng ma trận mỗi lô),
+gọi LLM song song có giới hạn rồi ghi câu trả lời kèm thời gian từng giai đoạn
+ra file JSONL. File kết quả cũng là checkpoint: chạy lại cùng lệnh sẽ bỏ qua các
+câu hỏi đã trả lời thành công và thử lại các câu bị lỗi (bản ghi mới được ghi
+thêm vào cuối, bản ghi sau cùng của mỗi id là kết quả hiện hành).
+
+    python batch_qa.py questions.jsonl answers.jsonl --llm stub --concurrency 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from chatbot import TuyenSinhBot
+from gemini_llm import FakeLLM, GeminiLLM, RateLimitedStubModel
+from llm_scheduler import PRIORITY_BACKGROUND, QuotaScheduler
+
+logger = logging.getLogger(__name__)
+
+LLM_CHOICES = ["auto", "gemini", "stub", "fake", "none"]
+
+
+def read_questions(path: str) -> Iterator[Dict]:
+    """Đọc câu hỏi từ JSONL; câu hỏi không có id được đánh số theo dòng"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            question = str(item.get("question") or "").strip()
+            if not question:
+                logger.warning(f"Bỏ qua dòng {line_number}: thiếu 'question'")
+                continue
+            yield {"id": str(item.get("id", line_number)), "question": question}
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Các id đã được trả lời thành công trong file kết quả (checkpoint của lần chạy trước).
+
+    Câu hỏi bị lỗi không được tính là xong để lần chạy sau thử lại; với mỗi id,
+    bản ghi sau cùng quyết định. Dòng cuối bị ghi dở (lần chạy trước bị dừng
+    đột ngột) được cắt bỏ để ghi tiếp.
+    """
+    succeeded: Dict[str, bool] = {}
+    if not os.path.exists(path):
+        return set()
+    valid_size = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+                succeeded[str(record["id"])] = bool(record.get("success", True))
+            except (ValueError, KeyError, TypeError):
+                break
+            valid_size += len(line)
+    if valid_size < os.path.getsize(path):
+        logger.warning(f"✂️ Cắt bỏ phần ghi dở ở cuối checkpoint '{path}'")
+        with open(path, 'r+b') as f:
+            f.truncate(valid_size)
+    return {record_id for record_id, success in succeeded.items() if success}
+
+
+def batches(items: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_llm(kind: str, concurrency: int, stub_latency_ms: float):
+    """LLM cho chạy hàng loạt: 'gemini', 'stub' (Gemini giả lập qua scheduler quota, chạy offline),
+    'fake' (LLM giả lập), 'none' (chỉ tìm kiếm) hoặc 'auto' (gemini nếu có API key)"""
+    if kind == "auto":
+        kind = "gemini" if getattr(Config, "GEMINI_API_KEY", None) and not Config.FAKE_LLM else "fake"
+    if kind == "gemini":
+        return GeminiLLM(), kind
+    if kind == "stub":
+        scheduler = QuotaScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=concurrency)
+        model = RateLimitedStubModel(requests_per_minute=10 ** 9, latency_ms=stub_latency_ms)
+        return GeminiLLM(model=model, scheduler=scheduler), kind
+    if kind == "fake":
+        return FakeLLM(), kind
+    return None, None
+
+
+class BatchAnswerer:
+    """Đóng gói context, gọi LLM và ghi từng câu trả lời ra JSONL ngay khi xong (an toàn đa luồng)"""
+
+    def __init__(self, bot: TuyenSinhBot, output_path: str):
+        self.bot = bot
+        self._output = open(output_path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.answered = 0
+        self.failed = 0
+        self.timings: Dict[str, List[float]] = {'retrieval_ms': [], 'context_ms': [], 'generation_ms': [], 'total_ms': []}
+
+    def _generate(self, prompt: str) -> str:
+        if isinstance(self.bot.llm, GeminiLLM):
+            return self.bot.llm.generate(prompt, priority=PRIORITY_BACKGROUND)
+        return self.bot.llm.generate(prompt)
+
+    def answer(self, item: Dict, results: List, retrieval_ms: float):
+        start_time = time.perf_counter()
+        context, context_stats = self.bot._pack_context(results)
+        context_ms = (time.perf_counter() - start_time) * 1000
+
+        generation_start = time.perf_counter()
+        error: Optional[str] = None
+        if self.bot.llm is None:
+            response = self.bot._fallback_response(context)
+        else:
+            try:
+                response = self._generate(self.bot._build_prompt(item["question"], context))
+            except Exception as e:
+                error = str(e)
+                response = self.bot._error_response(context)
+        generation_ms = (time.perf_counter() - generation_start) * 1000
+
+        timings = {
+            'retrieval_ms': round(retrieval_ms, 2),
+            'context_ms': round(context_ms, 2),
+            'generation_ms': round(generation_ms, 2),
+            'total_ms': round(retrieval_ms + context_ms + generation_ms, 2),
+        }
+        record = {
+            "id": item["id"],
+            "question": item["question"],
+            "response": response,
+            "success": error is None,
+            "sources": sorted({result['source'] for result in results}),
+            "context_tokens": context_stats.get("packed_tokens", 0),
+            "timings": timings,
+        }
+        if error is not None:
+            record["error"] = error
+
+        with self._lock:
+            self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._output.flush()
+            if error is None:
+                self.answered += 1
+            else:
+                self.failed += 1
+            for name, value in timings.items():
+                self.timings[name].append(value)
+            done = self.answered + self.failed
+        if done % 100 == 0:
+            logger.info(f"📊 Đã trả lời {done} câu hỏi ({self.failed} lỗi)")
+
+    def close(self):
+        self._output.close()
+
+    def summary(self) -> Dict:
+        stages = {}
+        for name, values in self.timings.items():
+            if values:
+                stages[name] = {
+                    'avg': round(float(np.mean(values)), 2),
+                    'p50': round(float(np.percentile(values, 50)), 2),
+                    'p95': round(float(np.percentile(values, 95)), 2),
+                }
+        return {'answered': self.answered, 'failed': self.failed, 'timings_ms': stages}
+
+
+def run(args) -> Dict:
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    if done:
+        logger.info(f"↩️ Tiếp tục từ checkpoint: bỏ qua {len(done)} câu hỏi đã trả lời thành công")
+
+    # Bot chỉ dùng cho tìm kiếm với LLM được thay bên dưới: không để luồng dựng sẵn câu trả lời gọi Gemini
+    bot = TuyenSinhBot(background_startup=False, precompute=False)
+    bot.llm, bot.llm_type = create_llm(args.llm, args.concurrency, args.stub_latency_ms)
+    logger.info(f"🧠 LLM: {bot.llm_type or 'không dùng (chỉ tìm kiếm)'}, song song {args.concurrency}")
+
+    answerer = BatchAnswerer(bot, args.output)
+    pending = (item for item in read_questions(args.input) if item["id"] not in done)
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch-llm") as executor:
+            in_flight = set()
+            for batch in batches(pending, args.batch_size):
+                # Tìm kiếm lô tiếp theo trong khi các lời gọi LLM của lô trước vẫn đang chạy
+                search_start = time.perf_counter()
+                results = bot.vector_store.search_batch(
+                    [item["question"] for item in batch], k=args.k, use_query_expansion=not args.no_expansion
+                )
+                retrieval_ms = (time.perf_counter() - search_start) * 1000 / len(batch)
+                for item, item_results in zip(batch, results):
+                    in_flight.add(executor.submit(answerer.answer, item, item_results, retrieval_ms))
+                # Không tìm kiếm quá xa so với tốc độ LLM (giới hạn bộ nhớ giữ kết quả chờ)
+                while len(in_flight) > args.concurrency * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+            for future in in_flight:
+                future.result()
+    finally:
+        answerer.close()
+
+    elapsed = time.perf_counter() - start_time
+    summary = answerer.summary()
+    processed = summary['answered'] + summary['failed']
+    summary.update({
+        'skipped': len(done),
+        'elapsed_s': round(elapsed, 2),
+        'questions_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0,
+        'llm': bot.llm_type,
+        'output': args.output,
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trả lời hàng loạt câu hỏi từ file JSONL")
+    parser.add_argument("input", help="File JSONL câu hỏi: {\"id\": ..., \"question\": ...} mỗi dòng")
+    parser.add_argument("output", help="File JSONL câu trả lời (đồng thời là checkpoint)")
+    parser.add_argument("--llm", choices=LLM_CHOICES, default="auto")
+    parser.add_argument("--concurrency", type=int, default=4, help="số lời gọi LLM song song")
+    parser.add_argument("--batch-size", type=int, default=256, help="số câu hỏi mỗi lần embed + tìm kiếm")
+    parser.add_argument("--k", type=int, default=5, help="số chunk tham khảo mỗi câu hỏi")
+    parser.add_argument("--no-expansion", action="store_true", help="tắt mở rộng truy vấn")
+    parser.add_argument("--stub-latency-ms", type=float, default=200, help="độ trễ của LLM stub")
+    parser.add_argument("--restart", action="store_true", help="bỏ checkpoint cũ, trả lời lại từ đầu")
+    args = parser.parse_args()
+    args.concurrency = max(1, args.concurrency)
+    args.batch_size = max(1, args.batch_size)
+
+    logging.basicConfig(level=logging.INFO)
+    summary = run(args)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
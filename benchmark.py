@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Benchmark hiệu năng đầu-cuối với corpus tổng hợp
+
+Sinh corpus .docx kiểu tài liệu tuyển sinh ở nhiều cỡ (10x/100x/1000x dữ liệu
+hiện tại), rồi với mỗi cỡ chạy một process riêng để đo: thông lượng nạp dữ
+liệu, thời gian xây dựng, dung lượng index, thời gian tải và độ trễ từng giai
+đoạn truy vấn ở p50/p95/p99. Truy vấn chạy qua đúng `TuyenSinhBot.chat_stream`
+(LLM giả lập), độ trễ từng giai đoạn lấy từ các span tracing của request (mở
+rộng, embedding, tìm kiếm FAISS, định dạng, đóng gói context, sinh câu trả lời).
+Kết quả được ghi ra JSON để so sánh giữa các commit.
+
+    python benchmark.py --scales 10 100
+    python benchmark.py --compare benchmark_results/a.json benchmark_results/b.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+BASE_DATA_DIR = "./data"
+# Kích thước corpus gốc khi không đọc được ./data (số ký tự văn bản, số file)
+DEFAULT_BASE_CHARS = 80000
+DEFAULT_BASE_FILES = 4
+
+MAJORS = [
+    ("7140201", "Giáo dục Mầm non"), ("7140202", "Giáo dục Tiểu học"), ("7140209", "Sư phạm Toán học"),
+    ("7140210", "Sư phạm Tin học"), ("7140211", "Sư phạm Vật lý"), ("7140212", "Sư phạm Hóa học"),
+    ("7140217", "Sư phạm Ngữ văn"), ("7140231", "Sư phạm Tiếng Anh"), ("7220201", "Ngôn ngữ Anh"),
+    ("7220204", "Ngôn ngữ Trung Quốc"), ("7229030", "Văn học"), ("7310101", "Kinh tế"),
+    ("7310608", "Đông phương học"), ("7340101", "Quản trị kinh doanh"), ("7340201", "Tài chính – Ngân hàng"),
+    ("7340301", "Kế toán"), ("7380101", "Luật"), ("7420201", "Công nghệ sinh học"),
+    ("7460112", "Toán ứng dụng"), ("7480201", "Công nghệ thông tin"), ("7480101", "Khoa học máy tính"),
+    ("7510302", "Công nghệ kỹ thuật điện tử – viễn thông"), ("7520201", "Kỹ thuật điện"),
+    ("7580201", "Kỹ thuật xây dựng"), ("7620110", "Khoa học cây trồng"), ("7810103", "Quản trị dịch vụ du lịch và lữ hành"),
+]
+SUBJECT_GROUPS = [
+    "(Toán, Lý, Hóa)", "(Toán, Lý, Anh)", "(Toán, Văn, Anh)", "(Văn, Sử, Địa)",
+    "(Toán, Hóa, Sinh)", "(Văn, Toán, Giáo dục KT và PL)", "(Toán, Anh, Tin)",
+]
+METHODS = [
+    "xét tuyển thẳng theo quy chế của Bộ Giáo dục và Đào tạo",
+    "xét kết quả thi tốt nghiệp THPT",
+    "xét kết quả học tập THPT (học bạ)",
+    "xét kết quả kỳ thi đánh giá năng lực",
+    "xét tuyển kết hợp thi năng khiếu",
+]
+REGULATION_TOPICS = [
+    "đối tượng và điều kiện dự tuyển", "nguyên tắc xét tuyển", "điểm ưu tiên khu vực và đối tượng",
+    "hồ sơ và thời gian đăng ký xét tuyển", "lệ phí xét tuyển", "xác nhận nhập học",
+    "học phí và chính sách học bổng", "ký túc xá và hỗ trợ sinh viên",
+]
+QUERY_TEMPLATES = [
+    "Chỉ tiêu tuyển sinh ngành {major} năm {year}",
+    "Điểm chuẩn ngành {major} năm {year} là bao nhiêu?",
+    "Ngành {major} xét tuyển tổ hợp nào?",
+    "Mã ngành {code} là ngành gì?",
+    "Quy chế tuyển sinh năm {year} về {topic}",
+    "Thời gian nộp hồ sơ {method}",
+    "Học phí ngành {major}",
+]
+
+
+def _percentiles(values: List[float]) -> Dict:
+    import numpy as np
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(float(np.mean(values)), 3),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'max': round(float(np.max(values)), 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+# ----------------------------------------------------------------------------
+# Sinh corpus tổng hợp
+# ----------------------------------------------------------------------------
+
+def base_corpus_size(data_dir: str = BASE_DATA_DIR) -> Dict:
+    """Kích thước corpus hiện tại (số ký tự văn bản và số file) làm mốc 1x"""
+    try:
+        from document_processor import DocumentProcessor
+        processor = DocumentProcessor(data_dir)
+        filenames = processor.list_document_files()
+        chars = sum(
+            len(processor.extract_text_from_docx(os.path.join(data_dir, filename)))
+            for filename in filenames
+        )
+        if chars:
+            return {'chars': chars, 'files': len(filenames)}
+    except Exception:
+        pass
+    return {'chars': DEFAULT_BASE_CHARS, 'files': DEFAULT_BASE_FILES}
+
+
+def _quota_document(doc, rng: random.Random, year: int, majors: List):
+    doc.add_paragraph(f"CHỈ TIÊU TUYỂN SINH CÁC NGÀNH ĐẠI HỌC CHÍNH QUY NĂM {year}")
+    doc.add_paragraph(f"Tổng chỉ tiêu: {rng.randint(3000, 6000)} chỉ tiêu")
+    table = doc.add_table(rows=1, cols=6)
+    for cell, title in zip(table.rows[0].cells, ["STT", "Mã xét tuyển", "Tên ngành", "Chỉ tiêu", "Phương thức", "Tổ hợp"]):
+        cell.text = title
+    for i, (code, name) in enumerate(majors, 1):
+        cells = table.add_row().cells
+        cells[0].text = str(i)
+        cells[1].text = code
+        cells[2].text = name
+        cells[3].text = str(rng.randint(30, 300))
+        cells[4].text = ",".join(str(m) for m in sorted(rng.sample(range(1, 7), 3)))
+        cells[5].text = "\n".join(rng.sample(SUBJECT_GROUPS, 3))
+
+
+def _benchmark_document(doc, rng: random.Random, year: int, majors: List):
+    doc.add_paragraph(f"ĐIỂM TRÚNG TUYỂN CÁC NGÀNH NĂM {year - 1} VÀ {year}")
+    table = doc.add_table(rows=1, cols=5)
+    for cell, title in zip(table.rows[0].cells, ["Mã ngành", "Tên ngành", "Tổ hợp", f"Điểm {year - 1}", f"Điểm {year}"]):
+        cell.text = title
+    for code, name in majors:
+        cells = table.add_row().cells
+        cells[0].text = code
+        cells[1].text = name
+        cells[2].text = rng.choice(SUBJECT_GROUPS)
+        cells[3].text = f"{rng.uniform(15, 28):.2f}"
+        cells[4].text = f"{rng.uniform(15, 28):.2f}"
+
+
+def _regulation_document(doc, rng: random.Random, year: int, majors: List):
+    doc.add_paragraph(f"QUY CHẾ TUYỂN SINH ĐẠI HỌC CHÍNH QUY NĂM {year}")
+    for article, topic in enumerate(rng.sample(REGULATION_TOPICS, len(REGULATION_TOPICS)), 1):
+        doc.add_paragraph(f"Điều {article}. Quy định về {topic}")
+        for clause in range(1, rng.randint(3, 6)):
+            code, name = rng.choice(majors)
+            doc.add_paragraph(
+                f"{clause}. Thí sinh đăng ký ngành {name} (mã {code}) theo phương thức {rng.choice(METHODS)} "
+                f"phải đáp ứng {topic} theo quy định; hồ sơ nộp trước ngày {rng.randint(1, 28)}/"
+                f"{rng.randint(5, 8)}/{year} và được công bố công khai trên trang thông tin tuyển sinh."
+            )
+
+
+DOCUMENT_KINDS = [
+    ("Chi_tieu_tuyen_sinh", _quota_document),
+    ("Diem_chuan", _benchmark_document),
+    ("Quy_che_tuyen_sinh", _regulation_document),
+]
+
+
+def generate_corpus(out_dir: str, target_chars: int, target_files: int, seed: int = 42) -> Dict:
+    """Sinh corpus .docx tổng hợp với tổng dung lượng văn bản xấp xỉ `target_chars`"""
+    from docx import Document
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    chars_per_file = max(2000, target_chars // max(1, target_files))
+    total_chars = 0
+    files = 0
+    while total_chars < target_chars:
+        prefix, writer = DOCUMENT_KINDS[files % len(DOCUMENT_KINDS)]
+        year = rng.choice([2022, 2023, 2024, 2025])
+        doc = Document()
+        written = 0
+        while written < chars_per_file:
+            majors = rng.sample(MAJORS, rng.randint(8, len(MAJORS)))
+            writer(doc, rng, year, majors)
+            written = sum(len(p.text) for p in doc.paragraphs) + sum(
+                len(cell.text) for table in doc.tables for row in table.rows for cell in row.cells
+            )
+        doc.save(os.path.join(out_dir, f"{prefix}_{year}_{files:05d}.docx"))
+        total_chars += written
+        files += 1
+    return {'files': files, 'chars': total_chars, 'seed': seed}
+
+
+def synthetic_queries(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        code, major = rng.choice(MAJORS)
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            major=major, code=code, year=rng.choice([2023, 2024, 2025]),
+            topic=rng.choice(REGULATION_TOPICS), method=rng.choice(METHODS),
+        ))
+    return queries
+
+
+# ----------------------------------------------------------------------------
+# Đo một cỡ corpus (chạy trong process riêng)
+# ----------------------------------------------------------------------------
+
+def run_scale(args) -> Dict:
+    """Đo một corpus; Config đọc đường dẫn từ biến môi trường do process cha đặt"""
+    from chatbot import TuyenSinhBot
+    from config import Config
+    from gemini_llm import FakeLLM
+    from tracing import tracer
+    from vector_store import VectorStore
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    result: Dict = {'scale': args.run_scale, 'data_dir': Config.DATA_DIR}
+
+    # Xây dựng index từ đầu (kho embedding chunk rỗng)
+    start_time = time.perf_counter()
+    store = VectorStore()
+    result['embedding_model_load_s'] = round(time.perf_counter() - start_time, 3)
+
+    start_time = time.perf_counter()
+    store.build_vector_store(force_rebuild=True)
+    build_seconds = time.perf_counter() - start_time
+    build = store.last_build_stats
+    corpus_bytes = _dir_size(Config.DATA_DIR)
+    result['build'] = {
+        'seconds': round(build_seconds, 3),
+        'files': build.get('files', 0),
+        'chunks': build.get('chunks', 0),
+        'corpus_bytes': corpus_bytes,
+        'files_per_s': round(build.get('files', 0) / build_seconds, 2) if build_seconds else 0,
+        'chunks_per_s': round(build.get('chunks', 0) / build_seconds, 2) if build_seconds else 0,
+        'mb_per_s': round(corpus_bytes / 1e6 / build_seconds, 3) if build_seconds else 0,
+    }
+    result['index_bytes'] = _dir_size(Config.VECTOR_DB_PATH)
+    del store
+
+    # Khởi động bot như một process phục vụ mới (tải lại index đã lưu), rồi thay LLM bằng
+    # LLM giả lập; không dựng sẵn câu trả lời để luồng nền không gọi LLM trong lúc đo
+    bot = TuyenSinhBot(background_startup=False, precompute=False)
+    bot.llm, bot.llm_type = FakeLLM(first_token_ms=args.llm_first_token_ms, chunk_ms=args.llm_chunk_ms), "fake"
+    result['load_s'] = round(bot.startup_timings.get('index_ms', 0) / 1000, 3)
+    result['startup_ms'] = dict(bot.startup_timings)
+
+    # Độ trễ từng giai đoạn truy vấn: chạy đúng chat_stream, cộng thời gian các span cùng tên trong mỗi request
+    queries = synthetic_queries(args.queries + args.warmup)
+    for query in queries[:args.warmup]:
+        for _ in bot.chat_stream(query):
+            pass
+    tracer.reset()
+
+    stages: Dict[str, List[float]] = {'time_to_first_token': [], 'total': []}
+    for query in queries[args.warmup:]:
+        metrics: Dict = {}
+        for event in bot.chat_stream(query):
+            if event["type"] == "done":
+                metrics = event.get("metrics", {})
+        trace = tracer.recent_traces(1)[-1]
+        per_stage: Dict[str, float] = {}
+        for span in trace['spans']:
+            if span['name'] != 'time_to_first_token':
+                per_stage[span['name']] = per_stage.get(span['name'], 0.0) + span['duration_ms']
+        for name, value in per_stage.items():
+            stages.setdefault(name, []).append(value)
+        if metrics.get('time_to_first_token_ms') is not None:
+            stages['time_to_first_token'].append(metrics['time_to_first_token_ms'])
+        stages['total'].append(metrics.get('total_ms', trace['duration_ms']))
+
+    result['query_latency_ms'] = {name: _percentiles(values) for name, values in sorted(stages.items())}
+    result['tracing'] = tracer.get_statistics()['stages']
+    return result
+
+
+def _run_scale_subprocess(scale: int, workdir: str, base: Dict, args) -> Dict:
+    scale_dir = os.path.abspath(os.path.join(workdir, f"{scale}x"))
+    data_dir = os.path.join(scale_dir, "data")
+    marker = os.path.join(data_dir, "corpus.json")
+    if not os.path.exists(marker):
+        print(f"📄 Sinh corpus {scale}x ({base['chars'] * scale:,} ký tự)...", flush=True)
+        corpus = generate_corpus(data_dir, base['chars'] * scale, base['files'] * scale, seed=args.seed)
+        with open(marker, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f)
+    with open(marker, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    env = dict(os.environ)
+    env.update({
+        'DATA_DIR': data_dir,
+        'VECTOR_DB_PATH': os.path.join(scale_dir, "vector_db"),
+        'CHUNK_CACHE_PATH': os.path.join(scale_dir, f"chunk_embeddings_{time.time_ns()}.sqlite3"),
+        'QUERY_CACHE_PATH': "",
+        # Đo đường xử lý đầy đủ của mỗi câu hỏi: không trả lời từ cache hay bộ câu trả lời dựng sẵn
+        'TRACING_ENABLED': "true",
+        'TRACING_WINDOW': str(max(1000, args.queries)),
+        'ANSWER_CACHE_ENABLED': "false",
+        'PRECOMPUTE_ENABLED': "false",
+        'QUESTION_LOG_ENABLED': "false",
+    })
+    output_path = os.path.join(scale_dir, "result.json")
+    print(f"⏱️ Đo corpus {scale}x ({corpus['files']} file)...", flush=True)
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-scale", str(scale), "--output", output_path,
+         "--queries", str(args.queries), "--warmup", str(args.warmup),
+         "--llm-first-token-ms", str(args.llm_first_token_ms), "--llm-chunk-ms", str(args.llm_chunk_ms)],
+        env=env, check=True,
+    )
+    os.remove(env['CHUNK_CACHE_PATH'])
+    with open(output_path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    result['corpus'] = corpus
+    return result
+
+
+# ----------------------------------------------------------------------------
+# So sánh hai lần chạy
+# ----------------------------------------------------------------------------
+
+def _flatten(prefix: str, value, out: Dict):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+
+def compare_runs(old_path: str, new_path: str) -> str:
+    """Bảng so sánh các chỉ số số học giữa hai file kết quả (theo từng cỡ corpus)"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    lines = [f"{old.get('commit')} -> {new.get('commit')}",
+             f"{'metric':<52} {'old':>12} {'new':>12} {'change':>9}"]
+    old_by_scale = {str(run['scale']): run for run in old['runs']}
+    for run in new['runs']:
+        previous = old_by_scale.get(str(run['scale']))
+        if previous is None:
+            continue
+        old_metrics, new_metrics = {}, {}
+        _flatten(f"{run['scale']}x", previous, old_metrics)
+        _flatten(f"{run['scale']}x", run, new_metrics)
+        for key, value in new_metrics.items():
+            if key not in old_metrics or key.endswith(('.count', '.scale')) or '.corpus.' in key:
+                continue
+            before = old_metrics[key]
+            change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            lines.append(f"{key:<52} {before:>12.3f} {value:>12.3f} {change:>9}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hiệu năng bot tuyển sinh")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Các cỡ corpus so với dữ liệu hiện tại")
+    parser.add_argument("--workdir", default="./benchmark_work", help="Thư mục corpus và index tạm")
+    parser.add_argument("--output-dir", default="./benchmark_results")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-chunk-ms", type=float, default=20)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="So sánh hai file kết quả")
+    parser.add_argument("--run-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare_runs(*args.compare))
+        return
+
+    if args.run_scale is not None:
+        result = run_scale(args)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return
+
+    from config import Config
+
+    base = base_corpus_size()
+    report = {
+        'commit': _git_commit(),
+        'started_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'embedding_model': Config.EMBEDDING_MODEL,
+            'embedding_device': Config.EMBEDDING_DEVICE,
+            'chunk_size': Config.CHUNK_SIZE,
+            'chunk_overlap': Config.CHUNK_OVERLAP,
+            'faiss_index_type': Config.FAISS_INDEX_TYPE,
+            'ingest_batch_size': Config.INGEST_BATCH_SIZE,
+            'llm': {'first_token_ms': args.llm_first_token_ms, 'chunk_ms': args.llm_chunk_ms},
+        },
+        'base_corpus': base,
+        'runs': [],
+    }
+    for scale in args.scales:
+        report['runs'].append(_run_scale_subprocess(scale, args.workdir, base, args))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['commit'] or 'nogit'}.json"
+    )
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for run in report['runs']:
+        latency = run['query_latency_ms']
+        print(
+            f"{run['scale']:>5}x  build {run['build']['seconds']:>8.1f}s "
+            f"({run['build']['chunks_per_s']:.0f} chunks/s)  index {run['index_bytes'] / 1e6:>8.1f} MB  "
+            f"load {run['load_s']:.3f}s  search p95 {latency.get('faiss_search', {}).get('p95', 0):.2f}ms  "
+            f"TTFT p95 {latency['time_to_first_token'].get('p95', 0):.1f}ms"
+        )
+    print(f"📁 Đã ghi kết quả: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_FILE = 'bm25_postings.npz'
+VOCAB_FILE = 'bm25_vocab.json'
+
+_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt ('điểm chuẩn' -> 'diem chuan') để khớp cả khi người dùng gõ không dấu"""
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return text.replace('đ', 'd').replace('Đ', 'D')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ tiếng Việt cho BM25: âm tiết đã bỏ dấu + cặp âm tiết liền kề
+
+    Từ tiếng Việt thường gồm nhiều âm tiết ('điểm chuẩn', 'tuyển sinh') nên
+    bigram âm tiết giúp khớp cụm từ chính xác hơn; mã ngành và năm (7480201,
+    2025) được giữ nguyên dạng token.
+    """
+    syllables = _TOKEN_PATTERN.findall(fold_diacritics(unicodedata.normalize('NFC', text)).lower())
+    bigrams = [f"{first}_{second}" for first, second in zip(syllables, syllables[1:])]
+    return syllables + bigrams
+
+
+class BM25Index:
+    """Chỉ mục ngược BM25 dạng CSR (numpy) trên các chunk, vị trí doc trùng vị trí trong FAISS index"""
+
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray,
+                 k1: float = Config.BM25_K1, b: float = Config.BM25_B):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lengths)
+        self.avg_doc_length = float(doc_lengths.mean()) if self.n_docs else 0.0
+        doc_freqs = np.diff(indptr).astype(np.float32)
+        self.idf = np.log(1.0 + (self.n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = Config.BM25_K1, b: float = Config.BM25_B) -> "BM25Index":
+        """Xây dựng chỉ mục từ luồng văn bản chunk (theo thứ tự vị trí trong index)"""
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_lengths = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_id = vocab.get(token)
+                if term_id is None:
+                    term_id = vocab[token] = len(postings)
+                    postings.append([])
+                postings[term_id].append((doc_id, count))
+
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        for term_id, term_postings in enumerate(postings):
+            indptr[term_id + 1] = indptr[term_id] + len(term_postings)
+        doc_ids = np.fromiter(
+            (doc_id for term_postings in postings for doc_id, _ in term_postings),
+            dtype=np.int32, count=int(indptr[-1]),
+        )
+        term_freqs = np.fromiter(
+            (count for term_postings in postings for _, count in term_postings),
+            dtype=np.float32, count=int(indptr[-1]),
+        )
+        logger.info(f"🔤 Đã xây dựng BM25: {len(doc_lengths)} chunks, {len(vocab)} term")
+        return cls(vocab, indptr, doc_ids, term_freqs, np.asarray(doc_lengths, dtype=np.float32), k1, b)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """Điểm BM25 của mọi chunk cho truy vấn (cao hơn = liên quan hơn)"""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        if not self.n_docs:
+            return scores
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + length_norm[docs])
+        return scores
+
+    def search(self, query: str, k: int = 5, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top k (vị trí chunk, điểm BM25), bỏ qua các chunk không khớp term nào
+
+        `mask` (bool theo chunk) giới hạn tập ứng viên, ví dụ theo bộ lọc metadata.
+        """
+        scores = self.get_scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(position), float(scores[position])) for position in top if scores[position] > 0]
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        postings_path = os.path.join(path, POSTINGS_FILE)
+        with open(f"{postings_path}.tmp", 'wb') as f:
+            np.savez(f, indptr=self.indptr, doc_ids=self.doc_ids,
+                     term_freqs=self.term_freqs, doc_lengths=self.doc_lengths)
+        os.replace(f"{postings_path}.tmp", postings_path)
+
+        vocab_path = os.path.join(path, VOCAB_FILE)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(f"{vocab_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'n_docs': self.n_docs, 'terms': terms}, f, ensure_ascii=False)
+        os.replace(f"{vocab_path}.tmp", vocab_path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Tải chỉ mục đã lưu; trả về None nếu chưa có hoặc postings và vocab không cùng một lần xây dựng"""
+        postings_path = os.path.join(path, POSTINGS_FILE)
+        vocab_path = os.path.join(path, VOCAB_FILE)
+        if not (os.path.exists(postings_path) and os.path.exists(vocab_path)):
+            return None
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with np.load(postings_path) as data:
+            n_docs = meta.get('n_docs')
+            if n_docs is not None and n_docs != len(data['doc_lengths']):
+                logger.warning(f"Chỉ mục BM25 tại {path} không nhất quán ({n_docs} != {len(data['doc_lengths'])} chunks)")
+                return None
+            return cls(
+                {term: i for i, term in enumerate(meta['terms'])},
+                data['indptr'], data['doc_ids'], data['term_freqs'], data['doc_lengths'],
+                k1=meta.get('k1', Config.BM25_K1), b=meta.get('b', Config.BM25_B),
+            )
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[int, float]]], k: int,
+                           rrf_k: int = Config.RRF_K) -> List[Tuple[int, float]]:
+    """Gộp nhiều danh sách xếp hạng bằng Reciprocal Rank Fusion
+
+    Trả về top k (vị trí, điểm RRF) với điểm cao hơn = tốt hơn. Một vị trí
+    xuất hiện nhiều lần trong cùng danh sách chỉ được tính ở hạng tốt nhất.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        seen = set()
+        rank = 0
+        for position, _ in ranking:
+            if position in seen:
+                continue
+            seen.add(position)
+            rank += 1
+            fused[position] = fused.get(position, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,125 @@
+import json
+import logging
+from typing import Dict, Iterator, List, Optional
+from urllib import error, request
+
+logger = logging.getLogger(__name__)
+
+
+class ChatClient:
+    """Client HTTP mỏng cho chat_server, cùng giao diện với các hàm bot mà app.py dùng"""
+
+    def __init__(self, base_url: str, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        req = request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"} if data is not None else {},
+        )
+        return request.urlopen(req, timeout=self.timeout)
+
+    def _json(self, method: str, path: str, payload: Optional[Dict] = None, degraded=None):
+        """Gọi API JSON; nếu không kết nối được server (hoặc server trả nội dung không phải JSON)
+        thì ghi log và trả về `degraded` để giao diện vẫn hiển thị được"""
+        try:
+            with self._request(method, path, payload) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except error.HTTPError as e:
+            # /health trả 503 khi chưa sẵn sàng nhưng vẫn có nội dung JSON
+            try:
+                return json.loads(e.read().decode('utf-8'))
+            except ValueError:
+                logger.warning(f"Chat server trả lỗi {e.code} cho {path}")
+                return degraded
+        except (error.URLError, OSError, ValueError) as e:
+            logger.error(f"Không kết nối được chat server ({path}): {e}")
+            return degraded
+
+    @staticmethod
+    def _unreachable_status(reason: str) -> Dict:
+        return {"state": "unreachable", "ready": False, "retrieval_ready": False, "error": reason}
+
+    def chat_stream(self, user_message: str, use_query_expansion: bool = True,
+                    session_id: Optional[str] = None) -> Iterator[Dict]:
+        """Nhận các sự kiện context/token/done (NDJSON) từ server ngay khi được sinh ra"""
+        payload = {
+            "message": user_message,
+            "session_id": session_id,
+            "use_query_expansion": use_query_expansion,
+            "stream": True,
+        }
+        try:
+            with self._request("POST", "/chat", payload) as response:
+                for line in response:
+                    if line.strip():
+                        yield json.loads(line.decode('utf-8'))
+        except error.HTTPError as e:
+            detail = e.read().decode('utf-8', errors='replace')
+            logger.warning(f"Chat server trả lỗi {e.code}: {detail}")
+            busy = e.code == 503
+            yield {
+                "type": "done",
+                "response": "⏳ Hệ thống đang quá tải, vui lòng thử lại sau giây lát."
+                if busy else "Xin lỗi, có lỗi xảy ra. Vui lòng thử lại sau.",
+                "context_used": "",
+                "success": False,
+                "error": "busy" if busy else detail,
+            }
+        except (error.URLError, OSError) as e:
+            logger.error(f"Không kết nối được chat server: {e}")
+            yield {
+                "type": "done",
+                "response": "Xin lỗi, không kết nối được máy chủ. Vui lòng thử lại sau.",
+                "context_used": "",
+                "success": False,
+                "error": "unreachable",
+            }
+
+    def chat(self, user_message: str, use_query_expansion: bool = True,
+             session_id: Optional[str] = None) -> Dict:
+        return self._json("POST", "/chat", {
+            "message": user_message,
+            "session_id": session_id,
+            "use_query_expansion": use_query_expansion,
+        }, degraded={
+            "response": "Xin lỗi, không kết nối được máy chủ. Vui lòng thử lại sau.",
+            "context_used": "",
+            "success": False,
+            "error": "unreachable",
+        })
+
+    def get_readiness(self) -> Dict:
+        return self._json("GET", "/health", degraded=self._unreachable_status(
+            f"Không kết nối được chat server {self.base_url}"
+        ))
+
+    def get_statistics(self) -> Dict:
+        """Thống kê từ server; khi mất kết nối trả về bộ số liệu rỗng cùng cấu trúc"""
+        return self._json("GET", "/stats", degraded={
+            "vector_store": {"status": "unreachable"},
+            "startup": self._unreachable_status(f"Không kết nối được chat server {self.base_url}"),
+            "llm_available": False,
+            "latency": {"responses": 0, "ttft_ms_avg": 0, "ttft_ms_p50": 0, "ttft_ms_p95": 0},
+            "server": {"workers": 0, "running": 0, "waiting": 0},
+            "tracing": {"enabled": False, "stages": {}},
+        })
+
+    def suggest_questions(self) -> List[str]:
+        return self._json("GET", "/suggestions", degraded=[])
+
+    def get_conversation_history(self, session_id: str) -> List[Dict]:
+        return self._json("GET", f"/sessions/{session_id}/history", degraded={"history": []})["history"]
+
+    def clear_history(self, session_id: str):
+        self._json("DELETE", f"/sessions/{session_id}")
+
+    def export_traces(self) -> str:
+        try:
+            with self._request("GET", "/traces") as response:
+                return response.read().decode('utf-8')
+        except (error.URLError, OSError) as e:
+            logger.error(f"Không kết nối được chat server (/traces): {e}")
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Chat server HTTP nhiều người dùng cho bot tuyển sinh.
+
+Một bot (model embedding, index FAISS/BM25 chỉ đọc) được dùng chung cho mọi
+request; lịch sử hội thoại tách theo `session_id`. Số pipeline chạy đồng thời
+bị giới hạn bởi CHAT_WORKERS, tối đa CHAT_MAX_QUEUE request được chờ, vượt
+quá thì trả 503 kèm Retry-After.
+
+API:
+    POST   /chat                    {"message", "session_id"?, "use_query_expansion"?, "stream"?}
+    GET    /sessions/<id>/history
+    DELETE /sessions/<id>
+    GET    /health | /stats | /suggestions | /traces
+
+Chạy: python chat_server.py --port 8000 --workers 4
+Pre-fork (một process mỗi nhân CPU, dùng chung model/index): python chat_server.py --processes 0
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import faiss
+from config import Config
+from chatbot import TuyenSinhBot
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def process_memory() -> Dict:
+    """Bộ nhớ của process hiện tại (MB, đọc /proc trên Linux).
+
+    `pss_mb` chia đều các trang dùng chung (model, index) cho các process cùng
+    dùng, `private_mb` là phần riêng của process.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {
+                parts[0].rstrip(":"): int(parts[1])
+                for parts in (line.split() for line in f) if parts[-1] == "kB"
+            }
+    except OSError:
+        return {"pid": os.getpid()}
+    return {
+        "pid": os.getpid(),
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+class ServerBusyError(Exception):
+    """Hàng đợi đã đầy hoặc request chờ quá lâu"""
+
+
+class ChatService:
+    """Bot dùng chung + giới hạn số pipeline chạy đồng thời và hàng đợi có hạn (admission control)"""
+
+    def __init__(
+        self,
+        bot: Optional[TuyenSinhBot] = None,
+        workers: int = Config.CHAT_WORKERS,
+        max_queue: int = Config.CHAT_MAX_QUEUE,
+        queue_timeout_seconds: float = Config.CHAT_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.bot = bot or TuyenSinhBot(background_startup=True)
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._stats = {
+            'accepted': 0,
+            'rejected': 0,
+            'queue_timeouts': 0,
+            'completed': 0,
+            'max_waiting': 0,
+            'wait_time_total': 0.0,
+        }
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Giữ một worker slot; báo ServerBusyError nếu hàng đợi đầy hoặc chờ quá lâu"""
+        with self._lock:
+            if self._running >= self.workers and self._waiting >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise ServerBusyError(f"Hàng đợi đã đầy ({self._waiting} request đang chờ)")
+            self._waiting += 1
+            self._stats['max_waiting'] = max(self._stats['max_waiting'], self._waiting)
+
+        start_time = time.perf_counter()
+        timeout = self.queue_timeout_seconds if self.queue_timeout_seconds > 0 else None
+        acquired = self._slots.acquire(timeout=timeout)
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._stats['queue_timeouts'] += 1
+                raise ServerBusyError(f"Request chờ quá {self.queue_timeout_seconds:.0f}s")
+            self._running += 1
+            self._stats['accepted'] += 1
+            self._stats['wait_time_total'] += time.perf_counter() - start_time
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats['completed'] += 1
+            self._slots.release()
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            waiting, running = self._waiting, self._running
+        wait_total = stats.pop('wait_time_total')
+        return {
+            **stats,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'running': running,
+            'waiting': waiting,
+            'avg_wait_ms': round(wait_total / stats['accepted'] * 1000, 2) if stats['accepted'] else 0,
+        }
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    server_version = "TuyenSinhChat/1.0"
+
+    @property
+    def service(self) -> ChatService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, data, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        data = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError("Body phải là một JSON object")
+        return data
+
+    def _session_path(self, path: str) -> Optional[str]:
+        parts = path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "sessions" and parts[1]:
+            return parts[1]
+        return None
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        bot = self.service.bot
+        if path == "/health":
+            readiness = bot.get_readiness()
+            self._send_json(200 if readiness["retrieval_ready"] else 503, readiness)
+        elif path == "/stats":
+            self._send_json(200, {
+                **bot.get_statistics(),
+                "server": self.service.get_statistics(),
+                "process": process_memory(),
+            })
+        elif path == "/suggestions":
+            self._send_json(200, bot.suggest_questions())
+        elif path == "/traces":
+            body = tracer.export_json().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path.endswith("/history") and self._session_path(path):
+            session_id = self._session_path(path)
+            self._send_json(200, {"session_id": session_id, "history": bot.get_conversation_history(session_id)})
+        else:
+            self._send_json(404, {"error": "not_found"})
+
+    def do_DELETE(self):
+        session_id = self._session_path(urlparse(self.path).path)
+        if session_id is None:
+            self._send_json(404, {"error": "not_found"})
+            return
+        self.service.bot.clear_history(session_id)
+        self._send_json(200, {"session_id": session_id, "cleared": True})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/chat":
+            self._send_json(404, {"error": "not_found"})
+            return
+        try:
+            payload = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"JSON không hợp lệ: {e}"})
+            return
+        message = str(payload.get("message") or "").strip()
+        if not message:
+            self._send_json(400, {"error": "Thiếu 'message'"})
+            return
+        session_id = str(payload.get("session_id") or uuid.uuid4().hex)
+        use_query_expansion = bool(payload.get("use_query_expansion", True))
+
+        try:
+            with self.service.admit():
+                events = self.service.bot.chat_stream(
+                    message, use_query_expansion=use_query_expansion, session_id=session_id
+                )
+                if payload.get("stream"):
+                    self._stream_events(events, session_id)
+                else:
+                    result = {}
+                    for event in events:
+                        if event["type"] == "done":
+                            result = {key: value for key, value in event.items() if key != "type"}
+                    self._send_json(200, {**result, "session_id": session_id})
+        except ServerBusyError as e:
+            logger.warning(f"🚦 Từ chối request: {e}")
+            self._send_json(
+                503, {"error": "busy", "detail": str(e)},
+                headers={"Retry-After": str(max(1, int(Config.CHAT_QUEUE_TIMEOUT_SECONDS // 10)))},
+            )
+
+    def _stream_events(self, events: Iterator[Dict], session_id: str):
+        """Gửi từng sự kiện của chat_stream thành một dòng JSON (NDJSON) ngay khi có"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event in events:
+                if event["type"] == "done":
+                    event = {**event, "session_id": session_id}
+                line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+                self.wfile.write(line.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("🔌 Client đã ngắt kết nối khi đang stream")
+        finally:
+            events.close()
+
+
+def create_server(service: Optional[ChatService], host: str = Config.CHAT_SERVER_HOST,
+                  port: int = Config.CHAT_SERVER_PORT) -> ThreadingHTTPServer:
+    """Tạo HTTP server (mỗi kết nối một luồng; giới hạn đồng thời nằm ở ChatService)"""
+    server = ThreadingHTTPServer((host, port), ChatRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def start_background_server(service: Optional[ChatService] = None, host: str = "127.0.0.1",
+                            port: int = 0) -> ThreadingHTTPServer:
+    """Chạy server trong luồng nền (port=0: chọn port trống), dùng khi Streamlit không có server riêng"""
+    server = create_server(service or ChatService(), host, port)
+    threading.Thread(target=server.serve_forever, name="chat-server", daemon=True).start()
+    logger.info(f"🌐 Chat server chạy nền tại http://{server.server_address[0]}:{server.server_address[1]}")
+    return server
+
+
+def _limit_cpu_threads(threads: int):
+    """Mỗi worker pre-fork chỉ dùng `threads` luồng tính toán để các worker không tranh nhau CPU"""
+    if threads <= 0:
+        return
+    faiss.omp_set_num_threads(threads)
+    # Chỉ chỉnh torch khi model đã được tải (import torch trong từng worker sẽ tốn thêm bộ nhớ riêng)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _run_prefork_worker(server: ThreadingHTTPServer, bot: TuyenSinhBot, workers: int, max_queue: int, slot: int):
+    """Vòng phục vụ của process con; không bao giờ trả về"""
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Ctrl+C gửi tới cả nhóm process: chỉ process cha xử lý rồi dừng các worker
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _limit_cpu_threads(Config.PREFORK_THREADS_PER_PROCESS)
+        server.service = ChatService(bot, workers=workers, max_queue=max_queue)
+        logger.info(f"👷 Worker {slot} (pid {os.getpid()}) sẵn sàng")
+        server.serve_forever()
+    except Exception as e:
+        logger.error(f"❌ Worker {slot} dừng do lỗi: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _run_precompute_process(server: ThreadingHTTPServer, bot: TuyenSinhBot):
+    """Process con dựng lại câu trả lời dựng sẵn (các worker đọc lại file khi xong); không bao giờ trả về"""
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.socket.close()
+        bot.precompute_answers()
+    except Exception as e:
+        logger.error(f"❌ Lỗi khi dựng sẵn câu trả lời: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve_prefork(processes: int, host: str = Config.CHAT_SERVER_HOST, port: int = Config.CHAT_SERVER_PORT,
+                  workers: int = Config.CHAT_WORKERS, max_queue: int = Config.CHAT_MAX_QUEUE):
+    """Pre-fork: process cha tải model và index một lần rồi fork `processes` worker.
+
+    Các worker dùng chung trang bộ nhớ của model (copy-on-write) và index
+    (memory-map chỉ đọc), cùng nhận kết nối trên một socket nên kernel tự phân
+    phối request. Worker chết bất thường sẽ được khởi động lại. Câu trả lời
+    dựng sẵn (nếu đã cũ) được dựng lại trong một process con riêng, để process
+    cha không có luồng nào chạy khi fork lại worker.
+    """
+    bot = TuyenSinhBot(background_startup=False, precompute=False)
+    server = create_server(None, host, port)
+    # Các worker cùng chờ accept trên một socket: worker không giành được kết nối thì bỏ qua
+    server.socket.setblocking(False)
+    # Đưa các object đã tải vào thế hệ "đóng băng" để GC không ghi vào trang dùng chung
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            _run_prefork_worker(server, bot, workers, max_queue, slot)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children) + ([precompute_pid] if precompute_pid else []):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for slot in range(processes):
+        spawn(slot)
+    precompute_pid = None
+    if Config.PRECOMPUTE_ENABLED and bot.llm and not bot.precomputed.is_fresh(bot.vector_store.index_version):
+        precompute_pid = os.fork()
+        if precompute_pid == 0:
+            _run_precompute_process(server, bot)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(
+        f"🌐 Chat server pre-fork: http://{host}:{server.server_address[1]} "
+        f"({processes} process x {workers} workers, parent {process_memory()})"
+    )
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid == precompute_pid:
+            precompute_pid = None
+            continue
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        logger.warning(f"⚠️ Worker {slot} (pid {pid}) đã dừng (status {status}), khởi động lại")
+        time.sleep(1)
+        spawn(slot)
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat server HTTP cho bot tuyển sinh")
+    parser.add_argument("--host", default=Config.CHAT_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=Config.CHAT_SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=Config.CHAT_WORKERS,
+                        help="số câu hỏi được xử lý đồng thời")
+    parser.add_argument("--max-queue", type=int, default=Config.CHAT_MAX_QUEUE,
+                        help="số câu hỏi được chờ khi mọi worker đều bận")
+    parser.add_argument("--processes", type=int, default=Config.CHAT_PROCESSES,
+                        help="số process pre-fork (0 = số nhân CPU, 1 = một process)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    processes = args.processes if args.processes > 0 else (os.cpu_count() or 1)
+    if processes > 1:
+        serve_prefork(processes, args.host, args.port, workers=args.workers, max_queue=args.max_queue)
+        return
+    service = ChatService(workers=args.workers, max_queue=args.max_queue)
+    server = create_server(service, args.host, args.port)
+    logger.info(f"🌐 Chat server: http://{args.host}:{args.port} ({service.workers} workers, hàng đợi {service.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,115 @@
 import logging
-from typing import List, Dict, Optional
-from langchain.schema import HumanMessage, SystemMessage
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+import numpy as np
 from langchain.prompts import ChatPromptTemplate
 from config import Config
-from vector_store import VectorStore
-from gemini_llm import GeminiLLM
+from vector_store import VectorStore, run_cpu_bound
+from gemini_llm import FakeLLM, GeminiLLM
+from llm_scheduler import PRIORITY_BACKGROUND
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
+from precomputed_answers import PrecomputedAnswers, get_question_log, question_key
+from session_store import SessionStore
+from tracing import tracer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Các trạng thái khởi động: chỉ trả lời (chỉ tìm kiếm) từ 'retrieval_ready', đầy đủ ở 'ready'
+STARTUP_STATES = [
+    "starting", "loading_models", "loading_index", "retrieval_ready",
+    "loading_llm", "warming_up", "ready", "failed",
+]
+
+
+class _Turn:
+    """Trạng thái của một lượt trả lời: các đoạn đã sinh và số đo độ trễ"""
+
+    def __init__(self, bot: "TuyenSinhBot", session_id: Optional[str]):
+        self.bot = bot
+        self.session_id = session_id
+        self.start_time = time.perf_counter()
+        self.metrics: Dict = {"retrieval_ms": 0.0, "time_to_first_token_ms": None}
+        self.parts: List[str] = []
+
+    @property
+    def response(self) -> str:
+        return "".join(self.parts)
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.start_time) * 1000, 2)
+
+    def retrieved(self, context_stats: Dict):
+        self.metrics["retrieval_ms"] = self._elapsed_ms()
+        self.metrics["context_tokens"] = context_stats.get("packed_tokens", 0)
+        self.metrics["tokens_saved"] = context_stats.get("tokens_saved", 0)
+
+    def token(self, text: str) -> Dict:
+        if self.metrics["time_to_first_token_ms"] is None:
+            self.metrics["time_to_first_token_ms"] = self._elapsed_ms()
+            tracer.record("time_to_first_token", self.metrics["time_to_first_token_ms"])
+        self.parts.append(text)
+        return {"type": "token", "text": text}
+
+    def generation_error(self, error: Exception, context: str) -> str:
+        """Đoạn văn bản gửi tiếp khi LLM lỗi giữa chừng (hoặc câu trả lời dự phòng nếu chưa có gì)"""
+        logger.error(f"Lỗi khi tạo câu trả lời: {str(error)}")
+        if self.parts:
+            return "\n\n(Xin lỗi, câu trả lời bị gián đoạn do có lỗi xảy ra. Vui lòng thử lại.)"
+        return self.bot._error_response(context)
+
+    def done(self, context: str, cached: bool) -> Dict:
+        response = self.response
+        self.metrics["total_ms"] = self._elapsed_ms()
+        self.bot.response_metrics.append(dict(self.metrics, cached=cached))
+        logger.info(
+            f"🤖 Bot trả lời ({'cache' if cached else self.bot.llm_type or 'no-llm'}, "
+            f"TTFT {self.metrics['time_to_first_token_ms']}ms): {response[:200]}..."
+        )
+        self.bot._remember("assistant", response, self.session_id)
+        return {
+            "type": "done",
+            "response": response,
+            "context_used": context,
+            "success": True,
+            "cached": cached,
+            "metrics": self.metrics,
+        }
+
+
 class TuyenSinhBot:
-    def __init__(self):
-        self.vector_store = VectorStore()
+    def __init__(self, background_startup: Optional[bool] = None, precompute: Optional[bool] = None):
+        """`background_startup=True`: tải model, index và warm-up trong luồng nền,
+        constructor trả về ngay; dùng `get_readiness()` để theo dõi trạng thái.
+        `precompute=True`: khi sẵn sàng, dựng lại câu trả lời dựng sẵn trong nền nếu index đã thay đổi."""
+        self.vector_store: Optional[VectorStore] = None
         self.llm = None
+        self.llm_type = None
         self.conversation_history = []
-        if getattr(Config, "GEMINI_API_KEY", None):
-            self.llm = GeminiLLM()
-            self.llm_type = "gemini"
-            logger.info("✅ Gemini API key đã được cấu hình thành công!")
-        else:
-            self.llm_type = None
-            logger.warning(
-                "Không có Gemini API key. Bot sẽ chỉ sử dụng tìm kiếm vector."
-            )
-        self.vector_store.build_vector_store()
+        # Lịch sử theo phiên khi phục vụ nhiều người dùng (chat_server); không có session_id thì dùng conversation_history
+        self.sessions = SessionStore()
+        self.answer_cache = SemanticAnswerCache() if Config.ANSWER_CACHE_ENABLED else None
+        self.context_packer = ContextPacker()
+        # Câu trả lời dựng sẵn cho câu hỏi gợi ý + câu hỏi hay gặp nhất (gắn với phiên bản index)
+        self.precomputed = PrecomputedAnswers()
+        self.question_log = get_question_log()
+        self._auto_precompute = Config.PRECOMPUTE_ENABLED if precompute is None else precompute
+        self._precompute_thread: Optional[threading.Thread] = None
+        self._precompute_lock = threading.Lock()
+        # Độ trễ các câu trả lời gần nhất (time-to-first-token là chỉ số chính)
+        self.response_metrics = deque(maxlen=500)
+
+        self.state = "starting"
+        self.startup_error: Optional[str] = None
+        self.startup_timings: Dict[str, float] = {}
+        self._retrieval_ready = threading.Event()
+        self._finished = threading.Event()
+
         self.prompt_template = ChatPromptTemplate.from_messages(
             [
                 ("system", Config.SYSTEM_PROMPT),
@@ -35,23 +120,189 @@ class TuyenSinhBot:
             ]
         )
 
-    def get_relevant_context(self, question: str, k: int = 5, use_query_expansion: bool = True) -> str:
-        results = self.vector_store.search(question, k=k, use_query_expansion=use_query_expansion)
-        if not results:
-            return "Không tìm thấy thông tin liên quan trong cơ sở dữ liệu."
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            context_parts.append(
-                f"Thông tin {i} (từ {result['source']}):\n{result['content']}"
+        if background_startup is None:
+            background_startup = Config.BACKGROUND_STARTUP
+        if background_startup:
+            threading.Thread(target=self._startup, name="bot-startup", daemon=True).start()
+        else:
+            self._startup()
+            if self.state == "failed":
+                raise RuntimeError(self.startup_error)
+
+    @contextmanager
+    def _phase(self, state: str, name: str):
+        """Chuyển sang trạng thái `state` và đo thời gian của giai đoạn khởi động `name`"""
+        self.state = state
+        start_time = time.perf_counter()
+        yield
+        self.startup_timings[f"{name}_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+        logger.info(f"⏱️ Khởi động - {name}: {self.startup_timings[f'{name}_ms']:.0f}ms")
+
+    def _startup(self):
+        """Khởi động lạnh: embedding model -> index (phục vụ tìm kiếm được ngay) -> LLM -> warm-up"""
+        start_time = time.perf_counter()
+        try:
+            with self._phase("loading_models", "embedding_model"):
+                self.vector_store = VectorStore()
+            with self._phase("loading_index", "index"):
+                self.vector_store.build_vector_store()
+            self.state = "retrieval_ready"
+            self._retrieval_ready.set()
+
+            with self._phase("loading_llm", "llm"):
+                self._init_llm()
+            with self._phase("warming_up", "warm_up"):
+                # Chạm vào cache embedding, trang memory-map của index và BM25 trước request đầu tiên
+                self.vector_store.search(Config.WARMUP_QUERY, k=3)
+            self.state = "ready"
+            if self._auto_precompute:
+                self.start_precompute()
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi khởi động bot: {str(e)}")
+            self.startup_error = str(e)
+            self.state = "failed"
+        finally:
+            self.startup_timings["total_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+            self._finished.set()
+
+    def _init_llm(self):
+        if Config.FAKE_LLM:
+            self.llm = FakeLLM()
+            self.llm_type = "fake"
+            logger.info("🧪 Đang dùng LLM giả lập (FAKE_LLM=true)")
+        elif getattr(Config, "GEMINI_API_KEY", None):
+            self.llm = GeminiLLM()
+            self.llm_type = "gemini"
+            logger.info("✅ Gemini API key đã được cấu hình thành công!")
+        else:
+            self.llm_type = None
+            logger.warning(
+                "Không có Gemini API key. Bot sẽ chỉ sử dụng tìm kiếm vector."
             )
-        return "\n\n".join(context_parts)
 
-    def generate_response(self, question: str, context: str) -> str:
+    def _precompute_questions(self) -> List[str]:
+        """Câu hỏi gợi ý rồi đến PRECOMPUTE_TOP_N câu hỏi hay gặp nhất trong nhật ký (bỏ trùng)"""
+        questions, seen = [], set()
+        for question in self.suggest_questions() + self.question_log.top(Config.PRECOMPUTE_TOP_N):
+            key = question_key(question)
+            if key and key not in seen:
+                seen.add(key)
+                questions.append(question)
+        return questions
+
+    def precompute_answers(self, force: bool = False) -> Dict:
+        """Dựng sẵn câu trả lời cho câu hỏi gợi ý và câu hỏi hay gặp nhất.
+
+        Tìm kiếm một lô, gọi LLM với ưu tiên thấp (không chen trước câu hỏi của
+        người dùng) rồi lưu cạnh index. Bỏ qua nếu bộ hiện có vẫn khớp index.
+        """
+        index_version = self.vector_store.index_version
+        if not force and self.precomputed.is_fresh(index_version):
+            return {"status": "fresh", **self.precomputed.get_statistics()}
         if not self.llm:
-            return f"Thông tin tìm được:\n\n{context}\n\nLưu ý: Để có câu trả lời chi tiết hơn, vui lòng cung cấp Gemini API key."
+            logger.warning("Không có LLM, bỏ qua dựng sẵn câu trả lời")
+            return {"status": "skipped", "reason": "no_llm"}
+
+        start_time = time.perf_counter()
+        questions = self._precompute_questions()
+        answers: Dict[str, Dict] = {}
+        failed = 0
+        for question, results in zip(questions, self.vector_store.search_batch(questions, k=5)):
+            context, _ = self._pack_context(results)
+            try:
+                response = self.llm.generate(self._build_prompt(question, context), priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.warning(f"Không dựng sẵn được câu trả lời cho '{question}': {e}")
+                failed += 1
+                continue
+            answers[question_key(question)] = {"question": question, "response": response, "context_used": context}
+        self.precomputed.save(answers, index_version, self.llm_type)
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"📌 Đã dựng sẵn {len(answers)}/{len(questions)} câu trả lời ({elapsed:.1f}s)")
+        return {
+            "status": "built",
+            "answers": len(answers),
+            "failed": failed,
+            "index_version": index_version,
+            "elapsed_s": round(elapsed, 2),
+        }
+
+    def start_precompute(self) -> bool:
+        """Dựng lại câu trả lời dựng sẵn trong luồng nền nếu đã cũ; trả về True nếu đã bắt đầu"""
+        if not self.llm or self.vector_store is None:
+            return False
+        with self._precompute_lock:
+            if self._precompute_thread is not None and self._precompute_thread.is_alive():
+                return False
+            if self.precomputed.is_fresh(self.vector_store.index_version):
+                return False
+            self._precompute_thread = threading.Thread(
+                target=self._run_precompute, name="bot-precompute", daemon=True
+            )
+            self._precompute_thread.start()
+        return True
+
+    def _run_precompute(self):
         try:
-            # Tạo prompt hoàn chỉnh bao gồm system prompt và câu hỏi
-            full_prompt = f"""{Config.SYSTEM_PROMPT}
+            self.precompute_answers()
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi dựng sẵn câu trả lời: {str(e)}")
+
+    def is_ready(self, retrieval_only: bool = False) -> bool:
+        return self._retrieval_ready.is_set() if retrieval_only else self.state == "ready"
+
+    def wait_until_ready(self, timeout: Optional[float] = None, retrieval_only: bool = False) -> bool:
+        """Chờ đến khi bot sẵn sàng (hoặc khởi động thất bại); trả về trạng thái sẵn sàng"""
+        if retrieval_only:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._retrieval_ready.is_set() and not self._finished.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._retrieval_ready.wait(0.05 if remaining is None else min(0.05, remaining))
+        else:
+            self._finished.wait(timeout)
+        return self.is_ready(retrieval_only)
+
+    def get_readiness(self) -> Dict:
+        return {
+            "state": self.state,
+            "retrieval_ready": self._retrieval_ready.is_set(),
+            "ready": self.state == "ready",
+            "error": self.startup_error,
+            "timings_ms": dict(self.startup_timings),
+        }
+
+    def get_relevant_context(self, question: str, k: int = 5, use_query_expansion: bool = True) -> str:
+        return self._build_context(question, k=k, use_query_expansion=use_query_expansion)[0]
+
+    def _build_context(self, question: str, k: int = 5, use_query_expansion: bool = True) -> Tuple[str, Dict]:
+        """Tìm kiếm rồi đóng gói context (loại trùng, nối chunk liền kề, giới hạn token)"""
+        with tracer.span("retrieval"):
+            results = self.vector_store.search(question, k=k, use_query_expansion=use_query_expansion)
+        return self._pack_context(results)
+
+    async def _abuild_context(self, question: str, k: int = 5, use_query_expansion: bool = True) -> Tuple[str, Dict]:
+        with tracer.span("retrieval"):
+            results = await self.vector_store.asearch(question, k=k, use_query_expansion=use_query_expansion)
+        return self._pack_context(results)
+
+    def _pack_context(self, results) -> Tuple[str, Dict]:
+        if not results:
+            return "Không tìm thấy thông tin liên quan trong cơ sở dữ liệu.", {}
+        with tracer.span("context_packing"):
+            packed = self.context_packer.pack(results)
+        stats = packed["stats"]
+        logger.info(
+            f"📦 Context: {stats['chunks_in']} chunks -> {stats['blocks']} khối, "
+            f"{stats['packed_tokens']} token (tiết kiệm {stats['tokens_saved']})"
+        )
+        return packed["context"], stats
+
+    def _build_prompt(self, question: str, context: str) -> str:
+        # Tạo prompt hoàn chỉnh bao gồm system prompt và câu hỏi
+        return f"""{Config.SYSTEM_PROMPT}
 
 Dựa trên thông tin sau đây, hãy trả lời câu hỏi của người dùng một cách chính xác và hữu ích:
 
@@ -63,49 +314,267 @@ Câu hỏi: {question}
 Lưu ý: Nếu thông tin không đủ để trả lời chính xác, hãy nói rõ rằng bạn không có đủ thông tin và đề xuất người dùng liên hệ trực tiếp với trường để biết thêm chi tiết.
 
 Trả lời bằng tiếng Việt:"""
-            
+
+    def _llm_pending(self) -> bool:
+        """LLM đã được cấu hình nhưng bot chưa khởi động xong (đang tải hoặc warm-up)"""
+        return not self._finished.is_set() and bool(Config.FAKE_LLM or getattr(Config, "GEMINI_API_KEY", None))
+
+    def _fallback_response(self, context: str) -> str:
+        if self._llm_pending():
+            return (
+                f"Thông tin tìm được:\n\n{context}\n\n"
+                "Lưu ý: Mô hình ngôn ngữ đang khởi động, đây là kết quả tìm kiếm. "
+                "Vui lòng hỏi lại sau ít giây để nhận câu trả lời đầy đủ."
+            )
+        return f"Thông tin tìm được:\n\n{context}\n\nLưu ý: Để có câu trả lời chi tiết hơn, vui lòng cung cấp Gemini API key."
+
+    def _error_response(self, context: str) -> str:
+        return f"Xin lỗi, có lỗi xảy ra khi xử lý câu hỏi. Thông tin tìm được:\n\n{context}"
+
+    def generate_response(self, question: str, context: str) -> str:
+        if not self.llm:
+            return self._fallback_response(context)
+        try:
+            full_prompt = self._build_prompt(question, context)
             logger.info(f"📝 Prompt gửi đến Gemini: {full_prompt[:200]}...")
             return self.llm.generate(full_prompt)
         except Exception as e:
             logger.error(f"Lỗi khi tạo câu trả lời: {str(e)}")
-            return f"Xin lỗi, có lỗi xảy ra khi xử lý câu hỏi. Thông tin tìm được:\n\n{context}"
+            return self._error_response(context)
+
+    def _remember(self, role: str, content: str, session_id: Optional[str] = None):
+        if session_id is not None:
+            self.sessions.append(session_id, role, content)
+            return
+        self.conversation_history.append({"role": role, "content": content})
+        if len(self.conversation_history) > Config.MAX_HISTORY * 2:
+            self.conversation_history = self.conversation_history[
+                -Config.MAX_HISTORY * 2 :
+            ]
+
+    def chat_stream(self, user_message: str, use_query_expansion: bool = True,
+                    request_id: Optional[str] = None, session_id: Optional[str] = None) -> Iterator[Dict]:
+        """Trả lời dạng luồng cho giao diện.
+
+        Lần lượt yield các sự kiện: {'type': 'context'} khi đã có thông tin tham
+        khảo, {'type': 'token', 'text': ...} cho từng đoạn câu trả lời và cuối
+        cùng {'type': 'done', ...} với cùng các khóa như kết quả của `chat`
+        cộng thêm 'metrics' (retrieval_ms, time_to_first_token_ms, total_ms).
+        Khi bật tracing, sự kiện 'done' có thêm 'request_id' của trace.
+        `session_id`: lưu lịch sử vào phiên riêng thay vì lịch sử chung của bot.
+        """
+        with tracer.request(request_id) as trace:
+            for event in self._chat_stream(user_message, use_query_expansion, session_id):
+                if event["type"] == "done" and trace is not None:
+                    event["request_id"] = trace.request_id
+                yield event
+
+    def _not_ready_event(self) -> Dict:
+        return {
+            "type": "done",
+            "response": "⏳ Hệ thống đang khởi động, vui lòng thử lại sau giây lát."
+            if self.state != "failed" else "Xin lỗi, hệ thống khởi động không thành công. Vui lòng thử lại sau.",
+            "context_used": "",
+            "success": False,
+            "error": "not_ready" if self.state != "failed" else self.startup_error,
+        }
+
+    @staticmethod
+    def _failure_event(user_message: str, error: Exception) -> Dict:
+        logger.error(f"❌ Lỗi khi xử lý câu hỏi '{user_message}': {str(error)}")
+        return {
+            "type": "done",
+            "response": "Xin lỗi, có lỗi xảy ra. Vui lòng thử lại sau.",
+            "context_used": "",
+            "success": False,
+            "error": str(error),
+        }
+
+    def _lookup_answer(self, user_message: str) -> Tuple[Optional[List[float]], Optional[Dict]]:
+        """Ghi nhật ký câu hỏi, tra câu trả lời dựng sẵn (khớp đúng câu hỏi) rồi đến cache câu trả lời
+        theo ngữ nghĩa; trả về (vector câu hỏi, câu trả lời có sẵn hoặc None)"""
+        self.question_log.record(user_message)
+        if Config.PRECOMPUTE_ENABLED:
+            precomputed = self.precomputed.get(user_message, self.vector_store.index_version)
+            if precomputed is not None:
+                return None, precomputed
+            if self._auto_precompute:
+                # Index được xây dựng lại khi đang chạy: dựng lại bộ câu trả lời trong nền
+                self.start_precompute()
+        if self.answer_cache is None:
+            return None, None
+        # Vector này cũng được cache embedding truy vấn dùng lại khi phải tìm kiếm
+        with tracer.span("answer_cache_lookup"):
+            question_vector = self.vector_store.query_embeddings.embed_query(user_message)
+            cached = self.answer_cache.lookup(user_message, question_vector, self.vector_store.index_version)
+        return question_vector, cached
+
+    def _store_answer(self, user_message: str, question_vector, turn: "_Turn", context: str):
+        if question_vector is not None:
+            self.answer_cache.store(
+                user_message, question_vector,
+                {"response": turn.response, "context_used": context},
+                self.vector_store.index_version,
+            )
 
-    def chat(self, user_message: str, use_query_expansion: bool = True) -> Dict:
+    def _chat_stream(self, user_message: str, use_query_expansion: bool,
+                     session_id: Optional[str]) -> Iterator[Dict]:
+        if not self._retrieval_ready.is_set():
+            yield self._not_ready_event()
+            return
+
+        turn = _Turn(self, session_id)
         try:
             logger.info(f"👤 User hỏi: {user_message}")
-            self.conversation_history.append({"role": "user", "content": user_message})
-            if len(self.conversation_history) > Config.MAX_HISTORY * 2:
-                self.conversation_history = self.conversation_history[
-                    -Config.MAX_HISTORY * 2 :
-                ]
-            context = self.get_relevant_context(user_message, use_query_expansion=use_query_expansion)
-            response = self.generate_response(user_message, context)
-            logger.info(f"🤖 Bot trả lời: {response[:200]}...")
-            self.conversation_history.append({"role": "assistant", "content": response})
-            return {"response": response, "context_used": context, "success": True}
+            self._remember("user", user_message, session_id)
+
+            question_vector, cached = self._lookup_answer(user_message)
+            if cached is not None:
+                yield {"type": "context", "context": cached["context_used"]}
+                yield turn.token(cached["response"])
+                yield turn.done(cached["context_used"], cached=True)
+                return
+
+            context, context_stats = self._build_context(user_message, use_query_expansion=use_query_expansion)
+            turn.retrieved(context_stats)
+            yield {"type": "context", "context": context}
+
+            from_llm = False
+            if not self.llm:
+                yield turn.token(self._fallback_response(context))
+            else:
+                full_prompt = self._build_prompt(user_message, context)
+                logger.info(f"📝 Prompt gửi đến {self.llm_type}: {full_prompt[:200]}...")
+                try:
+                    with tracer.span("generation", llm=self.llm_type):
+                        for text in self.llm.generate_stream(full_prompt):
+                            yield turn.token(text)
+                    from_llm = bool(turn.parts)
+                except Exception as e:
+                    yield turn.token(turn.generation_error(e, context))
+
+            if from_llm:
+                self._store_answer(user_message, question_vector, turn, context)
+            yield turn.done(context, cached=False)
         except Exception as e:
-            logger.error(f"❌ Lỗi khi xử lý câu hỏi '{user_message}': {str(e)}")
-            logger.error(f"Lỗi trong quá trình chat: {str(e)}")
-            return {
-                "response": "Xin lỗi, có lỗi xảy ra. Vui lòng thử lại sau.",
-                "context_used": "",
-                "success": False,
-                "error": str(e),
-            }
-
-    def get_conversation_history(self) -> List[Dict]:
+            yield self._failure_event(user_message, e)
+
+    async def achat_stream(self, user_message: str, use_query_expansion: bool = True,
+                           request_id: Optional[str] = None,
+                           session_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Bản async của `chat_stream` (cùng các sự kiện context/token/done).
+
+        Embedding và tìm kiếm chạy trong executor CPU có giới hạn, LLM được gọi
+        bằng I/O bất đồng bộ nên một event loop phục vụ được nhiều hội thoại.
+        """
+        with tracer.request(request_id) as trace:
+            async for event in self._achat_stream(user_message, use_query_expansion, session_id):
+                if event["type"] == "done" and trace is not None:
+                    event["request_id"] = trace.request_id
+                yield event
+
+    async def _achat_stream(self, user_message: str, use_query_expansion: bool,
+                            session_id: Optional[str]) -> AsyncIterator[Dict]:
+        if not self._retrieval_ready.is_set():
+            yield self._not_ready_event()
+            return
+
+        turn = _Turn(self, session_id)
+        try:
+            logger.info(f"👤 User hỏi: {user_message}")
+            self._remember("user", user_message, session_id)
+
+            question_vector, cached = await run_cpu_bound(self._lookup_answer, user_message)
+            if cached is not None:
+                yield {"type": "context", "context": cached["context_used"]}
+                yield turn.token(cached["response"])
+                yield turn.done(cached["context_used"], cached=True)
+                return
+
+            context, context_stats = await self._abuild_context(user_message, use_query_expansion=use_query_expansion)
+            turn.retrieved(context_stats)
+            yield {"type": "context", "context": context}
+
+            from_llm = False
+            if not self.llm:
+                yield turn.token(self._fallback_response(context))
+            else:
+                full_prompt = self._build_prompt(user_message, context)
+                logger.info(f"📝 Prompt gửi đến {self.llm_type} (async): {full_prompt[:200]}...")
+                try:
+                    with tracer.span("generation", llm=self.llm_type):
+                        async for text in self.llm.agenerate_stream(full_prompt):
+                            yield turn.token(text)
+                    from_llm = bool(turn.parts)
+                except Exception as e:
+                    yield turn.token(turn.generation_error(e, context))
+
+            if from_llm:
+                self._store_answer(user_message, question_vector, turn, context)
+            yield turn.done(context, cached=False)
+        except Exception as e:
+            yield self._failure_event(user_message, e)
+
+    async def achat(self, user_message: str, use_query_expansion: bool = True,
+                    session_id: Optional[str] = None) -> Dict:
+        result = {}
+        async for event in self.achat_stream(user_message, use_query_expansion=use_query_expansion,
+                                             session_id=session_id):
+            if event["type"] == "done":
+                result = {key: value for key, value in event.items() if key != "type"}
+        return result
+
+    def chat(self, user_message: str, use_query_expansion: bool = True, session_id: Optional[str] = None) -> Dict:
+        result = {}
+        for event in self.chat_stream(user_message, use_query_expansion=use_query_expansion, session_id=session_id):
+            if event["type"] == "done":
+                result = {key: value for key, value in event.items() if key != "type"}
+        return result
+
+    def get_conversation_history(self, session_id: Optional[str] = None) -> List[Dict]:
+        if session_id is not None:
+            return self.sessions.get_history(session_id)
         return self.conversation_history.copy()
 
-    def clear_history(self):
+    def clear_history(self, session_id: Optional[str] = None):
+        if session_id is not None:
+            self.sessions.clear(session_id)
+            return
         self.conversation_history = []
 
     def get_statistics(self) -> Dict:
-        vector_stats = self.vector_store.get_statistics()
+        vector_stats = (
+            self.vector_store.get_statistics() if self._retrieval_ready.is_set() else {"status": self.state}
+        )
         return {
             "vector_store": vector_stats,
+            "startup": self.get_readiness(),
             "llm_available": self.llm is not None,
             "conversation_history_length": len(self.conversation_history),
-            "model_name": "gemini" if self.llm else "None",
+            "model_name": self.llm_type or "None",
+            "latency": self.get_latency_statistics(),
+            "llm_scheduler": self.llm.get_statistics() if hasattr(self.llm, "get_statistics") else None,
+            "answer_cache": self.answer_cache.get_statistics() if self.answer_cache else None,
+            "tracing": tracer.get_statistics(),
+            "sessions": self.sessions.get_statistics(),
+            "precomputed": dict(self.precomputed.get_statistics(), logged_questions=len(self.question_log)),
+        }
+
+    def get_latency_statistics(self) -> Dict:
+        """Thống kê độ trễ: time-to-first-token (chỉ số chính), thời gian tìm kiếm và tổng thời gian"""
+        metrics = list(self.response_metrics)
+        ttft = [m["time_to_first_token_ms"] for m in metrics if m["time_to_first_token_ms"] is not None]
+        total = [m["total_ms"] for m in metrics]
+        retrieval = [m["retrieval_ms"] for m in metrics if not m["cached"]]
+        return {
+            "responses": len(metrics),
+            "ttft_ms_avg": round(float(np.mean(ttft)), 2) if ttft else 0,
+            "ttft_ms_p50": round(float(np.percentile(ttft, 50)), 2) if ttft else 0,
+            "ttft_ms_p95": round(float(np.percentile(ttft, 95)), 2) if ttft else 0,
+            "retrieval_ms_avg": round(float(np.mean(retrieval)), 2) if retrieval else 0,
+            "context_tokens_avg": round(float(np.mean([m.get("context_tokens", 0) for m in metrics])), 1) if metrics else 0,
+            "tokens_saved_total": sum(m.get("tokens_saved", 0) for m in metrics),
+            "total_ms_avg": round(float(np.mean(total)), 2) if total else 0,
         }
 
     def suggest_questions(self) -> List[str]:
@@ -13,15 +13,106 @@ class Config:
         "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
     )
     EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+    # Micro-batching cho embedding engine dùng chung (1 = tắt gom batch)
+    EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 32))
+    EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
     LLM_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5")
+    # Scheduler quota Gemini: ngân sách mỗi phút (0 = không giới hạn), số request đồng thời, thử lại khi gặp 429
+    GEMINI_RPM = float(os.getenv("GEMINI_RPM", 15))
+    GEMINI_TPM = float(os.getenv("GEMINI_TPM", 1000000))
+    GEMINI_OUTPUT_TOKEN_RESERVE = int(os.getenv("GEMINI_OUTPUT_TOKEN_RESERVE", 1024))
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+    GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 4))
+    GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", 1.0))
+    GEMINI_RETRY_MAX_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_SECONDS", 30.0))
+    GEMINI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", 120))  # 0 = chờ không giới hạn
+
+    # LLM giả lập cục bộ (không gọi Gemini) để kiểm thử streaming và đo độ trễ
+    FAKE_LLM = os.getenv("FAKE_LLM", "false").lower() == "true"
+    FAKE_LLM_FIRST_TOKEN_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", 300))
+    FAKE_LLM_CHUNK_MS = float(os.getenv("FAKE_LLM_CHUNK_MS", 40))
+
+    # Cache embedding truy vấn (LRU trong bộ nhớ + SQLite trên đĩa, để trống để tắt tầng đĩa)
+    QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 2048))
+    QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "./cache/query_embeddings.sqlite3")
+
+    # Kho embedding chunk theo hash nội dung, dùng lại giữa các lần xây dựng index (0 = không giới hạn)
+    CHUNK_CACHE_PATH = os.getenv("CHUNK_CACHE_PATH", "./cache/chunk_embeddings.sqlite3")
+    CHUNK_CACHE_MAX_ENTRIES = int(os.getenv("CHUNK_CACHE_MAX_ENTRIES", 200000))
 
     # Vector Database Configuration
     VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "./vector_db")
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+
+    # Loại FAISS index: flat, hnsw, ivf, sq8, ivf_sq8, pq, ivf_pq
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+    FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", 0))  # 0 = tự chọn theo số vector
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", 8))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 0))  # 0 = số chiều / 8
+
+    # Chế độ tìm kiếm: vector (FAISS), bm25 (từ khóa) hoặc hybrid (gộp bằng Reciprocal Rank Fusion)
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+    BM25_K1 = float(os.getenv("BM25_K1", 1.5))
+    BM25_B = float(os.getenv("BM25_B", 0.75))
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))
+    RRF_K = int(os.getenv("RRF_K", 60))
+    # Tự suy ra bộ lọc năm/loại tài liệu từ câu hỏi (bộ lọc không khớp chunk nào sẽ được bỏ qua)
+    SEARCH_AUTO_FILTERS = os.getenv("SEARCH_AUTO_FILTERS", "true").lower() == "true"
     
+    # Cache câu trả lời theo ngữ nghĩa (bỏ qua tìm kiếm + Gemini cho câu hỏi gần giống câu đã trả lời)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.92))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 6 * 3600))  # 0 = không hết hạn
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+    # Câu trả lời dựng sẵn cho câu hỏi gợi ý + PRECOMPUTE_TOP_N câu hỏi hay gặp nhất (theo nhật ký câu hỏi),
+    # tự dựng lại khi index thay đổi
+    PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "true").lower() == "true"
+    PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", 20))
+    # Nhật ký câu hỏi lưu nguyên văn câu hỏi của người dùng nên mặc định tắt; số lần hỏi được gom
+    # trong bộ nhớ và ghi xuống đĩa mỗi QUESTION_LOG_FLUSH_SECONDS giây từ luồng nền
+    QUESTION_LOG_ENABLED = os.getenv("QUESTION_LOG_ENABLED", "false").lower() == "true"
+    QUESTION_LOG_PATH = os.getenv("QUESTION_LOG_PATH", "./cache/question_log.sqlite3")
+    QUESTION_LOG_FLUSH_SECONDS = float(os.getenv("QUESTION_LOG_FLUSH_SECONDS", 30))
+
+    # Ngân sách token cho phần context trong prompt (0 = không giới hạn)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+
+    # Khởi động nền: tải model/index và warm-up trong luồng riêng, trả lời chỉ-tìm-kiếm khi index sẵn sàng
+    BACKGROUND_STARTUP = os.getenv("BACKGROUND_STARTUP", "false").lower() == "true"
+    WARMUP_QUERY = os.getenv("WARMUP_QUERY", "Chỉ tiêu tuyển sinh năm 2025")
+
+    # Đo thời gian từng giai đoạn theo request (mở rộng truy vấn, embedding, FAISS, context, LLM)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACING_WINDOW = int(os.getenv("TRACING_WINDOW", 1000))  # số mẫu gần nhất giữ cho mỗi giai đoạn
+    TRACING_MAX_TRACES = int(os.getenv("TRACING_MAX_TRACES", 100))  # số trace request gần nhất để xuất JSON
+
+    # Chat server (nhiều người dùng): số pipeline chạy đồng thời, số request được chờ, thời gian chờ tối đa
+    CHAT_SERVER_HOST = os.getenv("CHAT_SERVER_HOST", "127.0.0.1")
+    CHAT_SERVER_PORT = int(os.getenv("CHAT_SERVER_PORT", 8000))
+    CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", 4))
+    CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 16))
+    CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", 30))
+    # Địa chỉ chat server cho giao diện Streamlit; bỏ trống để chạy server ngay trong process của Streamlit
+    CHAT_SERVER_URL = os.getenv("CHAT_SERVER_URL", "")
+    # Pre-fork: số process worker (0 = số nhân CPU, 1 = một process) và số luồng tính toán mỗi process
+    CHAT_PROCESSES = int(os.getenv("CHAT_PROCESSES", 1))
+    PREFORK_THREADS_PER_PROCESS = int(os.getenv("PREFORK_THREADS_PER_PROCESS", 1))
+    SESSION_MAX = int(os.getenv("SESSION_MAX", 1000))
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 3600))
+
+    # Số luồng cho phần việc CPU (embedding, FAISS) của các API async (achat, asearch)
+    ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", 4))
+
     # Chat Configuration
     MAX_HISTORY = 10
     TEMPERATURE = 0.7
-    DATA_DIR = "./data"
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+    # Số process dùng để trích xuất tài liệu song song (0 = theo số CPU, 1 = tuần tự)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 0))
+    # Số chunk mỗi batch embedding trong pipeline xây dựng index theo luồng
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
     SYSTEM_PROMPT = """Bạn là một trợ lý AI chuyên về tư vấn tuyển sinh cho trường Đại học Quy Nhơn (ĐHQN).\nBạn có kiến thức sâu rộng về:\n- Quy chế tuyển sinh\n- Chỉ tiêu tuyển sinh các ngành\n- Điểm chuẩn các năm trước\n- Thông tin chi tiết về các ngành đào tạo\n\nHãy trả lời các câu hỏi một cách chính xác, rõ ràng và hữu ích.\nNếu không có thông tin trong dữ liệu, hãy nói rõ rằng bạn không có thông tin đó.\nLuôn trả lời bằng tiếng Việt."""
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Phần trùng ngắn hơn ngưỡng này coi là trùng ngẫu nhiên, không cắt bỏ
+MIN_OVERLAP_CHARS = 10
+
+
+def count_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự/token), đủ để so sánh và giới hạn ngân sách prompt"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def overlap_length(previous: str, following: str, max_overlap: int) -> int:
+    """Số ký tự đầu của `following` trùng với phần cuối của `previous` (overlap của text splitter), 0 nếu không có"""
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+def strip_overlap(previous: str, following: str, max_overlap: int) -> str:
+    """Bỏ phần đầu của `following` trùng với phần cuối của `previous`"""
+    return following[overlap_length(previous, following, max_overlap):]
+
+
+def format_block(index: int, source: str, text: str) -> str:
+    return f"Thông tin {index} (từ {source}):\n{text}"
+
+
+class ContextPacker:
+    """Ghép các kết quả tìm kiếm thành context cho prompt.
+
+    Loại chunk trùng (theo chunk_hash), nối các chunk liền kề của cùng tài liệu
+    (bỏ phần overlap) rồi đóng gói theo thứ tự liên quan cho đến khi hết
+    ngân sách token.
+    """
+
+    def __init__(self, token_budget: int = Config.CONTEXT_TOKEN_BUDGET,
+                 chunk_overlap: int = Config.CHUNK_OVERLAP):
+        self.token_budget = token_budget
+        self.max_overlap = max(chunk_overlap, MIN_OVERLAP_CHARS) * 2
+
+    @staticmethod
+    def _chunk_key(result: Mapping) -> str:
+        return result.get('chunk_hash') or hashlib.sha256(result['content'].encode('utf-8')).hexdigest()
+
+    def _merge_adjacent(self, chunks: List[Dict]) -> List[Dict]:
+        """Nối các chunk có chunk_id liên tiếp của cùng một file (cùng tên và cùng phiên bản) thành một khối"""
+        by_file: Dict[Tuple[str, str], List[Dict]] = {}
+        for chunk in chunks:
+            by_file.setdefault((chunk['source'], chunk['file_hash']), []).append(chunk)
+
+        blocks = []
+        for (source, _), items in by_file.items():
+            items.sort(key=lambda item: item['chunk_id'])
+            current = None
+            for item in items:
+                if current is not None and item['chunk_id'] == current['last_chunk_id'] + 1:
+                    overlap = overlap_length(current['text'], item['text'], self.max_overlap)
+                    tail = item['text'][overlap:]
+                    if not overlap:
+                        current['text'] += "\n" + tail
+                    elif tail.strip():
+                        current['text'] += tail if tail[0].isspace() else " " + tail
+                    current['last_chunk_id'] = item['chunk_id']
+                    current['rank'] = min(current['rank'], item['rank'])
+                    current['chunks'] += 1
+                else:
+                    current = {
+                        'source': source,
+                        'text': item['text'],
+                        'last_chunk_id': item['chunk_id'],
+                        'rank': item['rank'],
+                        'chunks': 1,
+                    }
+                    blocks.append(current)
+        blocks.sort(key=lambda block: block['rank'])
+        return blocks
+
+    def pack(self, results: Sequence[Mapping]) -> Dict:
+        """Trả về {'context': ..., 'stats': {...}} với số token tiết kiệm được so với ghép thô"""
+        raw_tokens = sum(
+            count_tokens(format_block(i, result['source'], result['content']))
+            for i, result in enumerate(results, 1)
+        )
+
+        seen = set()
+        chunks = []
+        for rank, result in enumerate(results):
+            key = self._chunk_key(result)
+            if key in seen:
+                continue
+            seen.add(key)
+            chunks.append({
+                'source': result['source'],
+                'file_hash': result.get('file_hash') or '',
+                'chunk_id': int(result.get('chunk_id', 0)),
+                'text': result['content'],
+                'rank': rank,
+            })
+        duplicates = len(results) - len(chunks)
+        blocks = self._merge_adjacent(chunks)
+
+        parts = []
+        used_tokens = 0
+        truncated = False
+        for block in blocks:
+            # Dấu phân cách giữa các khối cũng tính vào ngân sách
+            text = ("\n\n" if parts else "") + format_block(len(parts) + 1, block['source'], block['text'])
+            tokens = count_tokens(text)
+            remaining = self.token_budget - used_tokens
+            if self.token_budget > 0 and tokens > remaining:
+                # Cắt bớt khối đầu tiên vượt ngân sách nếu phần còn lại đủ dùng, sau đó dừng
+                if remaining >= 50:
+                    parts.append(text[:remaining * 4].rstrip() + "…")
+                    used_tokens += count_tokens(parts[-1])
+                truncated = True
+                break
+            parts.append(text)
+            used_tokens += tokens
+
+        stats = {
+            'chunks_in': len(results),
+            'duplicates_removed': duplicates,
+            'chunks_merged': len(chunks) - len(blocks),
+            'blocks': len(parts),
+            'truncated': truncated,
+            'raw_tokens': raw_tokens,
+            'packed_tokens': used_tokens,
+            'tokens_saved': max(0, raw_tokens - used_tokens),
+        }
+        return {'context': "".join(parts), 'stats': stats}
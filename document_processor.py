@@ -1,6 +1,12 @@
 import os
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
 from docx import Document
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 import logging
 from config import Config
 
@@ -9,8 +15,8 @@ logger = logging.getLogger(__name__)
 
 
 class DocumentProcessor:
-    def __init__(self, data_dir: str = Config.DATA_DIR):
-        self.data_dir = data_dir
+    def __init__(self, data_dir: Optional[str] = None):
+        self.data_dir = data_dir or Config.DATA_DIR
 
     def extract_text_from_docx(self, file_path: str) -> str:
         """Trích xuất văn bản từ file docx"""
@@ -37,25 +43,114 @@ class DocumentProcessor:
             logger.error(f"Lỗi khi đọc file {file_path}: {str(e)}")
             return ""
 
-    def process_all_documents(self) -> List[Dict]:
-        """Xử lý tất cả tài liệu trong thư mục data"""
-        documents = []
-
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith(".docx"):
-                file_path = os.path.join(self.data_dir, filename)
-                logger.info(f"Đang xử lý file: {filename}")
+    def compute_file_hash(self, file_path: str) -> str:
+        """Tính hash nội dung file (dùng để phát hiện file thay đổi)"""
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def list_document_files(self) -> List[str]:
+        """Liệt kê các file docx trong thư mục data (bỏ qua file tạm/lock của Word)"""
+        return sorted(
+            filename
+            for filename in os.listdir(self.data_dir)
+            if filename.endswith(".docx") and not filename.startswith(("~$", "."))
+        )
+
+    def process_document(self, filename: str) -> Optional[Dict]:
+        """Xử lý một file docx trong thư mục data"""
+        file_path = os.path.join(self.data_dir, filename)
+        logger.info(f"Đang xử lý file: {filename}")
+
+        content = self.extract_text_from_docx(file_path)
+        if not content:
+            return None
+
+        logger.info(f"Đã xử lý thành công: {filename} ({len(content)} ký tự)")
+        return {
+            "filename": filename,
+            "content": content,
+            "source": file_path,
+            "file_hash": self.compute_file_hash(file_path),
+        }
 
-                content = self.extract_text_from_docx(file_path)
-                if content:
-                    documents.append(
-                        {"filename": filename, "content": content, "source": file_path}
-                    )
-                    logger.info(
-                        f"Đã xử lý thành công: {filename} ({len(content)} ký tự)"
-                    )
+    def iter_documents(self, filenames: List[str], max_workers: Optional[int] = None) -> Iterator[Dict]:
+        """Xử lý lần lượt từng file và trả về dần (generator), song song nếu được cấu hình
+
+        Thứ tự kết quả luôn theo thứ tự `filenames`; lỗi ở một file không ảnh
+        hưởng đến các file còn lại. Ở chế độ song song, số file đang xử lý
+        được giới hạn (2 x số worker) để nội dung văn bản không dồn lại trong
+        bộ nhớ khi bên tiêu thụ chậm hơn.
+        """
+        if max_workers is None:
+            max_workers = Config.INGEST_WORKERS or os.cpu_count() or 1
+        max_workers = min(max_workers, len(filenames))
+
+        if max_workers <= 1:
+            for filename in filenames:
+                document = self._safe_process_document(filename)
+                if document:
+                    yield document
+            return
+
+        logger.info(f"⚡ Xử lý song song {len(filenames)} file với {max_workers} process")
+        fallback: List[str] = []
+        # 'spawn': process con không thừa hưởng luồng/lock của process cha (torch, FAISS, tokenizer)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # [tên file, future]; file được ghi nhận trước khi gửi để không bị mất nếu pool hỏng
+            pending = deque()
+            remaining = iter(filenames)
+
+            def submit(filename: str):
+                entry = [filename, None]
+                pending.append(entry)
+                entry[1] = executor.submit(_process_document_in_worker, self.data_dir, filename)
+
+            try:
+                for filename in list(islice(remaining, max_workers * 2)):
+                    submit(filename)
+
+                while pending:
+                    filename, future = pending[0]
+                    next_filename = next(remaining, None)
+                    if next_filename is not None:
+                        submit(next_filename)
+                    try:
+                        document = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Lỗi khi xử lý file {filename}: {str(e)}")
+                        document = None
+                    pending.popleft()
+                    if document:
+                        yield document
+            except BrokenProcessPool as e:
+                # Process con bị kill (OOM, tín hiệu): xử lý phần còn lại ngay trong process này
+                fallback = [filename for filename, _ in pending] + list(remaining)
+                logger.warning(f"⚠️ Process pool bị hỏng ({e}), xử lý {len(fallback)} file còn lại trong process hiện tại")
+
+        for filename in fallback:
+            document = self._safe_process_document(filename)
+            if document:
+                yield document
+
+    def process_documents(self, filenames: List[str], max_workers: Optional[int] = None) -> List[Dict]:
+        """Xử lý danh sách file (xem `iter_documents`)"""
+        return list(self.iter_documents(filenames, max_workers=max_workers))
+
+    def _safe_process_document(self, filename: str) -> Optional[Dict]:
+        try:
+            return self.process_document(filename)
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý file {filename}: {str(e)}")
+            return None
 
-        return documents
+    def process_all_documents(self, max_workers: Optional[int] = None) -> List[Dict]:
+        """Xử lý tất cả tài liệu trong thư mục data"""
+        return self.process_documents(self.list_document_files(), max_workers=max_workers)
 
     def get_document_summary(self) -> Dict:
         """Tạo tóm tắt về các tài liệu đã xử lý"""
@@ -79,6 +174,11 @@ class DocumentProcessor:
         return summary
 
 
+def _process_document_in_worker(data_dir: str, filename: str) -> Optional[Dict]:
+    """Hàm chạy trong process con của ProcessPoolExecutor"""
+    return DocumentProcessor(data_dir).process_document(filename)
+
+
 if __name__ == "__main__":
     processor = DocumentProcessor()
     summary = processor.get_document_summary()
@@ -0,0 +1,447 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from config import Config
+from embedding_engine import EmbeddingEngine, get_embedding_engine
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa văn bản làm khóa cache (Unicode NFC, gộp khoảng trắng)"""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class QueryEmbeddingCache:
+    """Cache embedding truy vấn hai tầng: LRU trong bộ nhớ + SQLite trên đĩa.
+
+    Khóa là (tên model, văn bản đã chuẩn hóa) nên các mục đã "nóng" vẫn còn
+    sau khi khởi động lại process.
+    """
+
+    def __init__(
+        self,
+        engine: EmbeddingEngine,
+        max_entries: int = Config.QUERY_CACHE_MAX_ENTRIES,
+        disk_path: Optional[str] = Config.QUERY_CACHE_PATH,
+    ):
+        self.engine = engine
+        self.model_name = engine.model_name
+        self.max_entries = max(1, max_entries)
+        self.disk_path = disk_path or None
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_writes': 0,
+        }
+
+        if self.disk_path:
+            try:
+                self._open_disk()
+            except Exception as e:
+                logger.warning(f"Không thể mở cache embedding trên đĩa '{self.disk_path}': {e}")
+                self._db = None
+
+    def _open_disk(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                text_key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, text_key)
+            )"""
+        )
+        self._db.commit()
+
+    def _after_fork(self):
+        """Trong process con sau fork: không dùng lại kết nối SQLite và lock của process cha"""
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        if self._db is not None:
+            try:
+                self._open_disk()
+            except Exception as e:
+                logger.warning(f"Không thể mở lại cache embedding trên đĩa '{self.disk_path}': {e}")
+                self._db = None
+
+    def _memory_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: str, vector: List[float]):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        try:
+            with self._db_lock:
+                for start in range(0, len(keys), 500):
+                    part = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._db.execute(
+                        f"SELECT text_key, vector FROM query_embeddings "
+                        f"WHERE model = ? AND text_key IN ({placeholders})",
+                        [self.model_name, *part],
+                    ).fetchall()
+                    for text_key, blob in rows:
+                        found[text_key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        except Exception as e:
+            logger.warning(f"Lỗi khi đọc cache embedding trên đĩa: {e}")
+        return found
+
+    def _disk_put_many(self, items: List[Tuple[str, List[float]]]):
+        if self._db is None or not items:
+            return
+        now = time.time()
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (model, text_key, vector, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                        for key, vector in items
+                    ],
+                )
+                self._db.commit()
+            with self._lock:
+                self._stats['disk_writes'] += len(items)
+        except Exception as e:
+            logger.warning(f"Lỗi khi ghi cache embedding xuống đĩa: {e}")
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Lấy embedding cho nhiều truy vấn; chỉ các truy vấn chưa có mới được encode (một batch)"""
+        keys = [normalize_text(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        missing_memory = []
+        for key in keys:
+            if key in vectors:
+                continue
+            vector = self._memory_get(key)
+            if vector is not None:
+                vectors[key] = vector
+                with self._lock:
+                    self._stats['memory_hits'] += 1
+            elif key not in missing_memory:
+                missing_memory.append(key)
+
+        disk_found = self._disk_get_many(missing_memory)
+        for key, vector in disk_found.items():
+            vectors[key] = vector
+            self._memory_put(key, vector)
+        with self._lock:
+            self._stats['disk_hits'] += len(disk_found)
+
+        missing = [key for key in missing_memory if key not in disk_found]
+        if missing:
+            with self._lock:
+                self._stats['misses'] += len(missing)
+            # Qua bộ gom micro-batch: các request đồng thời dùng chung một lần forward
+            with tracer.span('embedding.encode', texts=len(missing)):
+                computed = self.engine.embed_many(missing)
+            for key, vector in zip(missing, computed):
+                vectors[key] = vector
+                self._memory_put(key, vector)
+            self._disk_put_many(list(zip(missing, computed)))
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Lấy embedding cho một truy vấn qua cache"""
+        return self.embed_queries([text])[0]
+
+    def clear(self, include_disk: bool = False):
+        """Xóa cache trong bộ nhớ (và tùy chọn cả tầng trên đĩa)"""
+        with self._lock:
+            self._memory.clear()
+        if include_disk and self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings WHERE model = ?", (self.model_name,))
+                self._db.commit()
+
+    def get_statistics(self) -> Dict:
+        """Thống kê tỉ lệ trúng cache và số mục bị loại bỏ"""
+        with self._lock:
+            stats = dict(self._stats)
+            memory_size = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        disk_entries = 0
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    disk_entries = self._db.execute(
+                        "SELECT COUNT(*) FROM query_embeddings WHERE model = ?", (self.model_name,)
+                    ).fetchone()[0]
+            except Exception:
+                pass
+        return {
+            **stats,
+            'lookups': lookups,
+            'hit_rate': round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0,
+            'memory_hit_rate': round(stats['memory_hits'] / lookups, 4) if lookups else 0,
+            'memory_entries': memory_size,
+            'max_memory_entries': self.max_entries,
+            'disk_enabled': self._db is not None,
+            'disk_entries': disk_entries,
+        }
+
+
+class ChunkEmbeddingStore:
+    """Kho embedding chunk định địa chỉ theo nội dung: (tên model, hash nội dung) -> vector.
+
+    Dùng lại giữa các lần xây dựng index (kể cả khi đổi CHUNK_SIZE/CHUNK_OVERLAP)
+    để chỉ embed những đoạn văn bản chưa từng gặp.
+    """
+
+    def __init__(
+        self,
+        engine: EmbeddingEngine,
+        path: Optional[str] = Config.CHUNK_CACHE_PATH,
+        max_entries: int = Config.CHUNK_CACHE_MAX_ENTRIES,
+    ):
+        self.engine = engine
+        self.model_name = engine.model_name
+        self.path = path or None
+        self.max_entries = max_entries
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        if self.path:
+            self._open()
+
+    def _open(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS chunk_embeddings (
+                    model TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, content_hash)
+                )"""
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"Không thể mở kho embedding chunk '{self.path}': {e}")
+            self._db = None
+
+    def _after_fork(self):
+        """Trong process con sau fork: không dùng lại kết nối SQLite và lock của process cha"""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._open()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Hash đầy đủ của nội dung chunk (khóa định địa chỉ theo nội dung)"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        if self._db is None or not hashes:
+            return found
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT content_hash, vector FROM chunk_embeddings "
+                    f"WHERE model = ? AND content_hash IN ({placeholders})",
+                    [self.model_name, *part],
+                ).fetchall()
+                for content_hash, blob in rows:
+                    found[content_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE chunk_embeddings SET last_used = ? WHERE model = ? AND content_hash = ?",
+                    [(now, self.model_name, content_hash) for content_hash in found],
+                )
+                self._db.commit()
+        return found
+
+    def _put_many(self, items: List[Tuple[str, List[float]]]):
+        if self._db is None or not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (model, content_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (self.model_name, content_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for content_hash, vector in items
+                ],
+            )
+            self._db.commit()
+
+    def embed_chunks(self, texts: List[str]) -> Tuple[List[List[float]], Dict]:
+        """Lấy embedding cho các chunk; chỉ encode các nội dung chưa có trong kho.
+
+        Trả về (danh sách vector, {'reused': ..., 'computed': ...}).
+        """
+        hashes = [self.content_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        try:
+            vectors = self._get_many(unique_hashes)
+        except Exception as e:
+            logger.warning(f"Lỗi khi đọc kho embedding chunk: {e}")
+            vectors = {}
+
+        text_by_hash = dict(zip(hashes, texts))
+        missing = [content_hash for content_hash in unique_hashes if content_hash not in vectors]
+        if missing:
+            computed = self.engine.embed_documents([text_by_hash[h] for h in missing])
+            vectors.update(zip(missing, computed))
+            try:
+                self._put_many(list(zip(missing, computed)))
+                self.evict()
+            except Exception as e:
+                logger.warning(f"Lỗi khi ghi kho embedding chunk: {e}")
+
+        stats = {'reused': len(unique_hashes) - len(missing), 'computed': len(missing)}
+        logger.info(f"♻️ Embedding chunk: dùng lại {stats['reused']}, tính mới {stats['computed']}")
+        return [vectors[content_hash] for content_hash in hashes], stats
+
+    def evict(self, max_entries: Optional[int] = None) -> int:
+        """Loại bỏ các mục ít được dùng gần đây nhất khi kho vượt quá giới hạn"""
+        max_entries = self.max_entries if max_entries is None else max_entries
+        if self._db is None or not max_entries or max_entries <= 0:
+            return 0
+        with self._lock:
+            count = self._db.execute(
+                "SELECT COUNT(*) FROM chunk_embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()[0]
+            excess = count - max_entries
+            if excess <= 0:
+                return 0
+            self._db.execute(
+                "DELETE FROM chunk_embeddings WHERE rowid IN ("
+                "SELECT rowid FROM chunk_embeddings WHERE model = ? ORDER BY last_used ASC LIMIT ?)",
+                (self.model_name, excess),
+            )
+            self._db.commit()
+        logger.info(f"🧹 Đã loại {excess} embedding chunk cũ khỏi kho")
+        return excess
+
+    def compact(self, keep_texts: List[str]) -> int:
+        """Xóa mọi mục của model hiện tại không còn được tham chiếu bởi `keep_texts`"""
+        if self._db is None:
+            return 0
+        keep = {self.content_hash(text) for text in keep_texts}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT content_hash FROM chunk_embeddings WHERE model = ?", (self.model_name,)
+            ).fetchall()
+            stale = [(self.model_name, content_hash) for (content_hash,) in rows if content_hash not in keep]
+            self._db.executemany(
+                "DELETE FROM chunk_embeddings WHERE model = ? AND content_hash = ?", stale
+            )
+            self._db.commit()
+            self._db.execute("VACUUM")
+        logger.info(f"🧹 Đã nén kho embedding chunk: xóa {len(stale)} mục không còn dùng")
+        return len(stale)
+
+    def get_statistics(self) -> Dict:
+        entries = 0
+        if self._db is not None:
+            try:
+                with self._lock:
+                    entries = self._db.execute(
+                        "SELECT COUNT(*) FROM chunk_embeddings WHERE model = ?", (self.model_name,)
+                    ).fetchone()[0]
+            except Exception:
+                pass
+        return {
+            'enabled': self._db is not None,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+
+_caches: Dict[Tuple[str, str], QueryEmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_embedding_cache(engine: Optional[EmbeddingEngine] = None) -> QueryEmbeddingCache:
+    """Lấy cache embedding truy vấn dùng chung cho toàn process"""
+    engine = engine or get_embedding_engine()
+    key = (engine.model_name, engine.device)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = QueryEmbeddingCache(engine)
+                _caches[key] = cache
+    return cache
+
+
+_chunk_stores: Dict[Tuple[str, str], ChunkEmbeddingStore] = {}
+_chunk_stores_lock = threading.Lock()
+
+
+def get_chunk_embedding_store(engine: Optional[EmbeddingEngine] = None) -> ChunkEmbeddingStore:
+    """Lấy kho embedding chunk dùng chung cho toàn process"""
+    engine = engine or get_embedding_engine()
+    key = (engine.model_name, engine.device)
+    store = _chunk_stores.get(key)
+    if store is None:
+        with _chunk_stores_lock:
+            store = _chunk_stores.get(key)
+            if store is None:
+                store = ChunkEmbeddingStore(engine)
+                _chunk_stores[key] = store
+    return store
+
+
+def _reset_after_fork():
+    global _caches_lock, _chunk_stores_lock
+    _caches_lock = threading.Lock()
+    _chunk_stores_lock = threading.Lock()
+    for cache in _caches.values():
+        cache._after_fork()
+    for store in _chunk_stores.values():
+        store._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
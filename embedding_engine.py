@@ -0,0 +1,213 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingEngine(Embeddings):
+    """Embedding engine dùng chung cho toàn process.
+
+    Model chỉ được tải một lần; các truy vấn từ những request đồng thời
+    (`embed_query`/`embed_many`) được gom thành micro-batch và encode trong
+    một lần forward.
+    """
+
+    def __init__(
+        self,
+        model_name: str = Config.EMBEDDING_MODEL,
+        device: str = Config.EMBEDDING_DEVICE,
+        max_batch_size: int = Config.EMBEDDING_MAX_BATCH_SIZE,
+        max_wait_ms: float = Config.EMBEDDING_MAX_WAIT_MS,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        start_time = time.perf_counter()
+        self.model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device}
+        )
+        self.load_time = time.perf_counter() - start_time
+        logger.info(f"🧠 Đã tải embedding model '{model_name}' ({self.load_time:.2f}s)")
+
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'query_requests': 0,
+            'queued_texts': 0,
+            'document_requests': 0,
+            'texts_encoded': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'encode_time_total': 0.0,
+        }
+
+    def _after_fork(self):
+        """Trong process con sau fork: luồng gom batch của process cha không tồn tại, tạo lại hàng đợi và lock"""
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Encode một batch văn bản và cập nhật bộ đếm"""
+        start_time = time.perf_counter()
+        with self._encode_lock:
+            vectors = self.model.embed_documents(texts)
+        elapsed = time.perf_counter() - start_time
+
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['texts_encoded'] += len(texts)
+            self._stats['encode_time_total'] += elapsed
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(texts))
+        return vectors
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_worker, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run_worker(self):
+        """Gom các truy vấn đang chờ thành micro-batch rồi encode một lần"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = time.perf_counter()
+            waits = [now - enqueued_at for _, _, enqueued_at in batch]
+            with self._stats_lock:
+                self._stats['queue_wait_total'] += sum(waits)
+                self._stats['queue_wait_max'] = max(self._stats['queue_wait_max'], max(waits))
+
+            try:
+                vectors = self._encode([text for text, _, _ in batch])
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                logger.error(f"Lỗi khi encode micro-batch: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Tạo embedding cho danh sách văn bản (đã là một batch)"""
+        texts = list(texts)
+        with self._stats_lock:
+            self._stats['document_requests'] += 1
+        if not texts:
+            return []
+        return self._encode(texts)
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Tạo embedding cho các truy vấn của một request, gom batch với các request đồng thời.
+
+        Danh sách đã đủ một micro-batch thì encode luôn, không qua hàng đợi.
+        """
+        texts = list(texts)
+        with self._stats_lock:
+            self._stats['query_requests'] += 1
+        if not texts:
+            return []
+        if self.max_batch_size <= 1 or len(texts) >= self.max_batch_size:
+            return self._encode(texts)
+
+        self._ensure_worker()
+        enqueued_at = time.perf_counter()
+        futures = []
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future, enqueued_at))
+            futures.append(future)
+        with self._stats_lock:
+            self._stats['queued_texts'] += len(texts)
+        return [future.result() for future in futures]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Tạo embedding cho một truy vấn, gom batch với các request đồng thời"""
+        return self.embed_many([text])[0]
+
+    def get_statistics(self) -> Dict:
+        """Lấy bộ đếm về kích thước batch, thời gian chờ và thời gian encode"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats['batches']
+        queued = stats['queued_texts']
+        return {
+            'model_name': self.model_name,
+            'device': self.device,
+            'load_time_ms': round(self.load_time * 1000, 2),
+            'query_requests': stats['query_requests'],
+            'queued_texts': queued,
+            'document_requests': stats['document_requests'],
+            'texts_encoded': stats['texts_encoded'],
+            'batches': batches,
+            'avg_batch_size': round(stats['texts_encoded'] / batches, 2) if batches else 0,
+            'max_batch_size': stats['max_batch_size'],
+            'avg_queue_wait_ms': round(stats['queue_wait_total'] / queued * 1000, 3) if queued else 0,
+            'max_queue_wait_ms': round(stats['queue_wait_max'] * 1000, 3),
+            'avg_encode_ms': round(stats['encode_time_total'] / batches * 1000, 3) if batches else 0,
+            'total_encode_ms': round(stats['encode_time_total'] * 1000, 2),
+        }
+
+
+_engines: Dict[Tuple[str, str], EmbeddingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_embedding_engine(
+    model_name: str = Config.EMBEDDING_MODEL,
+    device: str = Config.EMBEDDING_DEVICE,
+) -> EmbeddingEngine:
+    """Lấy embedding engine dùng chung (mỗi model chỉ tải một lần mỗi process)"""
+    key = (model_name, device)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = EmbeddingEngine(model_name=model_name, device=device)
+                _engines[key] = engine
+    return engine
+
+
+def _reset_after_fork():
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in _engines.values():
+        engine._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
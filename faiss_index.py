@@ -0,0 +1,166 @@
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ['flat', 'hnsw', 'ivf', 'sq8', 'ivf_sq8', 'pq', 'ivf_pq']
+
+
+def _nlist_for(n_vectors: int) -> int:
+    """Số cluster IVF: theo cấu hình (mặc định ~4*sqrt(N)), đảm bảo mỗi cluster có đủ điểm train"""
+    nlist = Config.FAISS_IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def _pq_m_for(dim: int) -> int:
+    """Số sub-quantizer PQ: phải là ước của số chiều"""
+    m = Config.FAISS_PQ_M or max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return max(1, m)
+
+
+def index_factory_string(index_type: str, dim: int, n_vectors: int) -> str:
+    """Chuyển tên loại index trong Config thành chuỗi faiss.index_factory"""
+    index_type = index_type.lower()
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'hnsw':
+        return f'HNSW{Config.FAISS_HNSW_M},Flat'
+    if index_type == 'ivf':
+        return f'IVF{_nlist_for(n_vectors)},Flat'
+    if index_type == 'sq8':
+        return 'SQ8'
+    if index_type == 'ivf_sq8':
+        return f'IVF{_nlist_for(n_vectors)},SQ8'
+    if index_type == 'pq':
+        return f'PQ{_pq_m_for(dim)}'
+    if index_type == 'ivf_pq':
+        return f'IVF{_nlist_for(n_vectors)},PQ{_pq_m_for(dim)}'
+    raise ValueError(f"Loại FAISS index không hợp lệ: '{index_type}' (hỗ trợ: {', '.join(INDEX_TYPES)})")
+
+
+def tune_index(index: faiss.Index) -> faiss.Index:
+    """Áp dụng tham số tìm kiếm (nprobe/efSearch) từ Config cho index"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(Config.FAISS_IVF_NPROBE, ivf.nlist)
+
+    downcast = faiss.downcast_index(index)
+    if hasattr(downcast, 'hnsw'):
+        downcast.hnsw.efSearch = Config.FAISS_HNSW_EF_SEARCH
+    return index
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = Config.FAISS_INDEX_TYPE) -> faiss.Index:
+    """Tạo, train (nếu cần) và nạp vector vào index theo loại được chọn
+
+    Thứ tự vector được giữ nguyên nên ánh xạ vị trí -> docstore id không đổi.
+    Nếu không đủ vector để train (ví dụ PQ cần ít nhất 256 điểm), dùng index
+    flat chính xác.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    factory = index_factory_string(index_type, dim, n_vectors)
+
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        try:
+            index.train(vectors)
+        except RuntimeError as e:
+            logger.warning(f"Không thể train index '{factory}' với {n_vectors} vector ({e}), dùng index flat")
+            index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return tune_index(index)
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    """Kích thước index khi serialize (xấp xỉ dung lượng trên đĩa/bộ nhớ)"""
+    return int(faiss.serialize_index(index).size)
+
+
+def _timed_search(index: faiss.Index, query_vectors: np.ndarray, k: int):
+    latencies = []
+    all_ids = []
+    for row in query_vectors:
+        start_time = time.perf_counter()
+        _, ids = index.search(row.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        all_ids.append(ids[0])
+    return np.vstack(all_ids), latencies
+
+
+def compare_index_types(
+    vectors: np.ndarray,
+    query_vectors: np.ndarray,
+    k: int = 5,
+    index_types: Optional[List[str]] = None,
+) -> List[Dict]:
+    """So sánh recall@k, độ trễ truy vấn và kích thước của các loại index với index flat chính xác"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    index_types = index_types or INDEX_TYPES
+    k = min(k, len(vectors))
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    exact_ids, _ = _timed_search(exact_index, query_vectors, k)
+
+    report = []
+    for index_type in index_types:
+        start_time = time.perf_counter()
+        index = build_faiss_index(vectors, index_type)
+        build_ms = (time.perf_counter() - start_time) * 1000
+
+        ids, latencies = _timed_search(index, query_vectors, k)
+        hits = sum(
+            len(set(found[found >= 0]) & set(expected))
+            for found, expected in zip(ids, exact_ids)
+        )
+        report.append({
+            'index_type': index_type,
+            'index_class': faiss.downcast_index(index).__class__.__name__,
+            'recall_at_k': round(hits / (len(query_vectors) * k), 4) if len(query_vectors) else 0,
+            'k': k,
+            'latency_ms_avg': round(float(np.mean(latencies)), 4),
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)), 4),
+            'build_ms': round(build_ms, 2),
+            'size_bytes': index_size_bytes(index),
+            'vectors': int(index.ntotal),
+        })
+    return report
+
+
+def format_report(report: List[Dict]) -> str:
+    """Định dạng báo cáo so sánh index thành bảng văn bản"""
+    lines = [f"{'index':<10} {'recall@k':>9} {'avg ms':>9} {'p95 ms':>9} {'build ms':>10} {'size KB':>10}"]
+    for row in report:
+        lines.append(
+            f"{row['index_type']:<10} {row['recall_at_k']:>9.4f} {row['latency_ms_avg']:>9.4f} "
+            f"{row['latency_ms_p95']:>9.4f} {row['build_ms']:>10.2f} {row['size_bytes'] / 1024:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> Optional[faiss.SearchParameters]:
+    """Tạo SearchParameters có IDSelector (lọc ngay trong index) đúng loại cho index
+
+    Giữ nguyên nprobe/efSearch hiện tại của index. Trả về None nếu loại index
+    không hỗ trợ IDSelector (ví dụ IndexPQ), khi đó cần lọc sau khi tìm kiếm.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+
+    downcast = faiss.downcast_index(index)
+    if hasattr(downcast, 'hnsw'):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=downcast.hnsw.efSearch)
+    if isinstance(downcast, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return faiss.SearchParameters(sel=selector)
+    return None
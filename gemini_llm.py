@@ -1,12 +1,28 @@
 import google.generativeai as genai
 from config import Config
+import asyncio
 import logging
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterator, Optional
+from llm_scheduler import (
+    PRIORITY_INTERACTIVE, QueueTimeoutError, QuotaScheduler, estimate_tokens,
+    get_quota_scheduler, is_rate_limit_error,
+)
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
 
 class GeminiLLM:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, model=None, scheduler: Optional[QuotaScheduler] = None):
+        """`model` cho phép thay Gemini bằng đối tượng có `generate_content` (ví dụ RateLimitedStubModel)"""
+        self.scheduler = scheduler or get_quota_scheduler()
+        if model is not None:
+            self.api_key = api_key
+            self.model = model
+            return
         self.api_key = api_key or getattr(Config, "GEMINI_API_KEY", None)
         if not self.api_key:
             raise ValueError("Chưa cấu hình GEMINI_API_KEY!")
@@ -16,18 +32,209 @@ class GeminiLLM:
         except:
             raise Exception("Không thể khởi tạo Gemini model. Vui lòng kiểm tra API key và kết nối mạng.")
 
-    def generate(self, prompt: str) -> str:
+    def _raise_api_error(self, e: Exception):
+        error_msg = str(e)
+        if isinstance(e, QueueTimeoutError) or is_rate_limit_error(e):
+            logger.error(f"❌ Lỗi quota Gemini API: {error_msg}")
+            raise Exception("Đã vượt quá giới hạn quota Gemini API. Vui lòng thử lại sau hoặc nâng cấp tài khoản.")
+        else:
+            logger.error(f"❌ Lỗi Gemini API: {error_msg}")
+            raise e
+
+    def _generate_now(self, prompt: str) -> str:
+        logger.info("🧠 Đang gọi Gemini API...")
+        response = self.model.generate_content(prompt)
+        result_text = response.text if hasattr(response, 'text') else str(response)
+        logger.info(f"✅ Gemini trả về: {result_text[:100]}...")
+        return result_text
+
+    def generate(self, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+        """Sinh câu trả lời qua scheduler quota (prompt giống hệt đang chạy sẽ dùng chung kết quả)"""
         try:
-            logger.info("🧠 Đang gọi Gemini API...")
-            response = self.model.generate_content(prompt)
-            result_text = response.text if hasattr(response, 'text') else str(response)
-            logger.info(f"✅ Gemini trả về: {result_text[:100]}...")
-            return result_text
+            with tracer.span('llm.generate'):
+                return self.scheduler.submit(
+                    self.scheduler.prompt_key(prompt),
+                    lambda: self._generate_now(prompt),
+                    priority=priority,
+                    cost=estimate_tokens(prompt),
+                )
         except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "quota" in error_msg.lower():
-                logger.error("❌ Lỗi quota Gemini API")
-                raise Exception("Đã vượt quá giới hạn quota Gemini API. Vui lòng thử lại sau hoặc nâng cấp tài khoản.")
-            else:
-                logger.error(f"❌ Lỗi Gemini API: {error_msg}")
-                raise e
+            self._raise_api_error(e)
+
+    async def _agenerate_now(self, prompt: str) -> str:
+        logger.info("🧠 Đang gọi Gemini API (async)...")
+        if hasattr(self.model, 'generate_content_async'):
+            response = await self.model.generate_content_async(prompt)
+        else:
+            response = await asyncio.to_thread(self.model.generate_content, prompt)
+        result_text = response.text if hasattr(response, 'text') else str(response)
+        logger.info(f"✅ Gemini trả về: {result_text[:100]}...")
+        return result_text
+
+    async def agenerate(self, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+        """Bản async của `generate`: I/O bất đồng bộ, chờ quota không chặn event loop"""
+        try:
+            with tracer.span('llm.generate'):
+                return await self.scheduler.asubmit(
+                    self.scheduler.prompt_key(prompt),
+                    lambda: self._agenerate_now(prompt),
+                    priority=priority,
+                    cost=estimate_tokens(prompt),
+                )
+        except Exception as e:
+            self._raise_api_error(e)
+
+    async def _astream_now(self, prompt: str) -> AsyncIterator[str]:
+        logger.info("🧠 Đang gọi Gemini API (async streaming)...")
+        if hasattr(self.model, 'generate_content_async'):
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = getattr(chunk, 'text', '')
+                if text:
+                    yield text
+            return
+        # Model không có API async: đọc luồng đồng bộ trong thread, từng đoạn một
+        done = object()
+        chunks = iter(await asyncio.to_thread(self.model.generate_content, prompt, stream=True))
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+    async def agenerate_stream(self, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[str]:
+        """Bản async của `generate_stream` (cùng cách gộp prompt và thử lại lỗi 429)"""
+        try:
+            async for text in self.scheduler.asubmit_stream(
+                self.scheduler.prompt_key(prompt),
+                lambda: self._astream_now(prompt),
+                priority=priority,
+                cost=estimate_tokens(prompt),
+            ):
+                yield text
+        except Exception as e:
+            self._raise_api_error(e)
+
+    def _stream_now(self, prompt: str) -> Iterator[str]:
+        logger.info("🧠 Đang gọi Gemini API (streaming)...")
+        for chunk in self.model.generate_content(prompt, stream=True):
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+    def generate_stream(self, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> Iterator[str]:
+        """Sinh câu trả lời dạng luồng: trả về từng đoạn văn bản ngay khi Gemini gửi về
+
+        Đi qua scheduler quota như `generate`: prompt giống hệt đang stream dùng
+        chung một lời gọi (các đoạn được phát lại cho mọi request), lỗi 429 trước
+        đoạn đầu tiên được thử lại; sau khi đã stream một phần thì lỗi được báo
+        lên cho người gọi.
+        """
+        try:
+            yield from self.scheduler.submit_stream(
+                self.scheduler.prompt_key(prompt),
+                lambda: self._stream_now(prompt),
+                priority=priority,
+                cost=estimate_tokens(prompt),
+            )
+        except Exception as e:
+            self._raise_api_error(e)
+
+    def get_statistics(self):
+        return self.scheduler.get_statistics()
+
+
+class RateLimitedStubModel:
+    """Stub cục bộ thay cho Gemini model: trả lời sau `latency_ms` và báo lỗi 429
+    khi vượt quá `requests_per_minute` trong cửa sổ trượt 60 giây"""
+
+    def __init__(self, requests_per_minute: int = 10, latency_ms: float = 50, chunks: int = 4):
+        self.requests_per_minute = requests_per_minute
+        self.latency_ms = latency_ms
+        self.chunks = max(1, chunks)
+        self.calls = 0
+        self.rejected = 0
+        self._accepted = deque()
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            while self._accepted and now - self._accepted[0] >= 60:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.requests_per_minute:
+                self.rejected += 1
+                raise Exception("429 Resource exhausted: quota exceeded (stub)")
+            self._accepted.append(now)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self._admit()
+        text = f"Stub trả lời cho prompt dài {len(prompt)} ký tự."
+        if not stream:
+            time.sleep(self.latency_ms / 1000)
+            return type("StubResponse", (), {"text": text})()
+        return self._stream(text)
+
+    def _stream(self, text: str):
+        size = -(-len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency_ms / 1000 / self.chunks)
+            yield type("StubChunk", (), {"text": text[start:start + size]})()
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self._admit()
+        text = f"Stub trả lời cho prompt dài {len(prompt)} ký tự."
+        if not stream:
+            await asyncio.sleep(self.latency_ms / 1000)
+            return type("StubResponse", (), {"text": text})()
+        return self._astream(text)
+
+    async def _astream(self, text: str):
+        size = -(-len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            await asyncio.sleep(self.latency_ms / 1000 / self.chunks)
+            yield type("StubChunk", (), {"text": text[start:start + size]})()
+
+
+class FakeLLM:
+    """LLM giả lập chạy cục bộ để kiểm thử: trả lời từ prompt theo từng đoạn có độ trễ"""
+
+    def __init__(self, first_token_ms: float = Config.FAKE_LLM_FIRST_TOKEN_MS,
+                 chunk_ms: float = Config.FAKE_LLM_CHUNK_MS, chunk_words: int = 3):
+        self.first_token_ms = first_token_ms
+        self.chunk_ms = chunk_ms
+        self.chunk_words = max(1, chunk_words)
+
+    def _answer(self, prompt: str) -> str:
+        question = prompt.rsplit("Câu hỏi:", 1)[-1].split("\n", 1)[0].strip()
+        return f"(Trả lời giả lập) Câu hỏi \"{question}\" đã được xử lý dựa trên các thông tin tham khảo."
+
+    def generate(self, prompt: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+        # `priority` chỉ để cùng giao diện với GeminiLLM (không có hàng đợi quota)
+        return "".join(self.generate_stream(prompt))
+
+    def _chunks(self, prompt: str) -> Iterator[str]:
+        words = self._answer(prompt).split(" ")
+        for start in range(0, len(words), self.chunk_words):
+            text = " ".join(words[start:start + self.chunk_words])
+            yield text if start + self.chunk_words >= len(words) else text + " "
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        time.sleep(self.first_token_ms / 1000)
+        for i, text in enumerate(self._chunks(prompt)):
+            if i:
+                time.sleep(self.chunk_ms / 1000)
+            yield text
+
+    async def agenerate(self, prompt: str) -> str:
+        return "".join([text async for text in self.agenerate_stream(prompt)])
+
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i, text in enumerate(self._chunks(prompt)):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            yield text
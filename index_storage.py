@@ -0,0 +1,510 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.faiss'
+TEXTS_FILE = 'docstore_texts.bin'
+OFFSETS_FILE = 'docstore_offsets.npy'
+FILE_INDEX_FILE = 'docstore_file_index.npy'
+CHUNK_ID_FILE = 'docstore_chunk_id.npy'
+CHUNK_HASH_FILE = 'docstore_chunk_hash.npy'
+FILES_FILE = 'docstore_files.json'
+LEGACY_PICKLE_FILE = 'index.pkl'
+STATS_FILE = 'stats_catalog.json'
+PRECOMPUTED_FILE = 'precomputed_answers.json'
+# File con trỏ tới thư mục thế hệ (generation) đang được phục vụ
+CURRENT_FILE = 'CURRENT'
+GENERATION_PREFIX = 'gen-'
+
+# Metadata cấp file: lưu một lần trong bảng file thay vì lặp lại ở mỗi chunk
+FILE_FIELDS = [
+    'source', 'file_hash', 'total_chunks', 'load_time', 'file_size', 'file_type',
+    'file_title', 'file_year', 'file_category', 'processing_timestamp',
+]
+
+# Các trường của một kết quả tìm kiếm và giá trị mặc định
+RESULT_DEFAULTS = {
+    'content': '',
+    'source': 'Unknown',
+    'score': 0.0,
+    'chunk_id': 0,
+    'total_chunks': 0,
+    'chunk_hash': '',
+    'file_hash': '',
+    'load_time': '',
+    'file_size': 0,
+    'chunk_size': 0,
+    'file_type': 'unknown',
+    'file_title': '',
+    'file_year': 'unknown',
+    'file_category': 'general',
+    'processing_timestamp': 0,
+}
+
+
+class ColumnarDocstore(Docstore):
+    """Docstore dạng cột, chỉ đọc, không dùng pickle.
+
+    - Bảng file (JSON): metadata cấp file, mỗi file một dòng.
+    - Cột theo chunk (numpy, memory-map): offset văn bản, chỉ số file,
+      chunk_id, chunk_hash.
+    - Nội dung chunk: một file UTF-8 liền mạch, được memory-map.
+
+    Document/metadata chỉ được tạo khi thực sự cần (lazy).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self._file_index = np.load(os.path.join(path, FILE_INDEX_FILE), mmap_mode='r')
+        self._chunk_id = np.load(os.path.join(path, CHUNK_ID_FILE), mmap_mode='r')
+        self._chunk_hash = np.load(os.path.join(path, CHUNK_HASH_FILE), mmap_mode='r')
+
+        texts_path = os.path.join(path, TEXTS_FILE)
+        if os.path.getsize(texts_path) > 0:
+            self._texts = np.memmap(texts_path, dtype=np.uint8, mode='r')
+        else:
+            self._texts = np.zeros(0, dtype=np.uint8)
+
+        with open(os.path.join(path, FILES_FILE), 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        self.files: List[Dict] = table['files']
+        self._explicit_ids: Optional[List[str]] = table.get('ids')
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._file_index)
+
+    def id_at(self, position: int) -> str:
+        if self._explicit_ids is not None:
+            return self._explicit_ids[position]
+        file_key = self.files[int(self._file_index[position])]['file_key']
+        return f"{file_key}-{int(self._chunk_id[position])}"
+
+    @property
+    def ids(self) -> List[str]:
+        return [self.id_at(i) for i in range(len(self))]
+
+    def text_at(self, position: int) -> str:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return self._texts[start:end].tobytes().decode('utf-8')
+
+    def field(self, position: int, key: str):
+        """Lấy một trường của chunk mà không dựng cả Document"""
+        if key == 'content':
+            return self.text_at(position)
+        if key == 'chunk_id':
+            return int(self._chunk_id[position])
+        if key == 'chunk_hash':
+            return self._chunk_hash[position].decode('ascii')
+        if key == 'chunk_size':
+            return len(self.text_at(position))
+        file_row = self.files[int(self._file_index[position])]
+        return file_row.get(key, RESULT_DEFAULTS.get(key))
+
+    def chunk_mask(self, filters: Dict[str, Sequence[str]]) -> np.ndarray:
+        """Mặt nạ bool theo chunk cho bộ lọc metadata cấp file (ví dụ file_category, file_year)"""
+        file_mask = np.array(
+            [all(str(row.get(key)) in values for key, values in filters.items()) for row in self.files],
+            dtype=bool,
+        )
+        if not len(file_mask):
+            return np.zeros(len(self), dtype=bool)
+        return file_mask[np.asarray(self._file_index)]
+
+    def metadata_at(self, position: int) -> Dict:
+        file_row = self.files[int(self._file_index[position])]
+        metadata = {key: file_row.get(key) for key in FILE_FIELDS}
+        metadata.update({
+            'chunk_id': self.field(position, 'chunk_id'),
+            'chunk_hash': self.field(position, 'chunk_hash'),
+            'chunk_size': self.field(position, 'chunk_size'),
+        })
+        return metadata
+
+    def document_at(self, position: int) -> Document:
+        return Document(page_content=self.text_at(position), metadata=self.metadata_at(position))
+
+    def search(self, search: str) -> Union[str, Document]:
+        if self._positions is None:
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+    def to_in_memory(self) -> InMemoryDocstore:
+        """Nạp toàn bộ vào InMemoryDocstore (dùng khi cần thêm/xóa document)"""
+        return InMemoryDocstore({self.id_at(i): self.document_at(i) for i in range(len(self))})
+
+
+class _DocumentFields:
+    """Adapter cho Document thông thường (docstore trong bộ nhớ) có cùng giao diện `field`"""
+
+    __slots__ = ('doc',)
+
+    def __init__(self, doc: Document):
+        self.doc = doc
+
+    def field(self, position: int, key: str):
+        if key == 'content':
+            return self.doc.page_content
+        return self.doc.metadata.get(key, RESULT_DEFAULTS.get(key))
+
+
+class SearchResult(Mapping):
+    """Kết quả tìm kiếm dạng Mapping, chỉ đọc dữ liệu từ docstore khi trường được truy cập"""
+
+    __slots__ = ('_store', '_position', 'score')
+
+    def __init__(self, store, position: int, score: float):
+        self._store = store
+        self._position = position
+        self.score = score
+
+    @classmethod
+    def from_document(cls, doc: Document, score: float) -> "SearchResult":
+        return cls(_DocumentFields(doc), 0, score)
+
+    def __getitem__(self, key: str):
+        if key == 'score':
+            return self.score
+        if key not in RESULT_DEFAULTS:
+            raise KeyError(key)
+        return self._store.field(self._position, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(RESULT_DEFAULTS)
+
+    def __len__(self) -> int:
+        return len(RESULT_DEFAULTS)
+
+    def __repr__(self) -> str:
+        return f"SearchResult(source={self['source']!r}, chunk_id={self['chunk_id']}, score={self.score:.4f})"
+
+
+class _LazyIdMap(Mapping):
+    """Ánh xạ vị trí trong index -> docstore id, tính khi cần thay vì giữ dict"""
+
+    def __init__(self, docstore: ColumnarDocstore):
+        self._docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self._docstore):
+            raise KeyError(position)
+        return self._docstore.id_at(position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._docstore)))
+
+    def __len__(self) -> int:
+        return len(self._docstore)
+
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def file_key(source: str, file_hash: str) -> str:
+    """Khóa file dùng để tạo docstore id của chunk (giống VectorStore._document_ids)"""
+    return hashlib.md5(f"{source}:{file_hash}".encode()).hexdigest()[:16]
+
+
+class ColumnarDocstoreWriter:
+    """Ghi docstore dạng cột theo từng batch, không giữ Document/metadata trong bộ nhớ.
+
+    Nội dung chunk được ghi thẳng xuống file tạm; các cột theo chunk là mảng
+    số gọn. `path` thường là thư mục thế hệ mới (`new_generation`), chỉ được
+    phục vụ sau khi cả index, BM25 và catalog đã ghi xong (`publish_generation`).
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._texts_tmp = os.path.join(path, f"{TEXTS_FILE}.tmp")
+        self._texts = open(self._texts_tmp, 'wb')
+        self._offsets = array('q', [0])
+        self._file_index = array('i')
+        self._chunk_id = array('i')
+        self._chunk_hash = bytearray()
+        self.files: List[Dict] = []
+        self._file_positions: Dict[str, int] = {}
+        # Chỉ giữ các id không suy ra được từ (file, chunk_id)
+        self._explicit_ids: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._file_index)
+
+    def add(self, text: str, metadata: Dict, doc_id: Optional[str] = None):
+        source = metadata.get('source', 'Unknown')
+        position = self._file_positions.get(source)
+        if position is None:
+            position = self._file_positions[source] = len(self.files)
+            row = {key: metadata.get(key, RESULT_DEFAULTS.get(key, '')) for key in FILE_FIELDS}
+            row['source'] = source
+            row['file_key'] = file_key(source, metadata.get('file_hash', ''))
+            self.files.append(row)
+        chunk_id = int(metadata.get('chunk_id', 0))
+        if doc_id is not None and doc_id != f"{self.files[position]['file_key']}-{chunk_id}":
+            self._explicit_ids[len(self)] = doc_id
+
+        encoded = text.encode('utf-8')
+        self._texts.write(encoded)
+        self._offsets.append(self._offsets[-1] + len(encoded))
+        self._file_index.append(position)
+        self._chunk_id.append(chunk_id)
+        self._chunk_hash += str(metadata.get('chunk_hash', '')).encode('ascii')[:8].ljust(8, b'\0')
+
+    def add_batch(self, texts: Sequence[str], metadatas: Sequence[Dict], ids: Optional[Sequence[str]] = None):
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            self.add(text, metadata, ids[i] if ids is not None else None)
+
+    def commit(self):
+        """Đóng file nội dung và ghi các cột, bảng file (mỗi file được thay thế nguyên tử)"""
+        self._texts.close()
+        os.replace(self._texts_tmp, os.path.join(self.path, TEXTS_FILE))
+
+        def write_array(values: np.ndarray):
+            def write(tmp_path: str):
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, values)
+            return write
+
+        n_chunks = len(self)
+        file_index = np.frombuffer(self._file_index, dtype=np.int32) if n_chunks else np.zeros(0, dtype=np.int32)
+        chunk_id = np.frombuffer(self._chunk_id, dtype=np.int32) if n_chunks else np.zeros(0, dtype=np.int32)
+        chunk_hash = np.frombuffer(bytes(self._chunk_hash), dtype='S8') if n_chunks else np.zeros(0, dtype='S8')
+        table = {'format_version': 2, 'files': self.files}
+        if self._explicit_ids:
+            table['ids'] = [
+                self._explicit_ids.get(i) or f"{self.files[file_index[i]]['file_key']}-{chunk_id[i]}"
+                for i in range(n_chunks)
+            ]
+
+        def write_files(tmp_path: str):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False)
+
+        _write_atomic(os.path.join(self.path, OFFSETS_FILE), write_array(np.frombuffer(self._offsets, dtype=np.int64)))
+        _write_atomic(os.path.join(self.path, FILE_INDEX_FILE), write_array(file_index))
+        _write_atomic(os.path.join(self.path, CHUNK_ID_FILE), write_array(chunk_id))
+        _write_atomic(os.path.join(self.path, CHUNK_HASH_FILE), write_array(chunk_hash))
+        _write_atomic(os.path.join(self.path, FILES_FILE), write_files)
+
+    def abort(self):
+        self._texts.close()
+        if os.path.exists(self._texts_tmp):
+            os.remove(self._texts_tmp)
+
+
+def save_faiss_index(index: faiss.Index, path: str):
+    """Lưu FAISS index (sau docstore) và xóa index định dạng pickle cũ nếu còn"""
+    _write_atomic(os.path.join(path, INDEX_FILE), lambda tmp: faiss.write_index(index, tmp))
+    legacy_path = os.path.join(path, LEGACY_PICKLE_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def stored_document(vector_db: FAISS, position: int) -> Document:
+    """Document ở vị trí `position` của index đã tải (docstore dạng cột hoặc docstore LangChain)"""
+    if isinstance(vector_db.docstore, ColumnarDocstore):
+        return vector_db.docstore.document_at(position)
+    return vector_db.docstore.search(vector_db.index_to_docstore_id[position])
+
+
+def save_index(vector_db: FAISS, path: str):
+    """Lưu FAISS index và docstore dạng cột, không dùng pickle, có thể memory-map"""
+    writer = ColumnarDocstoreWriter(path)
+    try:
+        for i in range(len(vector_db.index_to_docstore_id)):
+            doc = stored_document(vector_db, i)
+            writer.add(doc.page_content, doc.metadata, vector_db.index_to_docstore_id[i])
+        writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    save_faiss_index(vector_db.index, path)
+
+
+def build_stats_catalog(path: str) -> Dict:
+    """Thống kê chính xác của index đã lưu (tính từ bảng file và cột chỉ số file, không cần tìm kiếm)"""
+    with open(os.path.join(path, FILES_FILE), 'r', encoding='utf-8') as f:
+        files = json.load(f)['files']
+    file_index = np.load(os.path.join(path, FILE_INDEX_FILE), mmap_mode='r')
+    chunk_counts = np.bincount(np.asarray(file_index), minlength=len(files)) if len(files) else np.zeros(0)
+
+    categories: Dict[str, int] = {}
+    years: Dict[str, int] = {}
+    file_rows = []
+    for row, chunks in zip(files, chunk_counts.tolist()):
+        category = str(row.get('file_category') or RESULT_DEFAULTS['file_category'])
+        year = str(row.get('file_year') or RESULT_DEFAULTS['file_year'])
+        categories[category] = categories.get(category, 0) + chunks
+        years[year] = years.get(year, 0) + chunks
+        file_rows.append({
+            'source': row.get('source'),
+            'file_category': category,
+            'file_year': year,
+            'file_type': row.get('file_type'),
+            'file_size': int(row.get('file_size') or 0),
+            'chunks': chunks,
+        })
+
+    sizes = [row['file_size'] for row in file_rows if row['file_size'] > 0]
+    storage_files = [INDEX_FILE, TEXTS_FILE, OFFSETS_FILE, FILE_INDEX_FILE, CHUNK_ID_FILE, CHUNK_HASH_FILE, FILES_FILE]
+    return {
+        'format_version': 1,
+        'total_vectors': int(len(file_index)),
+        'total_files': len(file_rows),
+        'categories': categories,
+        'years': years,
+        'files': file_rows,
+        'total_file_size': sum(sizes),
+        'avg_file_size': sum(sizes) // len(sizes) if sizes else 0,
+        'storage_bytes': sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in storage_files if os.path.exists(os.path.join(path, name))
+        ),
+    }
+
+
+def save_stats_catalog(path: str, catalog: Dict):
+    def write(tmp_path: str):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+    _write_atomic(os.path.join(path, STATS_FILE), write)
+
+
+def load_stats_catalog(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, STATS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_precomputed_answers(path: str, payload: Dict):
+    def write(tmp_path: str):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.makedirs(path, exist_ok=True)
+    _write_atomic(os.path.join(path, PRECOMPUTED_FILE), write)
+
+
+def load_precomputed_answers(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, PRECOMPUTED_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_generation(path: str) -> str:
+    """Thư mục chứa bản index đang được phục vụ (theo file CURRENT; bố cục cũ không có CURRENT: chính `path`)
+
+    Người đọc chỉ nên gọi hàm này một lần rồi tải docstore, index, BM25 và
+    catalog từ cùng thư mục trả về, để không ghép các file của hai lần xây dựng.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return path
+    return os.path.join(path, name) if name else path
+
+
+def new_generation(path: str) -> str:
+    """Tạo thư mục cho một lần xây dựng mới; chưa được phục vụ cho đến khi `publish_generation`"""
+    name = f"{GENERATION_PREFIX}{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    generation = os.path.join(path, name)
+    os.makedirs(generation)
+    return generation
+
+
+def publish_generation(path: str, generation: str):
+    """Chuyển CURRENT sang `generation` trong một bước (os.replace) rồi dọn các thế hệ cũ
+
+    Thế hệ liền trước được giữ lại cho các process vừa đọc CURRENT cũ và đang tải dở.
+    """
+    previous = current_generation(path)
+
+    def write(tmp_path: str):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(generation))
+
+    _write_atomic(os.path.join(path, CURRENT_FILE), write)
+    keep = {os.path.basename(generation), os.path.basename(previous)}
+    for name in os.listdir(path):
+        if name.startswith(GENERATION_PREFIX) and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def discard_generation(path: str, generation: str):
+    """Xóa thư mục thế hệ của một lần xây dựng bị lỗi (không bao giờ xóa thế hệ đang được phục vụ)"""
+    if os.path.abspath(generation) != os.path.abspath(current_generation(path)):
+        shutil.rmtree(generation, ignore_errors=True)
+
+
+def index_exists(path: str) -> bool:
+    generation = current_generation(path)
+    return os.path.exists(os.path.join(generation, INDEX_FILE)) and (
+        os.path.exists(os.path.join(generation, FILES_FILE))
+        or os.path.exists(os.path.join(generation, LEGACY_PICKLE_FILE))
+    )
+
+
+def load_index(path: str, embeddings: Embeddings, mutable: bool = False) -> Optional[FAISS]:
+    """Tải index đã lưu trong thư mục `path` (thư mục thế hệ, xem `current_generation`)
+
+    Mặc định vector được memory-map chỉ đọc (khởi động gần như tức thì, nhiều
+    process cùng dùng chung page cache). Với `mutable=True`, index và docstore
+    được nạp hẳn vào RAM để có thể thêm/xóa vector.
+    """
+    if not os.path.exists(os.path.join(path, FILES_FILE)):
+        if not os.path.exists(os.path.join(path, LEGACY_PICKLE_FILE)):
+            return None
+        logger.warning("Đang tải index định dạng cũ (pickle); hãy xây dựng lại để dùng định dạng memory-map")
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    index_path = os.path.join(path, INDEX_FILE)
+    if mutable:
+        index = faiss.read_index(index_path)
+    else:
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(index_path, flags)
+
+    docstore = ColumnarDocstore(path)
+    if len(docstore) != index.ntotal:
+        raise ValueError(
+            f"Index ({index.ntotal} vector) và docstore ({len(docstore)} chunk) không khớp tại {path}"
+        )
+    index_to_docstore_id = _LazyIdMap(docstore)
+    if mutable:
+        docstore = docstore.to_in_memory()
+        index_to_docstore_id = dict(index_to_docstore_id)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
@@ -0,0 +1,553 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from config import Config
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Độ ưu tiên: số nhỏ hơn được phục vụ trước
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class QueueTimeoutError(Exception):
+    """Request chờ trong hàng đợi quá lâu (hệ thống đang quá tải quota)"""
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Nhận diện lỗi 429/quota từ Gemini (hoặc stub mô phỏng)"""
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource exhausted" in message
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Ước lượng số token của prompt cộng phần dự trữ cho câu trả lời"""
+    return len(prompt) // 4 + 1 + Config.GEMINI_OUTPUT_TOKEN_RESERVE
+
+
+class _TokenBucket:
+    """Bucket nạp lại đều theo ngân sách mỗi phút (0 = không giới hạn)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Số giây cần chờ để đủ `amount` (0 nếu có thể dùng ngay)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # Request lớn hơn cả bucket chỉ cần bucket đầy
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float, now: float):
+        if self.capacity > 0:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+
+class _StreamBroadcast:
+    """Các đoạn văn bản của một lời gọi streaming, phát lại cho mọi request cùng prompt (đồng bộ lẫn async)"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _publish(self, text: Optional[str] = None, done: bool = False, error: Optional[BaseException] = None):
+        with self._condition:
+            if text is not None:
+                self.chunks.append(text)
+            if done:
+                self.done = True
+                self.error = error
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop của người chờ đã đóng
+                pass
+
+    def push(self, text: str):
+        self._publish(text=text)
+
+    def finish(self, error: Optional[BaseException] = None):
+        self._publish(done=True, error=error)
+
+    def follow(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                chunks = self.chunks[position:]
+                done, error = self.done, self.error
+            position += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def afollow(self) -> AsyncIterator[str]:
+        position = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            event = None
+            with self._condition:
+                chunks = self.chunks[position:]
+                done, error = self.done, self.error
+                if not chunks and not done:
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+            if event is not None:
+                await event.wait()
+                continue
+            position += len(chunks)
+            for text in chunks:
+                yield text
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class QuotaScheduler:
+    """Bộ lập lịch request LLM theo quota.
+
+    - Ngân sách request/phút và token/phút (token bucket)
+    - Giới hạn số request đồng thời
+    - Hàng đợi ưu tiên (FIFO trong cùng độ ưu tiên)
+    - Thử lại theo lũy thừa có jitter khi gặp 429; cả hàng đợi tạm dừng trong thời gian đó
+    - Gộp các prompt giống hệt đang được xử lý thành một lời gọi (streaming:
+      các đoạn văn bản được phát lại cho mọi request cùng prompt)
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = Config.GEMINI_RPM,
+        tokens_per_minute: float = Config.GEMINI_TPM,
+        max_concurrency: int = Config.GEMINI_MAX_CONCURRENCY,
+        max_retries: int = Config.GEMINI_MAX_RETRIES,
+        retry_base_seconds: float = Config.GEMINI_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = Config.GEMINI_RETRY_MAX_SECONDS,
+        queue_timeout_seconds: float = Config.GEMINI_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._paused_until = 0.0
+        self._in_flight: Dict[str, Future] = {}
+        self._streams: Dict[str, _StreamBroadcast] = {}
+        # Coroutine đang chờ đến lượt (event loop, event), được đánh thức cùng các luồng
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._stats = {
+            'enqueued': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'coalesced': 0,
+            'queue_timeouts': 0,
+            'max_queue_depth': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _notify_waiters(self):
+        """Gọi khi đang giữ lock: đánh thức các luồng và coroutine đang chờ đến lượt"""
+        self._condition.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop của coroutine đã đóng
+                pass
+
+    def _enqueue(self, priority: int) -> Tuple[Tuple[int, int], float, Optional[float]]:
+        ticket = (priority, next(self._sequence))
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + self.queue_timeout_seconds if self.queue_timeout_seconds > 0 else None
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self._stats['enqueued'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._queue))
+        return ticket, enqueued_at, deadline
+
+    def _dequeue(self, ticket: Tuple[int, int]):
+        """Bỏ ticket khỏi hàng đợi khi request bị hủy hoặc hết thời gian chờ"""
+        with self._condition:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._notify_waiters()
+
+    def _try_admit(self, ticket: Tuple[int, int], cost: int, priority: int,
+                   enqueued_at: float, deadline: Optional[float]) -> Tuple[bool, Optional[float]]:
+        """Gọi khi đang giữ lock: nhận slot nếu đến lượt và còn quota.
+
+        Trả về (True, 0) khi đã nhận slot, nếu không thì (False, số giây nên chờ
+        trước khi thử lại; None = chờ đến khi được báo).
+        """
+        now = time.monotonic()
+        wait = None
+        if self._queue[0] == ticket and self._running < self.max_concurrency:
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(cost, now),
+            )
+            if wait <= 0:
+                heapq.heappop(self._queue)
+                self._requests.consume(1, now)
+                self._tokens.consume(cost, now)
+                self._running += 1
+                waited = now - enqueued_at
+                self._stats['wait_time_total'] += waited
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+                self._notify_waiters()
+                tracer.record('llm.queue_wait', waited * 1000, priority=priority)
+                return True, 0.0
+        if deadline is not None:
+            remaining = deadline - now
+            if remaining <= 0:
+                self._stats['queue_timeouts'] += 1
+                raise QueueTimeoutError(
+                    f"Request LLM chờ quá {self.queue_timeout_seconds:.0f}s trong hàng đợi"
+                )
+            wait = remaining if wait is None else min(wait, remaining)
+        return False, wait
+
+    def _acquire(self, priority: int, cost: int):
+        """Chờ đến lượt: đứng đầu hàng đợi, còn slot đồng thời và còn quota"""
+        ticket, enqueued_at, deadline = self._enqueue(priority)
+        try:
+            with self._condition:
+                while True:
+                    admitted, wait = self._try_admit(ticket, cost, priority, enqueued_at, deadline)
+                    if admitted:
+                        return
+                    self._condition.wait(timeout=wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+
+    async def _aacquire(self, priority: int, cost: int):
+        """Bản coroutine của `_acquire`: chờ một asyncio.Event được báo khi slot/hàng đợi thay đổi
+        (hoặc đến lúc quota nạp lại) thay vì chặn luồng"""
+        ticket, enqueued_at, deadline = self._enqueue(priority)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                with self._condition:
+                    admitted, wait = self._try_admit(ticket, cost, priority, enqueued_at, deadline)
+                    if admitted:
+                        return
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+
+    def _release(self):
+        with self._condition:
+            self._running -= 1
+            self._notify_waiters()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> Iterator[None]:
+        """Giữ một slot gọi LLM (người gọi tự xử lý việc thử lại)"""
+        self._acquire(priority, cost)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> AsyncIterator[None]:
+        """Bản async của `slot`"""
+        await self._aacquire(priority, cost)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """Thời gian chờ lũy thừa có jitter (50-100% mức trần) cho lần thử lại thứ `attempt` (bắt đầu từ 0)"""
+        cap = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt))
+        return random.uniform(cap / 2, cap)
+
+    def record_rate_limit(self, attempt: int) -> float:
+        """Ghi nhận một lỗi 429: tạm dừng cả hàng đợi trong thời gian backoff"""
+        delay = self.backoff_seconds(attempt)
+        with self._condition:
+            self._stats['rate_limited'] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._notify_waiters()
+        logger.warning(f"⏳ Gemini báo vượt quota, tạm dừng {delay:.1f}s (lần {attempt + 1})")
+        return delay
+
+    def _run_with_retries(self, call: Callable[[], T], priority: int, cost: int) -> T:
+        attempt = 0
+        while True:
+            self._acquire(priority, cost)
+            try:
+                return call()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._count_retry(attempt)
+                attempt += 1
+            finally:
+                self._release()
+
+    async def _arun_with_retries(self, call: Callable[[], Awaitable[T]], priority: int, cost: int) -> T:
+        attempt = 0
+        while True:
+            await self._aacquire(priority, cost)
+            try:
+                return await call()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._count_retry(attempt)
+                attempt += 1
+            finally:
+                self._release()
+
+    def submit(self, key: str, call: Callable[[], T], priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> T:
+        """Chạy `call` theo quota; các lời gọi cùng `key` đang xử lý dùng chung một kết quả"""
+        with self._condition:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self._stats['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._run_with_retries(call, priority, cost)
+            future.set_result(result)
+            with self._condition:
+                self._stats['completed'] += 1
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            with self._condition:
+                self._stats['failed'] += 1
+            raise
+        finally:
+            with self._condition:
+                self._in_flight.pop(key, None)
+
+    async def asubmit(self, key: str, call: Callable[[], Awaitable[T]],
+                      priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> T:
+        """Bản async của `submit`; gộp request với cả lời gọi đồng bộ lẫn bất đồng bộ cùng `key`"""
+        with self._condition:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self._stats['coalesced'] += 1
+        if not owner:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await self._arun_with_retries(call, priority, cost)
+            future.set_result(result)
+            with self._condition:
+                self._stats['completed'] += 1
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            with self._condition:
+                self._stats['failed'] += 1
+            raise
+        finally:
+            with self._condition:
+                self._in_flight.pop(key, None)
+
+    def _count_retry(self, attempt: int):
+        self.record_rate_limit(attempt)
+        with self._condition:
+            self._stats['retries'] += 1
+
+    def _stream_with_retries(self, call: Callable[[], Iterator[str]], priority: int, cost: int) -> Iterator[str]:
+        """Lỗi 429 trước đoạn đầu tiên được thử lại; sau khi đã stream một phần thì báo lỗi lên"""
+        attempt = 0
+        while True:
+            streamed = False
+            self._acquire(priority, cost)
+            try:
+                for text in call():
+                    streamed = True
+                    yield text
+                return
+            except Exception as e:
+                if streamed or not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._count_retry(attempt)
+                attempt += 1
+            finally:
+                self._release()
+
+    async def _astream_with_retries(self, call: Callable[[], AsyncIterator[str]],
+                                    priority: int, cost: int) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            streamed = False
+            await self._aacquire(priority, cost)
+            try:
+                async for text in call():
+                    streamed = True
+                    yield text
+                return
+            except Exception as e:
+                if streamed or not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._count_retry(attempt)
+                attempt += 1
+            finally:
+                self._release()
+
+    def _join_stream(self, key: str) -> Tuple[_StreamBroadcast, bool]:
+        """Luồng đang chạy cho `key` (người đến sau) hoặc luồng mới do người gọi này chạy"""
+        with self._condition:
+            broadcast = self._streams.get(key)
+            if broadcast is not None:
+                self._stats['coalesced'] += 1
+                return broadcast, False
+            broadcast = self._streams[key] = _StreamBroadcast()
+            return broadcast, True
+
+    def _finish_stream(self, key: str, broadcast: _StreamBroadcast, error: Optional[BaseException]):
+        with self._condition:
+            self._streams.pop(key, None)
+            self._stats['failed' if error is not None else 'completed'] += 1
+        if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            # Người gọi đầu tiên ngắt kết nối: những request đang theo dõi nhận lỗi thay vì chờ mãi
+            error = RuntimeError("Luồng trả lời bị hủy giữa chừng")
+        broadcast.finish(error)
+
+    def submit_stream(self, key: str, call: Callable[[], Iterator[str]],
+                      priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> Iterator[str]:
+        """Bản streaming của `submit`: request cùng `key` đang stream nhận lại các đoạn văn bản của lời gọi đó"""
+        broadcast, owner = self._join_stream(key)
+        if not owner:
+            yield from broadcast.follow()
+            return
+
+        stream = self._stream_with_retries(call, priority, cost)
+        error: Optional[BaseException] = None
+        try:
+            for text in stream:
+                broadcast.push(text)
+                yield text
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            stream.close()
+            self._finish_stream(key, broadcast, error)
+
+    async def asubmit_stream(self, key: str, call: Callable[[], AsyncIterator[str]],
+                             priority: int = PRIORITY_INTERACTIVE, cost: int = 1) -> AsyncIterator[str]:
+        """Bản async của `submit_stream` (gộp với cả request đồng bộ lẫn bất đồng bộ cùng `key`)"""
+        broadcast, owner = self._join_stream(key)
+        if not owner:
+            async for text in broadcast.afollow():
+                yield text
+            return
+
+        stream = self._astream_with_retries(call, priority, cost)
+        error: Optional[BaseException] = None
+        try:
+            async for text in stream:
+                broadcast.push(text)
+                yield text
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            await stream.aclose()
+            self._finish_stream(key, broadcast, error)
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def get_statistics(self) -> Dict:
+        """Độ sâu hàng đợi, thời gian chờ và bộ đếm thử lại/gộp request"""
+        with self._condition:
+            stats = dict(self._stats)
+            queue_depth = len(self._queue)
+            running = self._running
+            in_flight = len(self._in_flight) + len(self._streams)
+            paused_for = max(0.0, self._paused_until - time.monotonic())
+        admitted = stats['enqueued'] - stats['queue_timeouts'] - queue_depth
+        wait_total = stats.pop('wait_time_total')
+        wait_max = stats.pop('wait_time_max')
+        return {
+            **stats,
+            'queue_depth': queue_depth,
+            'running': running,
+            'in_flight_prompts': in_flight,
+            'paused_for_seconds': round(paused_for, 2),
+            'avg_wait_ms': round(wait_total / admitted * 1000, 2) if admitted > 0 else 0,
+            'max_wait_ms': round(wait_max * 1000, 2),
+            'max_concurrency': self.max_concurrency,
+        }
+
+
+_scheduler: Optional[QuotaScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_quota_scheduler() -> QuotaScheduler:
+    """Scheduler dùng chung cho toàn process (quota Gemini tính theo API key, không theo bot)"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = QuotaScheduler()
+    return _scheduler
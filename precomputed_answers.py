@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Câu trả lời dựng sẵn cho các câu hỏi gợi ý và các câu hỏi hay gặp nhất
+
+Các câu hỏi này chiếm phần lớn lượt hỏi nên được trả lời trước (tìm kiếm + LLM
+ưu tiên thấp) và lưu cạnh index; khi người dùng hỏi đúng câu đó (sau chuẩn hóa)
+bot trả lời ngay. Câu trả lời gắn với `index_version`: index được xây dựng lại
+thì bộ câu trả lời cũ bị bỏ qua và được dựng lại.
+
+    python precomputed_answers.py            # dựng lại nếu index đã thay đổi
+    python precomputed_answers.py --force    # luôn dựng lại
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from embedding_cache import normalize_text
+from index_storage import PRECOMPUTED_FILE, load_precomputed_answers, save_precomputed_answers
+
+logger = logging.getLogger(__name__)
+
+
+def question_key(question: str) -> str:
+    return normalize_text(question).lower()
+
+
+class QuestionLog:
+    """Nhật ký số lần hỏi theo câu hỏi (SQLite) để chọn các câu hỏi hay gặp nhất cần dựng sẵn.
+
+    `record` chỉ cộng dồn trong bộ nhớ; một luồng nền ghi các số đếm xuống
+    SQLite mỗi `flush_seconds` giây trong một transaction, nên request chat
+    không phải ghi đĩa và các worker pre-fork hiếm khi tranh lock file.
+    """
+
+    def __init__(self, path: Optional[str] = Config.QUESTION_LOG_PATH,
+                 flush_seconds: float = Config.QUESTION_LOG_FLUSH_SECONDS):
+        self.path = path or None
+        self.flush_seconds = max(0.1, flush_seconds)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # khóa câu hỏi -> [cách viết gần nhất, số lần, thời điểm hỏi gần nhất] chưa ghi xuống đĩa
+        self._pending: Dict[str, List] = {}
+        self._flusher: Optional[threading.Thread] = None
+        if self.path:
+            try:
+                self._open()
+            except Exception as e:
+                logger.warning(f"Không thể mở nhật ký câu hỏi '{self.path}': {e}")
+                self._db = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Nhiều process (chế độ pre-fork) cùng ghi: chờ lock thay vì báo lỗi ngay
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS question_counts (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                last_asked REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def _after_fork(self):
+        """Trong process con sau fork: không dùng lại kết nối SQLite, lock, luồng ghi
+        và các số đếm chưa ghi của process cha (process cha tự ghi phần đó)"""
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pending = {}
+        self._flusher = None
+        if self._db is not None:
+            try:
+                self._open()
+            except Exception as e:
+                logger.warning(f"Không thể mở lại nhật ký câu hỏi '{self.path}': {e}")
+                self._db = None
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run_flusher, name="question-log", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def record(self, question: str):
+        if self._db is None:
+            return
+        key = question_key(question)
+        if not key:
+            return
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [normalize_text(question), 1, time.time()]
+            else:
+                entry[0] = normalize_text(question)
+                entry[1] += 1
+                entry[2] = time.time()
+            self._ensure_flusher()
+
+    def flush(self):
+        """Ghi các số đếm đang gom trong bộ nhớ xuống SQLite (một transaction)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    """INSERT INTO question_counts (question_key, question, count, last_asked)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(question_key) DO UPDATE SET
+                        count = count + excluded.count, question = excluded.question,
+                        last_asked = excluded.last_asked""",
+                    [(key, question, count, last_asked) for key, (question, count, last_asked) in pending.items()],
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Không ghi được nhật ký câu hỏi ({len(pending)} câu hỏi bị bỏ qua): {e}")
+
+    def top(self, n: int) -> List[str]:
+        """`n` câu hỏi được hỏi nhiều nhất (cách viết gần nhất của mỗi câu)"""
+        if self._db is None or n <= 0:
+            return []
+        self.flush()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT question FROM question_counts ORDER BY count DESC, last_asked DESC LIMIT ?", (n,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        if self._db is None:
+            return 0
+        self.flush()
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM question_counts").fetchone()[0]
+
+
+class PrecomputedAnswers:
+    """Bộ câu trả lời dựng sẵn lưu trong thư mục index (`precomputed_answers.json`).
+
+    File được đọc lại khi thay đổi trên đĩa, nên các worker pre-fork thấy ngay
+    bộ câu trả lời do process khác vừa dựng xong.
+    """
+
+    def __init__(self, path: str = Config.VECTOR_DB_PATH):
+        self.path = path
+        self._file = os.path.join(path, PRECOMPUTED_FILE)
+        self._data: Dict = {}
+        self._mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale': 0, 'builds': 0}
+
+    def _reload_if_changed(self) -> Dict:
+        try:
+            mtime_ns = os.stat(self._file).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            if mtime_ns != self._mtime_ns:
+                self._data = (load_precomputed_answers(self.path) or {}) if mtime_ns is not None else {}
+                self._mtime_ns = mtime_ns
+            return self._data
+
+    def is_fresh(self, index_version: Optional[str]) -> bool:
+        data = self._reload_if_changed()
+        return bool(data) and data.get("index_version") == index_version
+
+    def get(self, question: str, index_version: Optional[str]) -> Optional[Dict]:
+        """Câu trả lời dựng sẵn cho đúng câu hỏi này (None nếu không có hoặc đã cũ so với index)"""
+        data = self._reload_if_changed()
+        answer = data.get("answers", {}).get(question_key(question))
+        if answer is None:
+            return None
+        with self._lock:
+            if data.get("index_version") != index_version:
+                self._stats['stale'] += 1
+                return None
+            self._stats['hits'] += 1
+        return answer
+
+    def save(self, answers: Dict[str, Dict], index_version: Optional[str], llm: Optional[str]):
+        save_precomputed_answers(self.path, {
+            "index_version": index_version,
+            "generated_at": time.time(),
+            "llm": llm,
+            "answers": answers,
+        })
+        with self._lock:
+            self._stats['builds'] += 1
+        self._reload_if_changed()
+
+    def get_statistics(self) -> Dict:
+        data = self._reload_if_changed()
+        with self._lock:
+            return {
+                **self._stats,
+                'entries': len(data.get("answers", {})),
+                'index_version': data.get("index_version"),
+                'generated_at': data.get("generated_at"),
+            }
+
+
+_question_log: Optional[QuestionLog] = None
+_question_log_lock = threading.Lock()
+
+
+def get_question_log() -> QuestionLog:
+    """Nhật ký câu hỏi dùng chung trong process (không ghi gì nếu QUESTION_LOG_ENABLED=false)"""
+    global _question_log
+    with _question_log_lock:
+        if _question_log is None:
+            _question_log = QuestionLog(Config.QUESTION_LOG_PATH if Config.QUESTION_LOG_ENABLED else None)
+            atexit.register(_question_log.flush)
+        return _question_log
+
+
+def _reset_after_fork():
+    global _question_log_lock
+    _question_log_lock = threading.Lock()
+    if _question_log is not None:
+        _question_log._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dựng sẵn câu trả lời cho câu hỏi gợi ý và câu hỏi hay gặp nhất")
+    parser.add_argument("--force", action="store_true", help="dựng lại kể cả khi index chưa thay đổi")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from chatbot import TuyenSinhBot
+
+    bot = TuyenSinhBot(background_startup=False, precompute=False)
+    summary = bot.precompute_answers(force=args.force)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
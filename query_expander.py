@@ -1,8 +1,9 @@
 import logging
 import numpy as np
-from typing import List, Dict, Tuple
-from langchain_huggingface import HuggingFaceEmbeddings
-from config import Config
+from typing import List, Dict
+from embedding_engine import get_embedding_engine
+from embedding_cache import get_query_embedding_cache
+from tracing import tracer
 import re
 
 logger = logging.getLogger(__name__)
@@ -11,10 +12,7 @@ logger = logging.getLogger(__name__)
 class QueryExpander:
     def __init__(self):
         """Khởi tạo QueryExpander với embedding model"""
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=Config.EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'}
-        )
+        self.embeddings = get_query_embedding_cache(get_embedding_engine())
         
         # Từ điển từ đồng nghĩa tiếng Việt cho tuyển sinh
         self.synonyms = {
@@ -36,6 +34,13 @@ class QueryExpander:
             'giấy tờ': ['hồ sơ', 'tài liệu', 'văn bản', 'chứng từ']
         }
         
+        # Từ khóa nhận diện loại tài liệu (file_category) để lọc khi tìm kiếm
+        self.category_keywords = {
+            'quota': ['chỉ tiêu', 'quota'],
+            'benchmark': ['điểm chuẩn', 'điểm trúng tuyển', 'điểm sàn'],
+            'regulation': ['quy chế', 'quy định'],
+        }
+
         # Các từ khóa quan trọng trong tuyển sinh
         self.important_keywords = [
             'tuyển sinh', 'chỉ tiêu', 'điểm chuẩn', 'ngành', 'trường',
@@ -44,6 +49,26 @@ class QueryExpander:
             'thời hạn', 'giấy tờ', '2025', '2024', '2023'
         ]
 
+    def parse_filters(self, query: str) -> Dict[str, List[str]]:
+        """Suy ra bộ lọc metadata (năm, loại tài liệu) từ câu hỏi"""
+        query_lower = query.lower()
+        filters = {}
+
+        years = sorted(set(re.findall(r'\b(20[1-3]\d)\b', query_lower)))
+        if years:
+            filters['year'] = years
+
+        categories = [
+            category for category, keywords in self.category_keywords.items()
+            if any(keyword in query_lower for keyword in keywords)
+        ]
+        if categories:
+            filters['category'] = categories
+
+        if filters:
+            logger.info(f"🎯 Bộ lọc suy ra từ '{query}': {filters}")
+        return filters
+
     def expand_with_synonyms(self, query: str) -> List[str]:
         """Mở rộng truy vấn bằng từ đồng nghĩa"""
         expanded_queries = [query]
@@ -77,18 +102,13 @@ class QueryExpander:
     def expand_with_embeddings(self, query: str, context_queries: List[str] = None) -> str:
         """Mở rộng truy vấn bằng embedding trung bình"""
         try:
-            # Tạo embedding cho truy vấn gốc
-            query_embedding = self.embeddings.embed_query(query)
+            # Tạo embedding cho truy vấn gốc và các context queries trong một batch (qua cache)
+            all_embeddings = self.embeddings.embed_queries([query] + list(context_queries or []))
+            query_embedding = all_embeddings[0]
             
             # Nếu có context queries, tính embedding trung bình
             if context_queries:
-                context_embeddings = []
-                for ctx_query in context_queries:
-                    try:
-                        ctx_emb = self.embeddings.embed_query(ctx_query)
-                        context_embeddings.append(ctx_emb)
-                    except Exception as e:
-                        logger.warning(f"Không thể tạo embedding cho: {ctx_query} - {e}")
+                context_embeddings = all_embeddings[1:]
                 
                 if context_embeddings:
                     # Tính embedding trung bình
@@ -135,25 +155,26 @@ class QueryExpander:
 
     def expand_query(self, query: str, method: str = "combined") -> List[str]:
         """Mở rộng truy vấn theo phương pháp được chọn"""
-        if method == "synonyms":
-            return self.expand_with_synonyms(query)
-        elif method == "embeddings":
-            context_queries = self.create_context_queries(query)
-            expanded_query = self.expand_with_embeddings(query, context_queries)
-            return [expanded_query]
-        elif method == "combined":
-            # Kết hợp cả hai phương pháp
-            synonym_queries = self.expand_with_synonyms(query)
-            context_queries = self.create_context_queries(query)
+        with tracer.span('query_expansion', method=method):
+            if method == "synonyms":
+                return self.expand_with_synonyms(query)
+            elif method == "embeddings":
+                context_queries = self.create_context_queries(query)
+                expanded_query = self.expand_with_embeddings(query, context_queries)
+                return [expanded_query]
+            elif method == "combined":
+                # Kết hợp cả hai phương pháp
+                synonym_queries = self.expand_with_synonyms(query)
+                context_queries = self.create_context_queries(query)
             
-            # Thêm context queries vào danh sách
-            all_queries = synonym_queries + context_queries
+                # Thêm context queries vào danh sách
+                all_queries = synonym_queries + context_queries
             
-            # Loại bỏ trùng lặp và giới hạn số lượng
-            unique_queries = list(set(all_queries))
-            return unique_queries[:8]  # Giới hạn 8 truy vấn
-        else:
-            return [query]
+                # Loại bỏ trùng lặp và giới hạn số lượng
+                unique_queries = list(set(all_queries))
+                return unique_queries[:8]  # Giới hạn 8 truy vấn
+            else:
+                return [query]
 
     def get_query_variations(self, query: str) -> Dict[str, List[str]]:
         """Lấy tất cả các biến thể của truy vấn"""
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Lịch sử hội thoại theo phiên (mỗi người dùng một phiên), có giới hạn.
+
+    - Mỗi phiên giữ tối đa `max_history` cặp hỏi/đáp gần nhất
+    - Phiên không hoạt động quá `ttl_seconds` bị xóa
+    - Vượt quá `max_sessions` thì phiên ít dùng nhất bị loại (LRU)
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = Config.SESSION_MAX,
+        ttl_seconds: float = Config.SESSION_TTL_SECONDS,
+        max_history: int = Config.MAX_HISTORY,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_history * 2
+        # session id -> (danh sách tin nhắn, thời điểm hoạt động gần nhất)
+        self._sessions: "OrderedDict[str, List]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'evicted': 0, 'expired': 0}
+
+    def _expire(self, now: float):
+        """Xóa các phiên hết hạn (gọi khi đang giữ lock; phiên cũ nhất nằm ở đầu)"""
+        if self.ttl_seconds <= 0:
+            return
+        while self._sessions:
+            session_id, (_, last_active) = next(iter(self._sessions.items()))
+            if now - last_active <= self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self._stats['expired'] += 1
+
+    def append(self, session_id: str, role: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [[], now]
+                self._stats['created'] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats['evicted'] += 1
+            messages = entry[0]
+            messages.append({"role": role, "content": content})
+            if len(messages) > self.max_messages:
+                del messages[:-self.max_messages]
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+
+    def get_history(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._sessions.get(session_id)
+            return [dict(message) for message in entry[0]] if entry else []
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            self._expire(time.time())
+            return {
+                **self._stats,
+                'active_sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl_seconds': self.ttl_seconds,
+            }
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test cho SemanticAnswerCache (cache câu trả lời theo ngữ nghĩa)
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from answer_cache import SemanticAnswerCache
+
+
+def _vector(*values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_similar_question_hits():
+    """Câu hỏi có embedding đủ gần dùng lại câu trả lời đã lưu"""
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=0, max_entries=10)
+    cache.store("Học phí ngành Luật?", _vector(1, 0, 0), {"response": "A"}, index_version="v1")
+
+    hit = cache.lookup("học phí ngành luật", _vector(0.99, 0.05, 0), index_version="v1")
+    assert hit is not None and hit["response"] == "A"
+    assert cache.lookup("Ký túc xá?", _vector(0, 1, 0), index_version="v1") is None
+
+    stats = cache.get_statistics()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_different_numbers_miss():
+    """Hai câu hỏi chỉ khác năm không dùng chung câu trả lời"""
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=0, max_entries=10)
+    cache.store("Chỉ tiêu năm 2024?", _vector(1, 0), {"response": "2024"}, index_version="v1")
+    assert cache.lookup("Chỉ tiêu năm 2025?", _vector(1, 0), index_version="v1") is None
+    assert cache.lookup("Chỉ tiêu năm 2024", _vector(1, 0), index_version="v1")["response"] == "2024"
+
+
+def test_index_version_change_invalidates():
+    """Index được xây dựng lại (đổi index_version) thì mọi câu trả lời cũ bị bỏ"""
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=0, max_entries=10)
+    cache.store("Điểm chuẩn CNTT?", _vector(1, 0), {"response": "cũ"}, index_version="v1")
+    assert cache.lookup("Điểm chuẩn CNTT?", _vector(1, 0), index_version="v1") is not None
+
+    assert cache.lookup("Điểm chuẩn CNTT?", _vector(1, 0), index_version="v2") is None
+    stats = cache.get_statistics()
+    assert stats['invalidations'] == 1
+    assert stats['entries'] == 0
+
+    cache.store("Điểm chuẩn CNTT?", _vector(1, 0), {"response": "mới"}, index_version="v2")
+    assert cache.lookup("Điểm chuẩn CNTT?", _vector(1, 0), index_version="v2")["response"] == "mới"
+
+
+def test_ttl_and_lru_eviction():
+    """Mục quá TTL hết hạn; vượt max_entries thì mục ít dùng nhất bị loại"""
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=0.05, max_entries=10)
+    cache.store("Quy chế?", _vector(1, 0), {"response": "A"})
+    time.sleep(0.1)
+    assert cache.lookup("Quy chế?", _vector(1, 0)) is None
+    assert cache.get_statistics()['expirations'] == 1
+
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=0, max_entries=2)
+    cache.store("A?", _vector(1, 0, 0), {"response": "A"})
+    cache.store("B?", _vector(0, 1, 0), {"response": "B"})
+    assert cache.lookup("A?", _vector(1, 0, 0)) is not None
+    cache.store("C?", _vector(0, 0, 1), {"response": "C"})
+    assert cache.lookup("B?", _vector(0, 1, 0)) is None
+    assert cache.lookup("A?", _vector(1, 0, 0)) is not None
+    assert cache.get_statistics()['evictions'] == 1
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
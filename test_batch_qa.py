@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test cho batch_qa: đọc câu hỏi, checkpoint và tiếp tục sau khi bị dừng giữa chừng
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from batch_qa import BatchAnswerer, batches, load_checkpoint, read_questions
+
+
+class _FlakyLLM:
+    """LLM giả trả lời ngay; nếu `flaky` thì lỗi với các câu hỏi có chữ 'lỗi'"""
+
+    def __init__(self, flaky: bool):
+        self.flaky = flaky
+
+    def generate(self, prompt: str) -> str:
+        if self.flaky and "lỗi" in prompt:
+            raise RuntimeError("LLM lỗi")
+        return "Trả lời: " + prompt
+
+
+class _Bot:
+    """Phần giao diện của TuyenSinhBot mà BatchAnswerer dùng"""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def _pack_context(self, results):
+        return "context", {"packed_tokens": 1}
+
+    def _build_prompt(self, question: str, context: str) -> str:
+        return question
+
+    def _fallback_response(self, context: str) -> str:
+        return context
+
+    def _error_response(self, context: str) -> str:
+        return "Xin lỗi"
+
+
+def _write_lines(path: str, records, tail: str = ""):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.write(tail)
+
+
+def test_read_questions():
+    """Dòng chuỗi được đánh số theo dòng, dòng thiếu câu hỏi bị bỏ qua"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "questions.jsonl")
+        _write_lines(path, [{"id": "a", "question": "Học phí?"}, "Quy chế?", {"id": "b"}])
+        assert list(read_questions(path)) == [
+            {"id": "a", "question": "Học phí?"},
+            {"id": "2", "question": "Quy chế?"},
+        ]
+    assert [len(batch) for batch in batches(iter(range(5)), 2)] == [2, 2, 1]
+
+
+def test_checkpoint_truncates_partial_last_line():
+    """Dòng cuối ghi dở bị cắt bỏ để lần chạy sau ghi tiếp trên một dòng mới"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "answers.jsonl")
+        _write_lines(path, [{"id": "1", "success": True}, {"id": "2", "success": True}], tail='{"id": "3", "resp')
+
+        assert load_checkpoint(path) == {"1", "2"}
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        assert content.endswith("\n")
+        assert len(content.splitlines()) == 2
+
+
+def test_checkpoint_skips_only_successes():
+    """Câu hỏi bị lỗi được thử lại; bản ghi sau cùng của mỗi id quyết định"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "answers.jsonl")
+        _write_lines(path, [
+            {"id": "1", "success": True},
+            {"id": "2", "success": False},
+            {"id": "3", "success": False},
+            {"id": "3", "success": True},
+        ])
+        assert load_checkpoint(path) == {"1", "3"}
+        assert load_checkpoint(os.path.join(directory, "missing.jsonl")) == set()
+
+
+def test_resume_after_interrupted_run():
+    """Chạy lại sau khi bị dừng: chỉ trả lời các câu chưa thành công, kết quả cuối đầy đủ"""
+    questions = [
+        {"id": "1", "question": "Học phí?"},
+        {"id": "2", "question": "câu hỏi gây lỗi"},
+        {"id": "3", "question": "Quy chế?"},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "answers.jsonl")
+        answerer = BatchAnswerer(_Bot(_FlakyLLM(flaky=True)), path)
+        for item in questions[:2]:
+            answerer.answer(item, [], retrieval_ms=0.0)
+        answerer.close()
+        # Lần chạy trước bị dừng khi đang ghi câu hỏi thứ 3
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"id": "3", "ques')
+
+        done = load_checkpoint(path)
+        assert done == {"1"}
+
+        answerer = BatchAnswerer(_Bot(_FlakyLLM(flaky=False)), path)
+        for item in questions:
+            if item["id"] not in done:
+                answerer.answer(item, [], retrieval_ms=0.0)
+        answerer.close()
+        assert answerer.summary()['answered'] == 2
+
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        latest = {record["id"]: record for record in records}
+        assert [record["id"] for record in records] == ["1", "2", "2", "3"]
+        assert all(record["success"] for record in latest.values())
+        assert load_checkpoint(path) == {"1", "2", "3"}
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
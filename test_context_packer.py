@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test cho ContextPacker: loại chunk trùng, nối chunk liền kề, giới hạn ngân sách token
+"""
+
+import os
+import sys
+
+from langchain.schema import Document
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from context_packer import ContextPacker, count_tokens
+from index_storage import SearchResult
+
+TEXT = (
+    "Chỉ tiêu tuyển sinh năm 2025 của trường là 3000 sinh viên. "
+    "Ngành Công nghệ thông tin có 400 chỉ tiêu. Ngành Luật có 200 chỉ tiêu. "
+    "Thí sinh đăng ký xét tuyển trực tuyến trên cổng của Bộ Giáo dục."
+)
+
+
+def _result(text: str, chunk_id: int, source: str = "chi_tieu_2025.docx", file_hash: str = "h1",
+            chunk_hash: str = None, score: float = 0.0) -> SearchResult:
+    metadata = {'source': source, 'chunk_id': chunk_id, 'file_hash': file_hash}
+    if chunk_hash:
+        metadata['chunk_hash'] = chunk_hash
+    return SearchResult.from_document(Document(page_content=text, metadata=metadata), score)
+
+
+def test_search_result_exposes_file_hash():
+    """file_hash đọc được qua SearchResult (khóa gộp chunk theo phiên bản file)"""
+    assert _result("a", 0, file_hash="abc")['file_hash'] == "abc"
+    assert SearchResult.from_document(Document(page_content="a", metadata={}), 0.0)['file_hash'] == ''
+
+
+def test_duplicates_removed_by_chunk_hash():
+    """Chunk trùng chunk_hash chỉ được đưa vào context một lần"""
+    packed = ContextPacker(token_budget=0, chunk_overlap=20).pack([
+        _result("Học phí ngành Luật là 20 triệu đồng/năm.", 3, chunk_hash="aaaa1111"),
+        _result("Học phí ngành Luật là 20 triệu đồng/năm.", 3, chunk_hash="aaaa1111"),
+        _result("Ký túc xá có 2000 chỗ.", 7, source="ktx.docx", chunk_hash="bbbb2222"),
+    ])
+    assert packed['stats']['duplicates_removed'] == 1
+    assert packed['stats']['blocks'] == 2
+    assert packed['context'].count("Học phí ngành Luật") == 1
+
+
+def test_adjacent_chunks_merged_without_overlap():
+    """Chunk liên tiếp của cùng file được nối thành một khối, phần overlap chỉ xuất hiện một lần"""
+    # Như RecursiveCharacterTextSplitter: chunk sau lặp lại vài từ cuối của chunk trước
+    words = TEXT.split(" ")
+    first, second = " ".join(words[:20]), " ".join(words[16:])
+    overlap = " ".join(words[16:20])
+    packed = ContextPacker(token_budget=0, chunk_overlap=20).pack([
+        _result(second, 1, chunk_hash="cccc0001"),
+        _result(first, 0, chunk_hash="cccc0000"),
+    ])
+    assert packed['stats']['chunks_merged'] == 1
+    assert packed['stats']['blocks'] == 1
+    assert TEXT in packed['context']
+    assert packed['context'].count(overlap) == 1
+
+
+def test_non_adjacent_chunks_not_merged():
+    """Chunk không liên tiếp, khác file hoặc khác phiên bản file không bị nối"""
+    packed = ContextPacker(token_budget=0, chunk_overlap=20).pack([
+        _result("Đoạn đầu của tài liệu về chỉ tiêu.", 0, chunk_hash="dddd0000"),
+        _result("Đoạn thứ ba của tài liệu về chỉ tiêu.", 2, chunk_hash="dddd0002"),
+        _result("Đoạn thứ hai của tài liệu khác.", 1, source="quy_che.docx", chunk_hash="eeee0001"),
+        _result("Đoạn thứ hai của bản cũ.", 1, file_hash="h0", chunk_hash="ffff0001"),
+    ])
+    assert packed['stats']['chunks_merged'] == 0
+    assert packed['stats']['blocks'] == 4
+
+
+def test_truncated_at_token_budget():
+    """Context không vượt ngân sách token; khối vượt ngân sách bị cắt và các khối sau bị bỏ"""
+    results = [
+        _result(f"Tài liệu {i}: " + "thông tin tuyển sinh chi tiết " * 40, 0,
+                source=f"doc_{i}.docx", chunk_hash=f"{i:08d}")
+        for i in range(5)
+    ]
+    budget = 400
+    packed = ContextPacker(token_budget=budget, chunk_overlap=20).pack(results)
+    stats = packed['stats']
+    assert stats['truncated']
+    assert stats['packed_tokens'] <= budget
+    assert count_tokens(packed['context']) <= budget
+    assert 0 < stats['blocks'] < len(results)
+    assert packed['context'].endswith("…")
+    assert "Tài liệu 0" in packed['context'] and "Tài liệu 4" not in packed['context']
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
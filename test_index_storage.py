@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test cho index_storage: docstore dạng cột (ghi, memory-map, đọc lại) và index định dạng pickle cũ
+"""
+
+import os
+import sys
+import tempfile
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from index_storage import (
+    FILE_FIELDS, LEGACY_PICKLE_FILE, RESULT_DEFAULTS, ColumnarDocstore, ColumnarDocstoreWriter, SearchResult,
+    file_key, load_index, save_faiss_index, save_index, stored_document,
+)
+
+DIMENSION = 8
+
+
+class _HashEmbeddings(Embeddings):
+    """Embedding cố định theo nội dung văn bản, đủ để test lưu/tải index"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(sum(text.encode('utf-8')))
+        return rng.standard_normal(DIMENSION).astype(np.float32).tolist()
+
+
+def _documents():
+    files = [
+        ("chi_tieu_2025.docx", "h1", "quota", "2025", ["Chỉ tiêu 3000 sinh viên.", "Ngành Luật 200 chỉ tiêu.", ""]),
+        ("điểm chuẩn 2024.docx", "h2", "benchmark", "2024", ["Điểm chuẩn ngành CNTT là 25,5 điểm 🎓."]),
+    ]
+    documents = []
+    for source, file_hash, category, year, chunks in files:
+        for chunk_id, text in enumerate(chunks):
+            documents.append(Document(page_content=text, metadata={
+                'source': source,
+                'file_hash': file_hash,
+                'chunk_id': chunk_id,
+                'total_chunks': len(chunks),
+                'chunk_hash': f"{chunk_id:04d}{file_hash:0>4}",
+                'load_time': '2025-06-01T00:00:00',
+                'file_size': 1234,
+                'chunk_size': len(text),
+                'file_type': 'docx',
+                'file_title': source.replace('.docx', ''),
+                'file_year': year,
+                'file_category': category,
+                'processing_timestamp': 1748736000.0,
+            }))
+    return documents
+
+
+def _write(path: str, documents, ids=None) -> None:
+    writer = ColumnarDocstoreWriter(path)
+    writer.add_batch([doc.page_content for doc in documents], [doc.metadata for doc in documents], ids)
+    writer.commit()
+
+
+def test_columnar_round_trip():
+    """Ghi rồi memory-map: nội dung và metadata từng vị trí giống hệt Document ban đầu"""
+    documents = _documents()
+    with tempfile.TemporaryDirectory() as directory:
+        _write(directory, documents)
+        docstore = ColumnarDocstore(directory)
+
+        assert len(docstore) == len(documents)
+        assert isinstance(docstore._offsets, np.memmap) and isinstance(docstore._texts, np.memmap)
+        assert len(docstore.files) == 2
+        for position, doc in enumerate(documents):
+            assert docstore.text_at(position) == doc.page_content
+            metadata = docstore.metadata_at(position)
+            for key in FILE_FIELDS + ['chunk_id', 'chunk_hash', 'chunk_size']:
+                assert metadata[key] == doc.metadata[key], (position, key)
+            doc_id = f"{file_key(doc.metadata['source'], doc.metadata['file_hash'])}-{doc.metadata['chunk_id']}"
+            assert docstore.id_at(position) == doc_id
+            assert docstore.search(doc_id).page_content == doc.page_content
+
+        mask = docstore.chunk_mask({'file_category': ('quota',)})
+        assert mask.tolist() == [doc.metadata['file_category'] == 'quota' for doc in documents]
+
+
+def test_search_result_reads_fields_lazily():
+    """SearchResult trên docstore dạng cột và trên Document trả về cùng giá trị cho mọi trường"""
+    documents = _documents()
+    with tempfile.TemporaryDirectory() as directory:
+        _write(directory, documents)
+        docstore = ColumnarDocstore(directory)
+        for position, doc in enumerate(documents):
+            columnar = SearchResult(docstore, position, 0.5)
+            in_memory = SearchResult.from_document(doc, 0.5)
+            assert set(columnar) == set(RESULT_DEFAULTS)
+            for key in RESULT_DEFAULTS:
+                assert columnar[key] == in_memory[key], (position, key)
+            assert columnar['content'] == doc.page_content
+            assert columnar['file_hash'] == doc.metadata['file_hash']
+            assert columnar.get('missing') is None
+
+
+def test_explicit_ids_and_index_round_trip():
+    """Id không suy ra được từ (file, chunk_id) được lưu nguyên; load_index ghép đúng index với docstore"""
+    documents = _documents()
+    embeddings = _HashEmbeddings()
+    ids = [f"custom-{i}" if i % 2 else None for i in range(len(documents))]
+    with tempfile.TemporaryDirectory() as directory:
+        _write(directory, documents, ids)
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32))
+        save_faiss_index(index, directory)
+
+        for mutable in (False, True):
+            vector_db = load_index(directory, embeddings, mutable=mutable)
+            assert vector_db.index.ntotal == len(documents)
+            for position, doc in enumerate(documents):
+                doc_id = vector_db.index_to_docstore_id[position]
+                assert ids[position] is None or doc_id == ids[position]
+                assert stored_document(vector_db, position).page_content == doc.page_content
+            hits = vector_db.similarity_search_with_score(documents[3].page_content, k=1)
+            assert hits[0][0].metadata['source'] == documents[3].metadata['source']
+
+        # Docstore và index lệch nhau thì không được tải
+        _write(directory, documents[:2])
+        try:
+            load_index(directory, embeddings)
+            raise AssertionError("phải báo lỗi không khớp")
+        except ValueError:
+            pass
+
+
+def test_legacy_pickle_index_loaded_and_converted():
+    """Index định dạng pickle cũ vẫn tải được, và save_index chuyển sang định dạng cột"""
+    documents = _documents()
+    embeddings = _HashEmbeddings()
+    with tempfile.TemporaryDirectory() as directory:
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32))
+        ids = [str(i) for i in range(len(documents))]
+        legacy = FAISS(
+            embedding_function=embeddings, index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, documents))),
+            index_to_docstore_id=dict(enumerate(ids)),
+        )
+        legacy.save_local(directory)
+
+        vector_db = load_index(directory, embeddings)
+        assert not isinstance(vector_db.docstore, ColumnarDocstore)
+        for position, doc in enumerate(documents):
+            assert stored_document(vector_db, position).page_content == doc.page_content
+            assert SearchResult.from_document(stored_document(vector_db, position), 0.0)['file_hash'] == \
+                doc.metadata['file_hash']
+
+        save_index(vector_db, directory)
+        assert not os.path.exists(os.path.join(directory, LEGACY_PICKLE_FILE))
+        converted = load_index(directory, embeddings)
+        assert isinstance(converted.docstore, ColumnarDocstore)
+        for position, doc in enumerate(documents):
+            assert converted.docstore.document_at(position).page_content == doc.page_content
+            assert converted.index_to_docstore_id[position] == ids[position]
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
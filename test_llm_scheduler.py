@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Test cho QuotaScheduler và GeminiLLM chạy offline (RateLimitedStubModel, FakeLLM)
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from gemini_llm import FakeLLM, GeminiLLM, RateLimitedStubModel
+from llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, QueueTimeoutError, QuotaScheduler
+
+
+def _scheduler(**kwargs) -> QuotaScheduler:
+    """Scheduler không giới hạn quota, thử lại nhanh để test chạy trong vài giây"""
+    options = dict(
+        requests_per_minute=0, tokens_per_minute=0, max_concurrency=4, max_retries=3,
+        retry_base_seconds=0.01, retry_max_seconds=0.02, queue_timeout_seconds=10,
+    )
+    options.update(kwargs)
+    return QuotaScheduler(**options)
+
+
+def _wait_for_queue_depth(scheduler: QuotaScheduler, depth: int, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while scheduler.get_statistics()['queue_depth'] < depth:
+        assert time.monotonic() < deadline, "request không vào hàng đợi"
+        time.sleep(0.005)
+
+
+class FlakyStubModel(RateLimitedStubModel):
+    """Stub báo lỗi 429 ở `failures` lời gọi đầu tiên rồi trả lời bình thường"""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(requests_per_minute=10 ** 9, **kwargs)
+        self.failures = failures
+
+    def _admit(self):
+        super()._admit()
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                self.rejected += 1
+                raise Exception("429 Resource exhausted: quota exceeded (stub)")
+
+
+def test_concurrency_limit():
+    """Không bao giờ có quá max_concurrency lời gọi chạy cùng lúc"""
+    scheduler = _scheduler(max_concurrency=2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def work():
+        with scheduler.slot():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert scheduler.get_statistics()['running'] == 0
+
+
+def test_interactive_before_background():
+    """Request của người dùng được nhận slot trước request nền vào hàng đợi trước nó"""
+    scheduler = _scheduler(max_concurrency=1)
+    order = []
+
+    def work(name, priority):
+        with scheduler.slot(priority=priority):
+            order.append(name)
+
+    with scheduler.slot():
+        background = threading.Thread(target=work, args=("background", PRIORITY_BACKGROUND))
+        background.start()
+        _wait_for_queue_depth(scheduler, 1)
+        interactive = threading.Thread(target=work, args=("interactive", PRIORITY_INTERACTIVE))
+        interactive.start()
+        _wait_for_queue_depth(scheduler, 2)
+    background.join()
+    interactive.join()
+
+    assert order == ["interactive", "background"]
+
+
+def test_queue_timeout():
+    """Request chờ quá queue_timeout_seconds báo QueueTimeoutError và rời hàng đợi"""
+    scheduler = _scheduler(max_concurrency=1, queue_timeout_seconds=0.1)
+    with scheduler.slot():
+        try:
+            with scheduler.slot():
+                pass
+            raise AssertionError("phải báo QueueTimeoutError")
+        except QueueTimeoutError:
+            pass
+    stats = scheduler.get_statistics()
+    assert stats['queue_timeouts'] == 1
+    assert stats['queue_depth'] == 0
+
+
+def test_identical_prompts_coalesced():
+    """Các prompt giống hệt đang xử lý dùng chung một lời gọi model"""
+    model = RateLimitedStubModel(requests_per_minute=10 ** 9, latency_ms=200)
+    llm = GeminiLLM(model=model, scheduler=_scheduler())
+    results = []
+
+    def ask():
+        results.append(llm.generate("Chỉ tiêu tuyển sinh 2025?"))
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert model.calls == 1
+    assert len(results) == 5 and len(set(results)) == 1
+    stats = llm.get_statistics()
+    assert stats['coalesced'] == 4
+    assert stats['completed'] == 1
+
+
+def test_identical_streams_coalesced():
+    """Request streaming cùng prompt nhận lại đầy đủ các đoạn của một lời gọi duy nhất"""
+    model = RateLimitedStubModel(requests_per_minute=10 ** 9, latency_ms=200, chunks=4)
+    llm = GeminiLLM(model=model, scheduler=_scheduler())
+    answers = []
+
+    def ask():
+        answers.append("".join(llm.generate_stream("Điểm chuẩn ngành CNTT?")))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert model.calls == 1
+    assert len(answers) == 4 and len(set(answers)) == 1 and answers[0]
+    assert llm.get_statistics()['coalesced'] == 3
+
+
+def test_rate_limit_retried_and_counted():
+    """Lỗi 429 được thử lại (kể cả streaming trước đoạn đầu tiên) và được đếm"""
+    model = FlakyStubModel(failures=2, latency_ms=5)
+    llm = GeminiLLM(model=model, scheduler=_scheduler())
+    assert llm.generate("Học phí?").startswith("Stub trả lời")
+    assert llm.get_statistics()['retries'] == 2
+
+    model.failures = 1
+    assert "".join(llm.generate_stream("Quy chế?")).startswith("Stub trả lời")
+    stats = llm.get_statistics()
+    assert stats['retries'] == 3
+    assert stats['rate_limited'] == 3
+
+
+def test_rate_limit_gives_up_after_max_retries():
+    """Hết số lần thử lại thì báo lỗi quota cho người gọi"""
+    model = FlakyStubModel(failures=10, latency_ms=5)
+    llm = GeminiLLM(model=model, scheduler=_scheduler(max_retries=2))
+    try:
+        llm.generate("Ký túc xá?")
+        raise AssertionError("phải báo lỗi quota")
+    except Exception as e:
+        assert "quota" in str(e)
+    stats = llm.get_statistics()
+    assert model.calls == 3
+    assert stats['retries'] == 2
+    assert stats['failed'] == 1
+
+
+def test_async_identical_prompts_coalesced():
+    """Bản async cũng gộp prompt giống hệt và không chặn event loop khi chờ slot"""
+    model = RateLimitedStubModel(requests_per_minute=10 ** 9, latency_ms=100)
+    llm = GeminiLLM(model=model, scheduler=_scheduler(max_concurrency=1))
+
+    async def run():
+        same = [llm.agenerate("Chỉ tiêu 2025?") for _ in range(3)]
+        streams = [_collect(llm.agenerate_stream(f"Câu hỏi {i}?")) for i in range(3)]
+        return await asyncio.gather(*same, *streams)
+
+    async def _collect(stream):
+        return "".join([text async for text in stream])
+
+    results = asyncio.run(run())
+    assert len(set(results[:3])) == 1
+    assert all(results[3:])
+    assert model.calls == 4
+    assert llm.get_statistics()['coalesced'] == 2
+
+
+def test_fake_llm_stream_matches_generate():
+    """FakeLLM trả lời theo nhiều đoạn, ghép lại bằng đúng kết quả của generate"""
+    llm = FakeLLM(first_token_ms=0, chunk_ms=0)
+    prompt = "Thông tin tham khảo: ...\n\nCâu hỏi: Học phí ngành Luật?\n"
+    chunks = list(llm.generate_stream(prompt))
+    assert len(chunks) > 1
+    assert "".join(chunks) == llm.generate(prompt)
+    assert "Học phí ngành Luật?" in llm.generate(prompt)
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test cho câu trả lời dựng sẵn (PrecomputedAnswers) và nhật ký câu hỏi (QuestionLog)
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from precomputed_answers import PrecomputedAnswers, QuestionLog, question_key
+
+
+def test_lookup_normalizes_question():
+    """Câu hỏi khớp sau chuẩn hóa (hoa thường, khoảng trắng) được trả lời từ bộ dựng sẵn"""
+    with tempfile.TemporaryDirectory() as directory:
+        answers = PrecomputedAnswers(directory)
+        answers.save({question_key("Học phí ngành Luật?"): {"response": "A"}}, index_version="v1", llm="fake")
+
+        assert answers.get("  học phí   NGÀNH luật? ", "v1")["response"] == "A"
+        assert answers.get("Ký túc xá?", "v1") is None
+        assert answers.is_fresh("v1")
+
+
+def test_stale_after_index_rebuild():
+    """Index được xây dựng lại (đổi index_version) thì câu trả lời dựng sẵn không còn được dùng"""
+    with tempfile.TemporaryDirectory() as directory:
+        answers = PrecomputedAnswers(directory)
+        answers.save({question_key("Quy chế?"): {"response": "cũ"}}, index_version="v1", llm="fake")
+
+        assert not answers.is_fresh("v2")
+        assert answers.get("Quy chế?", "v2") is None
+        stats = answers.get_statistics()
+        assert stats['stale'] == 1 and stats['hits'] == 0
+
+
+def test_reload_when_file_changes():
+    """Process khác dựng lại bộ câu trả lời thì lần đọc sau thấy ngay"""
+    with tempfile.TemporaryDirectory() as directory:
+        reader = PrecomputedAnswers(directory)
+        assert reader.get("Quy chế?", "v1") is None
+
+        PrecomputedAnswers(directory).save({question_key("Quy chế?"): {"response": "mới"}}, "v1", "fake")
+        assert reader.get("Quy chế?", "v1")["response"] == "mới"
+
+
+def test_question_log_buffers_until_flush():
+    """record chỉ cộng dồn trong bộ nhớ; flush ghi một lần và cộng vào số đếm đã có"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "questions.sqlite3")
+        log = QuestionLog(path, flush_seconds=3600)
+        for _ in range(3):
+            log.record("Học phí?")
+        log.record("Quy chế?")
+        assert len(log._pending) == 2
+
+        log.flush()
+        assert log._pending == {}
+        assert log.top(2) == ["Học phí?", "Quy chế?"]
+
+        for _ in range(3):
+            log.record("quy chế? ")
+        assert log.top(2) == ["quy chế?", "Học phí?"]
+
+        # Một process khác mở cùng file thấy số đếm đã ghi
+        assert QuestionLog(path, flush_seconds=3600).top(1) == ["quy chế?"]
+
+
+def test_question_log_disabled():
+    """Không có đường dẫn (QUESTION_LOG_ENABLED=false) thì không ghi gì"""
+    log = QuestionLog(None)
+    log.record("Học phí?")
+    assert log.top(5) == []
+    assert len(log) == 0
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
@@ -64,6 +64,20 @@ def test_query_expansion():
                 print(f"     {j}. {q}")
 
 
+def test_parse_filters():
+    """Suy ra năm và loại tài liệu từ câu hỏi để lọc metadata"""
+    expander = QueryExpander()
+
+    assert expander.parse_filters("Chỉ tiêu tuyển sinh năm 2025") == {'year': ['2025'], 'category': ['quota']}
+    assert expander.parse_filters("So sánh điểm chuẩn 2025 và 2024") == {
+        'year': ['2024', '2025'], 'category': ['benchmark'],
+    }
+    assert expander.parse_filters("QUY CHẾ tuyển sinh") == {'category': ['regulation']}
+    # Số không phải năm tuyển sinh (mã ngành, năm ngoài khoảng) không thành bộ lọc
+    assert expander.parse_filters("Mã ngành 7480201, thành lập năm 1995") == {}
+    assert expander.parse_filters("Học phí ngành Luật") == {}
+
+
 def test_embedding_expansion():
     """Test embedding expansion"""
     print("\n🧠 Test Embedding Expansion...")
@@ -83,6 +97,7 @@ def test_embedding_expansion():
 if __name__ == "__main__":
     try:
         test_query_expansion()
+        test_parse_filters()
         test_embedding_expansion()
         print("\n✅ Tất cả tests hoàn thành!")
     except Exception as e:
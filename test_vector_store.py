@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Test cho VectorStore trên một bộ tài liệu nhỏ tạo tạm (docx)
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+
+from docx import Document
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bm25_index import BM25Index
+from config import Config
+from index_storage import CURRENT_FILE, GENERATION_PREFIX, current_generation, load_index
+from tracing import tracer
+import vector_store
+from vector_store import VectorStore
+
+CORPUS = {
+    "chi_tieu_2024.docx": [
+        "Chỉ tiêu tuyển sinh năm 2024 của trường là 3000 sinh viên.",
+        "Ngành Công nghệ thông tin có chỉ tiêu 400 sinh viên, ngành Luật 200 sinh viên.",
+    ],
+    "diem_chuan_2025.docx": [
+        "Điểm chuẩn năm 2025 ngành Công nghệ thông tin là 25.5 điểm.",
+        "Điểm chuẩn ngành Luật năm 2025 là 24 điểm theo phương thức thi tốt nghiệp.",
+    ],
+    "quy_che_tuyen_sinh.docx": [
+        "Quy chế tuyển sinh quy định thí sinh được đăng ký không giới hạn nguyện vọng.",
+        "Thí sinh trúng tuyển phải xác nhận nhập học trực tuyến trước thời hạn.",
+    ],
+}
+
+
+def _write_docx(directory: str, filename: str, paragraphs):
+    document = Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(os.path.join(directory, filename))
+
+
+@contextmanager
+def _temp_store(corpus=CORPUS, **settings):
+    """VectorStore trên thư mục data/vector_db tạm; Config được khôi phục khi kết thúc"""
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = os.path.join(directory, "data")
+        os.makedirs(data_dir)
+        for filename, paragraphs in corpus.items():
+            _write_docx(data_dir, filename, paragraphs)
+
+        overrides = {
+            'DATA_DIR': data_dir,
+            'VECTOR_DB_PATH': os.path.join(directory, "vector_db"),
+            'INGEST_WORKERS': 1,
+            'CHUNK_SIZE': 120,
+            'CHUNK_OVERLAP': 20,
+            'FAISS_INDEX_TYPE': 'flat',
+            **settings,
+        }
+        previous = {key: getattr(Config, key) for key in overrides}
+        for key, value in overrides.items():
+            setattr(Config, key, value)
+        try:
+            yield VectorStore(), data_dir
+        finally:
+            for key, value in previous.items():
+                setattr(Config, key, value)
+
+
+def test_search_records_each_stage_once():
+    """Mỗi giai đoạn tìm kiếm chỉ xuất hiện một lần trong trace của một request"""
+    with _temp_store() as (store, _):
+        store.build_vector_store(force_rebuild=True)
+        enabled, tracer.enabled = tracer.enabled, True
+        try:
+            for mode in ('vector', 'hybrid'):
+                with tracer.request() as trace:
+                    results = store.search("Điểm chuẩn ngành Luật", k=3, mode=mode, filters={})
+                assert results
+                counts = Counter(span['name'] for span in trace.spans)
+                for stage in ('query_expansion', 'embedding', 'faiss_search', 'format_results'):
+                    assert counts[stage] == 1, (mode, counts)
+                assert counts['bm25_search'] == (1 if mode == 'hybrid' else 0)
+        finally:
+            tracer.enabled = enabled
+
+
+def test_stale_bm25_rebuilt_on_load():
+    """Postings BM25 không khớp số vector của FAISS index thì được xây dựng lại khi tải"""
+    with _temp_store() as (store, _):
+        store.build_vector_store(force_rebuild=True)
+        total = store.vector_db.index.ntotal
+        assert store.lexical_index.n_docs == total
+
+        # BM25 còn lại từ một lần xây dựng khác (ít chunk hơn)
+        generation = current_generation(Config.VECTOR_DB_PATH)
+        BM25Index.build(["Chỉ tiêu tuyển sinh"]).save(generation)
+        assert BM25Index.load(generation).n_docs == 1
+
+        reloaded = VectorStore()
+        reloaded.build_vector_store()
+        assert reloaded.lexical_index.n_docs == total
+        assert BM25Index.load(generation).n_docs == total
+        assert reloaded.search("quy chế nguyện vọng", k=2, mode='bm25', filters={})
+
+
+def test_bm25_load_rejects_mismatched_files():
+    """Postings và vocab của hai lần xây dựng khác nhau thì không được tải"""
+    with tempfile.TemporaryDirectory() as directory:
+        BM25Index.build(["a b", "b c", "c d"]).save(directory)
+        postings = os.path.join(directory, "bm25_postings.npz")
+        with open(postings, 'rb') as f:
+            saved = f.read()
+        BM25Index.build(["a b"]).save(directory)
+        with open(postings, 'wb') as f:
+            f.write(saved)
+        assert BM25Index.load(directory) is None
+
+
+
+def _generations():
+    return sorted(name for name in os.listdir(Config.VECTOR_DB_PATH) if name.startswith(GENERATION_PREFIX))
+
+
+def test_rebuild_switches_generation_in_one_step():
+    """Mỗi lần xây dựng ghi vào thư mục thế hệ mới; CURRENT chỉ chuyển khi mọi file đã ghi xong"""
+    with _temp_store() as (store, data_dir):
+        store.build_vector_store(force_rebuild=True)
+        first = current_generation(Config.VECTOR_DB_PATH)
+        assert os.path.exists(os.path.join(Config.VECTOR_DB_PATH, CURRENT_FILE))
+        assert len(_generations()) == 1
+
+        _write_docx(data_dir, "thong_tin_ktx.docx", ["Ký túc xá có 2000 chỗ ở cho sinh viên năm nhất."])
+        store.build_vector_store(force_rebuild=True)
+        second = current_generation(Config.VECTOR_DB_PATH)
+        assert second != first
+        # Thế hệ trước được giữ cho process vừa đọc CURRENT cũ, và vẫn nhất quán
+        old = load_index(first, store.embeddings)
+        assert len(old.docstore) == old.index.ntotal < store.vector_db.index.ntotal
+
+        store.build_vector_store(force_rebuild=True)
+        assert _generations() == sorted(os.path.basename(path) for path in (second, current_generation(Config.VECTOR_DB_PATH)))
+
+
+def test_failed_build_keeps_serving_previous_generation():
+    """Lỗi sau khi docstore đã ghi (trước khi ghi index) không làm hỏng index đang phục vụ"""
+    with _temp_store() as (store, data_dir):
+        store.build_vector_store(force_rebuild=True)
+        generation = current_generation(Config.VECTOR_DB_PATH)
+        total = store.vector_db.index.ntotal
+
+        _write_docx(data_dir, "thong_tin_ktx.docx", ["Ký túc xá có 2000 chỗ ở cho sinh viên năm nhất."])
+        save_faiss_index = vector_store.save_faiss_index
+
+        def crash(index, path):
+            raise OSError("disk full")
+
+        vector_store.save_faiss_index = crash
+        try:
+            store.build_vector_store(force_rebuild=True)
+            raise AssertionError("phải báo lỗi")
+        except OSError:
+            pass
+        finally:
+            vector_store.save_faiss_index = save_faiss_index
+
+        assert current_generation(Config.VECTOR_DB_PATH) == generation
+        assert _generations() == [os.path.basename(generation)]
+        reloaded = VectorStore()
+        reloaded.build_vector_store()
+        assert reloaded.vector_db.index.ntotal == len(reloaded.vector_db.docstore) == total
+
+
+def _snapshot(store: VectorStore, queries):
+    """Nội dung docstore (không phụ thuộc thứ tự vị trí) và kết quả tìm kiếm của các câu hỏi"""
+    docstore = store.vector_db.docstore
+    fields = ('source', 'chunk_id', 'total_chunks', 'chunk_hash', 'file_hash', 'file_category', 'file_year')
+    chunks = sorted(
+        (docstore.text_at(i), *(str(docstore.field(i, key)) for key in fields)) for i in range(len(docstore))
+    )
+    results = [
+        [(result['source'], result['chunk_id'], round(result['score'], 4)) for result in store.search(query, k=4)]
+        for query in queries
+    ]
+    return chunks, results
+
+
+def test_incremental_update_matches_full_rebuild():
+    """Cập nhật tăng dần (thêm, sửa, xóa file) cho cùng docstore và kết quả tìm kiếm như xây dựng lại toàn bộ"""
+    queries = ["Chỉ tiêu ngành Công nghệ thông tin", "Điểm chuẩn năm 2025", "Ký túc xá", "nguyện vọng"]
+    with _temp_store(SEARCH_AUTO_FILTERS=True) as (store, data_dir):
+        store.build_vector_store(force_rebuild=True)
+
+        _write_docx(data_dir, "thong_tin_ktx.docx", ["Ký túc xá có 2000 chỗ ở cho sinh viên năm nhất."])
+        _write_docx(data_dir, "diem_chuan_2025.docx", [
+            "Điểm chuẩn năm 2025 ngành Công nghệ thông tin là 26 điểm.",
+            "Điểm chuẩn ngành Kinh tế năm 2025 là 23.5 điểm.",
+        ])
+        os.remove(os.path.join(data_dir, "quy_che_tuyen_sinh.docx"))
+
+        store.build_vector_store(incremental=True)
+        incremental = _snapshot(store, queries)
+
+        rebuilt = VectorStore()
+        rebuilt.build_vector_store(force_rebuild=True)
+        assert incremental == _snapshot(rebuilt, queries)
+        assert not any(chunk[1] == "quy_che_tuyen_sinh.docx" for chunk in incremental[0])
+        assert any("26 điểm" in chunk[0] for chunk in incremental[0])
+
+
+def test_empty_file_recorded_in_manifest():
+    """File không có nội dung được ghi vào manifest với 0 chunk nên không bị xử lý lại ở lần cập nhật sau"""
+    with _temp_store() as (store, data_dir):
+        _write_docx(data_dir, "trong.docx", [])
+        store.build_vector_store(force_rebuild=True)
+        generation = current_generation(Config.VECTOR_DB_PATH)
+        entry = store._load_manifest(generation)['files']["trong.docx"]
+        assert entry['chunk_ids'] == [] and entry['file_hash']
+
+        store.build_vector_store(incremental=True)
+        assert current_generation(Config.VECTOR_DB_PATH) == generation
+
+
+def _only_matching(store: VectorStore, results, filters):
+    normalized = store._normalize_filters(filters)
+    return results and all(str(result[key]) in values for result in results for key, values in normalized.items())
+
+
+def test_inferred_filters_without_matches_dropped():
+    """Bộ lọc tự suy ra chỉ giữ phần khớp được chunk; bộ lọc tường minh được giữ nguyên"""
+    with _temp_store(SEARCH_AUTO_FILTERS=True) as (store, _):
+        store.build_vector_store(force_rebuild=True)
+
+        assert store._resolve_filters("Chỉ tiêu năm 2024", None) == {
+            'file_category': ('quota',), 'file_year': ('2024',),
+        }
+        # Không có tài liệu chỉ tiêu năm 2030: bỏ năm, giữ loại tài liệu
+        assert store._resolve_filters("Chỉ tiêu năm 2030", None) == {'file_category': ('quota',)}
+        # Không có tài liệu quy chế năm 2025: thử từng trường, năm (khớp điểm chuẩn 2025) được xét trước
+        assert store._resolve_filters("Quy chế năm 2025", None) == {'file_year': ('2025',)}
+        assert store._resolve_filters("Học phí năm 2030", None) is None
+        assert store._resolve_filters("Học phí", {'year': 2030}) == {'file_year': ('2030',)}
+        assert store._resolve_filters("Chỉ tiêu năm 2024", {}) is None
+        assert store.search("Chỉ tiêu năm 2030", k=3, use_query_expansion=False)
+
+
+def test_filtered_results_only_match():
+    """Kết quả tìm kiếm có bộ lọc chỉ gồm chunk thỏa bộ lọc, cả FAISS lẫn BM25"""
+    with _temp_store() as (store, _):
+        store.build_vector_store(force_rebuild=True)
+        for filters in ({'category': 'benchmark'}, {'year': '2024'}, {'category': ['quota', 'regulation']}):
+            for mode in ('vector', 'bm25', 'hybrid'):
+                results = store.search("Ngành Công nghệ thông tin", k=10, mode=mode, filters=filters)
+                assert _only_matching(store, results, filters), (filters, mode)
+
+
+def test_overfetch_when_index_has_no_selector():
+    """Index không hỗ trợ IDSelector: lấy dư k*20 ứng viên rồi lọc, cho cùng kết quả như lọc trong index"""
+    with _temp_store() as (store, _):
+        store.build_vector_store(force_rebuild=True)
+        filters = {'category': 'benchmark'}
+        expected = store.search("Ngành Luật", k=2, use_query_expansion=False, filters=filters)
+
+        search_parameters = vector_store.search_parameters
+        vector_store.search_parameters = lambda index, selector: None
+        enabled, tracer.enabled = tracer.enabled, True
+        try:
+            with tracer.request() as trace:
+                results = store.search("Ngành Luật", k=2, use_query_expansion=False, filters=filters)
+        finally:
+            vector_store.search_parameters = search_parameters
+            tracer.enabled = enabled
+
+        span = next(span for span in trace.spans if span['name'] == 'faiss_search')
+        assert span['attributes']['filtered'] is False
+        assert span['attributes']['k'] == min(store.vector_db.index.ntotal, 2 * 20)
+        assert _only_matching(store, results, filters)
+        assert [(r['source'], r['chunk_id']) for r in results] == [(r['source'], r['chunk_id']) for r in expected]
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith("test_") and callable(value)]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+    print(f"\n🎯 {len(tests) - failed}/{len(tests)} test thành công")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,160 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_NOOP = nullcontext()
+
+
+class Trace:
+    """Các span của một request, thời điểm tính theo ms kể từ lúc bắt đầu request"""
+
+    __slots__ = ('request_id', 'started_at', 'start', 'spans', 'duration_ms', '_stack')
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.duration_ms: Optional[float] = None
+        self._stack: List[str] = []
+
+    def to_dict(self) -> Dict:
+        return {
+            'request_id': self.request_id,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'spans': list(self.spans),
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+
+
+class Tracer:
+    """Đo thời gian theo giai đoạn (span) cho từng request và giữ histogram trượt theo giai đoạn.
+
+    Khi tắt, `span()` trả về một context manager rỗng dùng chung nên gần như
+    không tốn chi phí.
+    """
+
+    def __init__(self, enabled: bool = Config.TRACING_ENABLED, window: int = Config.TRACING_WINDOW,
+                 max_traces: int = Config.TRACING_MAX_TRACES):
+        self.enabled = enabled
+        self.window = max(1, window)
+        self._histograms: Dict[str, Deque[float]] = {}
+        self._traces: Deque[Dict] = deque(maxlen=max(1, max_traces))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, duration_ms: float, trace: Optional[Trace] = None, **attributes):
+        """Ghi một số đo (ms) vào histogram của giai đoạn và vào trace của request hiện tại"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = deque(maxlen=self.window)
+            histogram.append(duration_ms)
+        trace = trace or _current_trace.get()
+        if trace is not None:
+            span = {
+                'name': name,
+                'parent': trace._stack[-1] if trace._stack else None,
+                'start_ms': round((time.perf_counter() - trace.start) * 1000 - duration_ms, 3),
+                'duration_ms': round(duration_ms, 3),
+            }
+            if attributes:
+                span['attributes'] = attributes
+            trace.spans.append(span)
+
+    @contextmanager
+    def _span(self, name: str, attributes: Dict) -> Iterator[None]:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace._stack.append(name)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            if trace is not None:
+                trace._stack.pop()
+            self.record(name, (time.perf_counter() - start_time) * 1000, trace, **attributes)
+
+    def span(self, name: str, **attributes):
+        """Context manager đo một giai đoạn, ví dụ `with tracer.span('faiss_search'):`"""
+        if not self.enabled:
+            return _NOOP
+        return self._span(name, attributes)
+
+    @contextmanager
+    def request(self, request_id: Optional[str] = None) -> Iterator[Optional[Trace]]:
+        """Mở trace cho một request; các span bên trong (cùng context) được gắn vào request này"""
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(request_id or uuid.uuid4().hex[:12])
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # Generator bị đóng ở context khác (ví dụ khi bị thu gom rác)
+                pass
+            trace.duration_ms = round((time.perf_counter() - trace.start) * 1000, 3)
+            self.record('request', trace.duration_ms)
+            with self._lock:
+                self._traces.append(trace.to_dict())
+
+    def get_statistics(self) -> Dict:
+        """Histogram trượt theo giai đoạn: count, mean, p50/p95/p99, max (ms)"""
+        with self._lock:
+            histograms = {name: list(values) for name, values in self._histograms.items()}
+            traces = len(self._traces)
+        stages = {}
+        for name, values in sorted(histograms.items()):
+            array = np.asarray(values, dtype=np.float64)
+            stages[name] = {
+                'count': len(values),
+                'mean_ms': round(float(array.mean()), 3),
+                'p50_ms': round(float(np.percentile(array, 50)), 3),
+                'p95_ms': round(float(np.percentile(array, 95)), 3),
+                'p99_ms': round(float(np.percentile(array, 99)), 3),
+                'max_ms': round(float(array.max()), 3),
+            }
+        return {'enabled': self.enabled, 'window': self.window, 'traces': traces, 'stages': stages}
+
+    def recent_traces(self, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            traces = list(self._traces)
+        return traces[-limit:] if limit else traces
+
+    def export_json(self, path: Optional[str] = None) -> str:
+        """Xuất histogram và các trace gần nhất dạng JSON (ghi ra `path` nếu có)"""
+        data = json.dumps(
+            {'exported_at': time.time(), 'statistics': self.get_statistics(), 'traces': self.recent_traces()},
+            ensure_ascii=False, indent=2,
+        )
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(data)
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._traces.clear()
+
+
+tracer = Tracer()
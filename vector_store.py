@@ -1,13 +1,30 @@
 import os
+import asyncio
+import contextvars
+import functools
 import logging
-from typing import List, Dict
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import faiss
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
 from config import Config
 from document_processor import DocumentProcessor
+from embedding_engine import get_embedding_engine
+from embedding_cache import get_query_embedding_cache, get_chunk_embedding_store
+from faiss_index import build_faiss_index, compare_index_types, search_parameters, tune_index
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from index_storage import (
+    INDEX_FILE, ColumnarDocstore, ColumnarDocstoreWriter, SearchResult, build_stats_catalog, current_generation,
+    discard_generation, file_key, index_exists, load_index, load_stats_catalog, new_generation,
+    publish_generation, save_faiss_index, save_stats_catalog, stored_document,
+)
 from query_expander import QueryExpander
+from tracing import tracer
 from datetime import datetime
 import hashlib
 import re
@@ -15,24 +32,53 @@ import re
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    """Executor có giới hạn (ASYNC_CPU_WORKERS luồng) cho phần việc CPU của các API async: embedding, FAISS"""
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _cpu_executor_lock:
+            if _cpu_executor is None:
+                _cpu_executor = ThreadPoolExecutor(
+                    max_workers=max(1, Config.ASYNC_CPU_WORKERS), thread_name_prefix="cpu"
+                )
+    return _cpu_executor
+
+
+async def run_cpu_bound(func: Callable[..., T], *args, **kwargs) -> T:
+    """Chạy `func` trong executor CPU mà không chặn event loop (giữ nguyên context tracing của request)"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_cpu_executor(), call)
+
 
 class VectorStore:
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=Config.EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'}
-        )
+        self.embeddings = get_embedding_engine()
+        self.query_embeddings = get_query_embedding_cache(self.embeddings)
+        self.chunk_embeddings = get_chunk_embedding_store(self.embeddings)
+        self.last_build_stats = {}
+        # Thống kê chính xác tính một lần khi xây dựng index, lưu cạnh index
+        self.stats_catalog: Dict = {}
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=Config.CHUNK_SIZE,
             chunk_overlap=Config.CHUNK_OVERLAP,
             length_function=len,
         )
         self.vector_db = None
+        # Đổi mỗi khi index được xây dựng lại; dùng để vô hiệu hóa các cache phía trên
+        self.index_version: Optional[str] = None
+        self.lexical_index: Optional[BM25Index] = None
+        self._filter_cache: Dict[Tuple, Tuple[np.ndarray, np.ndarray, faiss.IDSelector]] = {}
         self.query_expander = QueryExpander()
 
-    def create_documents(self, documents: List[Dict]) -> List[Document]:
-        """Tạo danh sách Document từ dữ liệu đã xử lý với metadata nâng cao"""
-        langchain_documents = []
+    def iter_chunks(self, documents: Iterable[Dict]) -> Iterator[Document]:
+        """Chia lần lượt từng tài liệu thành các chunk Document với metadata nâng cao (generator)"""
         current_time = datetime.now()
 
         for doc in documents:
@@ -52,6 +98,7 @@ class VectorStore:
                     'chunk_id': i,
                     'total_chunks': len(chunks),
                     'chunk_hash': chunk_hash,
+                    'file_hash': doc.get('file_hash', ''),
                     'load_time': current_time.isoformat(),
                     'file_size': len(doc['content']),
                     'chunk_size': len(chunk),
@@ -62,16 +109,151 @@ class VectorStore:
                     'processing_timestamp': current_time.timestamp()
                 }
 
-                langchain_documents.append(
-                    Document(
-                        page_content=chunk,
-                        metadata=enhanced_metadata
-                    )
+                yield Document(
+                    page_content=chunk,
+                    metadata=enhanced_metadata
                 )
 
+    def create_documents(self, documents: List[Dict]) -> List[Document]:
+        """Tạo danh sách Document từ dữ liệu đã xử lý với metadata nâng cao"""
+        langchain_documents = list(self.iter_chunks(documents))
         logger.info(f"Đã tạo {len(langchain_documents)} chunks từ {len(documents)} tài liệu với metadata nâng cao")
         return langchain_documents
 
+    @staticmethod
+    def _iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+        """Gom một luồng phần tử thành các batch có kích thước cố định"""
+        iterator = iter(items)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _document_ids(self, langchain_documents: List[Document]) -> List[str]:
+        """Tạo docstore id cố định cho từng chunk (theo file, hash nội dung file và vị trí chunk)"""
+        return [
+            f"{file_key(doc.metadata['source'], doc.metadata.get('file_hash', ''))}-{doc.metadata['chunk_id']}"
+            for doc in langchain_documents
+        ]
+
+    def _index_stream(self, documents: Iterable[Dict], writer: ColumnarDocstoreWriter,
+                      index: Optional[faiss.Index] = None,
+                      progress_callback: Optional[Callable[[Dict], None]] = None
+                      ) -> Tuple[Dict[str, Dict], Optional[faiss.Index]]:
+        """Pipeline streaming: trích xuất → chia chunk → embed theo batch cố định → thêm vào index
+
+        Chỉ một batch chunk được giữ trong bộ nhớ tại một thời điểm: nội dung và
+        metadata của mỗi batch được ghi thẳng vào docstore dạng cột (`writer`),
+        chỉ vector được thêm vào FAISS index (`index`, tạo mới nếu None). Các
+        stage là generator nên stage trước chỉ chạy khi stage sau cần thêm dữ liệu.
+        Trả về các mục manifest (hash file, chunk id) của những file đã được index
+        cùng index đã được thêm vector.
+        """
+        files: Dict[str, Dict] = {}
+        progress = {'files': 0, 'chunks': 0, 'batches': 0, 'embeddings_reused': 0, 'embeddings_computed': 0}
+        start_time = datetime.now()
+
+        def track_files(docs: Iterable[Dict]) -> Iterator[Dict]:
+            for doc in docs:
+                files[doc['filename']] = {'file_hash': doc.get('file_hash', ''), 'chunk_ids': []}
+                progress['files'] += 1
+                yield doc
+
+        chunks = self.iter_chunks(track_files(documents))
+        for batch in self._iter_batches(chunks, max(1, Config.INGEST_BATCH_SIZE)):
+            ids = self._document_ids(batch)
+            texts = [doc.page_content for doc in batch]
+            vectors, stats = self.chunk_embeddings.embed_chunks(texts)
+            vectors = np.asarray(vectors, dtype=np.float32)
+
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+            writer.add_batch(texts, [doc.metadata for doc in batch], ids)
+
+            for doc, doc_id in zip(batch, ids):
+                files[doc.metadata['source']]['chunk_ids'].append(doc_id)
+
+            progress['chunks'] += len(batch)
+            progress['batches'] += 1
+            progress['embeddings_reused'] += stats['reused']
+            progress['embeddings_computed'] += stats['computed']
+            logger.info(
+                f"📦 Batch {progress['batches']}: {progress['files']} file, {progress['chunks']} chunks đã index"
+            )
+            if progress_callback:
+                progress_callback(dict(progress))
+
+        self.last_build_stats = {
+            **progress,
+            'duration_seconds': round((datetime.now() - start_time).total_seconds(), 3),
+            'finished_at': datetime.now().isoformat(),
+        }
+        logger.info(
+            f"Đã index {progress['chunks']} chunks từ {progress['files']} tài liệu "
+            f"(dùng lại {progress['embeddings_reused']}, tính mới {progress['embeddings_computed']} embedding)"
+        )
+        return files, index
+
+    def _finish_build(self, writer: ColumnarDocstoreWriter, index: faiss.Index, files: Dict[str, Dict]):
+        """Lưu docstore + index, BM25, manifest, catalog vào thư mục thế hệ của `writer`, rồi chuyển sang phục vụ nó
+
+        Thế hệ mới chỉ được phục vụ (CURRENT) khi mọi file đã ghi xong, nên process
+        bị dừng giữa chừng hay process đang đọc không bao giờ thấy docstore mới đi
+        cùng index cũ.
+        """
+        generation = writer.path
+        writer.commit()
+        save_faiss_index(index, generation)
+        self.vector_db = load_index(generation, self.embeddings)
+        self._build_lexical_index(generation)
+        self._save_manifest(generation, files)
+        self._save_stats_catalog(generation)
+        publish_generation(Config.VECTOR_DB_PATH, generation)
+        self._load_saved_index()
+
+    def compact_chunk_cache(self) -> int:
+        """Xóa khỏi kho embedding chunk các mục không còn được index hiện tại tham chiếu"""
+        if not self.vector_db:
+            return 0
+        texts = [
+            self.vector_db.docstore.search(doc_id).page_content
+            for doc_id in self.vector_db.index_to_docstore_id.values()
+        ]
+        return self.chunk_embeddings.compact(texts)
+
+    @staticmethod
+    def _manifest_path(path: str) -> str:
+        return os.path.join(path, 'manifest.json')
+
+    def _manifest_settings(self) -> Dict:
+        """Các cấu hình mà khi thay đổi thì bắt buộc xây dựng lại toàn bộ"""
+        return {
+            'embedding_model': self.embeddings.model_name,
+            'chunk_size': Config.CHUNK_SIZE,
+            'chunk_overlap': Config.CHUNK_OVERLAP,
+            'index_type': Config.FAISS_INDEX_TYPE,
+        }
+
+    def _load_manifest(self, path: str) -> Optional[Dict]:
+        """Đọc manifest (hash file và danh sách chunk id) nằm cạnh index trong thư mục thế hệ"""
+        try:
+            with open(self._manifest_path(path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_manifest(self, path: str, files: Dict[str, Dict]):
+        manifest = {
+            **self._manifest_settings(),
+            'updated_at': datetime.now().isoformat(),
+            'last_build': self.last_build_stats,
+            'files': files,
+        }
+        with open(self._manifest_path(path), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
     def _extract_file_info(self, filename: str) -> Dict:
         """Trích xuất thông tin từ tên file"""
         info = {
@@ -99,87 +281,417 @@ class VectorStore:
 
         return info
 
-    def build_vector_store(self, force_rebuild: bool = False):
-        """Xây dựng cơ sở dữ liệu vector"""
-        if not force_rebuild and os.path.exists(Config.VECTOR_DB_PATH):
+    def build_vector_store(self, force_rebuild: bool = False, incremental: bool = False,
+                           progress_callback: Optional[Callable[[Dict], None]] = None):
+        """Xây dựng cơ sở dữ liệu vector
+
+        Với `incremental=True`, chỉ các file mới hoặc đã thay đổi (theo manifest)
+        được embed lại; vector của file bị xóa/thay thế sẽ bị loại khỏi index.
+        `progress_callback` nhận thống kê tiến độ sau mỗi batch embedding.
+        """
+        if incremental:
+            if self._update_vector_store(progress_callback):
+                return
+            force_rebuild = True
+
+        if not force_rebuild and index_exists(Config.VECTOR_DB_PATH):
             logger.info("Đang tải cơ sở dữ liệu vector hiện có...")
-            self.vector_db = FAISS.load_local(
-                Config.VECTOR_DB_PATH,
-                self.embeddings,
-                allow_dangerous_deserialization=True,
-            )
+            self._load_saved_index()
             return
 
         logger.info("Đang xây dựng cơ sở dữ liệu vector mới...")
 
-        # Xử lý tài liệu
+        # Xử lý tài liệu, chia chunk và embed theo luồng, ghi thẳng xuống docstore trên đĩa
         processor = DocumentProcessor()
-        documents = processor.process_all_documents()
-
-        if not documents:
-            logger.error("Không tìm thấy tài liệu để xử lý!")
-            return
+        generation = new_generation(Config.VECTOR_DB_PATH)
+        writer = ColumnarDocstoreWriter(generation)
+        try:
+            filenames = processor.list_document_files()
+            files, index = self._index_stream(
+                processor.iter_documents(filenames), writer, progress_callback=progress_callback,
+            )
+            # File không có nội dung vẫn được ghi vào manifest (0 chunk) để lần cập nhật sau không trích xuất lại
+            for filename in filenames:
+                if filename not in files:
+                    files[filename] = {
+                        'file_hash': processor.compute_file_hash(os.path.join(processor.data_dir, filename)),
+                        'chunk_ids': [],
+                    }
+            if index is None:
+                writer.abort()
+                discard_generation(Config.VECTOR_DB_PATH, generation)
+                logger.error("Không tìm thấy tài liệu để xử lý!")
+                return
+            # Lưu rồi chuyển sang phục vụ từ bản memory-map trên đĩa
+            self._finish_build(writer, self._apply_index_type(index), files)
+        except BaseException:
+            writer.abort()
+            discard_generation(Config.VECTOR_DB_PATH, generation)
+            raise
 
-        # Tạo documents cho langchain
-        langchain_documents = self.create_documents(documents)
+        logger.info(f"Đã lưu cơ sở dữ liệu vector tại: {Config.VECTOR_DB_PATH}")
 
-        # Tạo vector store
-        self.vector_db = FAISS.from_documents(langchain_documents, self.embeddings)
+    def _build_lexical_index(self, path: str):
+        """Xây dựng chỉ mục BM25 từ chính các chunk trong index (cùng thứ tự vị trí) và lưu cạnh index tại `path`"""
+        docstore = self.vector_db.docstore
+        index_to_docstore_id = self.vector_db.index_to_docstore_id
+        if isinstance(docstore, ColumnarDocstore):
+            texts = (docstore.text_at(i) for i in range(len(docstore)))
+        else:
+            texts = (
+                docstore.search(index_to_docstore_id[i]).page_content
+                for i in range(len(index_to_docstore_id))
+            )
+        self.lexical_index = BM25Index.build(texts)
+        self.lexical_index.save(path)
+
+    def _save_stats_catalog(self, path: str) -> Dict:
+        """Tính và lưu thống kê của index lưu tại `path` (số chunk theo loại/năm, danh sách file, dung lượng)"""
+        catalog = build_stats_catalog(path)
+        catalog.update({
+            'embedding_model': self.embeddings.model_name,
+            'index_type': Config.FAISS_INDEX_TYPE,
+            'chunk_size': Config.CHUNK_SIZE,
+            'chunk_overlap': Config.CHUNK_OVERLAP,
+            'built_at': datetime.now().isoformat(),
+        })
+        save_stats_catalog(path, catalog)
+        return catalog
+
+    def _load_saved_index(self):
+        """Tải index đã lưu (vector memory-map chỉ đọc, docstore không dùng pickle)"""
+        # Mọi file đều đọc từ cùng một thế hệ, kể cả khi process khác vừa chuyển CURRENT
+        generation = current_generation(Config.VECTOR_DB_PATH)
+        self.vector_db = load_index(generation, self.embeddings)
+        self._filter_cache = {}
+        if self.vector_db is not None:
+            tune_index(self.vector_db.index)
+        self.lexical_index = BM25Index.load(generation)
+        if self.vector_db is not None and (
+            self.lexical_index is None or self.lexical_index.n_docs != self.vector_db.index.ntotal
+        ):
+            # Index được tạo trước khi có BM25, hoặc postings không khớp index: xây dựng lại từ docstore
+            if self.lexical_index is not None:
+                logger.warning(
+                    f"Chỉ mục BM25 ({self.lexical_index.n_docs} chunks) không khớp FAISS index "
+                    f"({self.vector_db.index.ntotal} vector), đang xây dựng lại"
+                )
+            self._build_lexical_index(generation)
+        self.last_build_stats = (self._load_manifest(generation) or {}).get('last_build', {})
+        self.stats_catalog = {}
+        if self.vector_db is not None:
+            self.stats_catalog = load_stats_catalog(generation) or {}
+            if not self.stats_catalog and isinstance(self.vector_db.docstore, ColumnarDocstore):
+                # Index được tạo trước khi có catalog thống kê
+                self.stats_catalog = self._save_stats_catalog(generation)
+        index_path = os.path.join(generation, INDEX_FILE)
+        self.index_version = str(os.stat(index_path).st_mtime_ns) if os.path.exists(index_path) else None
+
+    def _update_vector_store(self, progress_callback: Optional[Callable[[Dict], None]] = None) -> bool:
+        """Cập nhật index theo manifest. Trả về False nếu cần xây dựng lại toàn bộ."""
+        generation = current_generation(Config.VECTOR_DB_PATH)
+        manifest = self._load_manifest(generation)
+        if not manifest or not index_exists(Config.VECTOR_DB_PATH):
+            logger.info("Chưa có manifest hoặc index, sẽ xây dựng lại toàn bộ")
+            return False
+        if any(manifest.get(key) != value for key, value in self._manifest_settings().items()):
+            logger.info("Cấu hình embedding/chunk/index đã thay đổi, sẽ xây dựng lại toàn bộ")
+            return False
+        if Config.FAISS_INDEX_TYPE != 'flat':
+            # Index xấp xỉ (HNSW/IVF/PQ) không hỗ trợ xóa vector ổn định, cần train lại từ đầu;
+            # embedding vẫn được dùng lại từ kho embedding chunk
+            logger.info(f"Index '{Config.FAISS_INDEX_TYPE}' không hỗ trợ cập nhật tăng dần, sẽ xây dựng lại toàn bộ")
+            return False
 
-        # Lưu vector store
-        os.makedirs(Config.VECTOR_DB_PATH, exist_ok=True)
-        self.vector_db.save_local(Config.VECTOR_DB_PATH)
+        processor = DocumentProcessor()
+        current_files = {
+            filename: processor.compute_file_hash(os.path.join(processor.data_dir, filename))
+            for filename in processor.list_document_files()
+        }
+        old_files = manifest.get('files', {})
+
+        removed = [
+            filename for filename, entry in old_files.items()
+            if current_files.get(filename) != entry.get('file_hash')
+        ]
+        added = [
+            filename for filename, file_hash in current_files.items()
+            if filename not in old_files or old_files[filename].get('file_hash') != file_hash
+        ]
+
+        if not removed and not added:
+            logger.info("Không có tài liệu thay đổi, giữ nguyên cơ sở dữ liệu vector")
+            self._load_saved_index()
+            return True
+
+        # Docstore cũ được đọc qua memory-map và chép sang docstore của thế hệ mới theo luồng;
+        # chỉ FAISS index được nạp vào RAM để xóa/thêm vector
+        stored = load_index(generation, self.embeddings)
+
+        logger.info(f"🔄 Cập nhật tăng dần: {len(added)} file mới/thay đổi, {len(removed)} file bị xóa/thay thế")
+
+        files = {filename: entry for filename, entry in old_files.items() if filename not in removed}
+        stale_ids = [
+            doc_id for filename in removed for doc_id in old_files[filename].get('chunk_ids', [])
+        ]
+        n_stored = len(stored.index_to_docstore_id)
+        if len(stale_ids) >= n_stored:
+            # Mọi vector đều bị thay thế: xây dựng lại toàn bộ sẽ đơn giản hơn
+            return False
+        stale = set(stale_ids)
+        stale_positions = [i for i in range(n_stored) if stored.index_to_docstore_id[i] in stale]
+
+        index = faiss.read_index(os.path.join(generation, INDEX_FILE))
+        if stale_positions:
+            # IndexFlat giữ nguyên thứ tự các vector còn lại, khớp với thứ tự chép docstore bên dưới
+            index.remove_ids(faiss.IDSelectorBatch(np.asarray(stale_positions, dtype=np.int64)))
+
+        next_generation = new_generation(Config.VECTOR_DB_PATH)
+        writer = ColumnarDocstoreWriter(next_generation)
+        try:
+            stale_position_set = set(stale_positions)
+            for position in range(n_stored):
+                if position not in stale_position_set:
+                    doc = stored_document(stored, position)
+                    writer.add(doc.page_content, doc.metadata, stored.index_to_docstore_id[position])
+            indexed_files, index = self._index_stream(
+                processor.iter_documents(added), writer, index, progress_callback
+            )
+            added_count = sum(len(entry['chunk_ids']) for entry in indexed_files.values())
+            for filename in added:
+                files[filename] = indexed_files.get(
+                    filename, {'file_hash': current_files[filename], 'chunk_ids': []}
+                )
+            self._finish_build(writer, index, files)
+        except BaseException:
+            writer.abort()
+            discard_generation(Config.VECTOR_DB_PATH, next_generation)
+            raise
+        logger.info(f"Đã cập nhật cơ sở dữ liệu vector: -{len(stale_ids)} / +{added_count} vectors")
+        return True
+
+    def _index_vectors(self) -> np.ndarray:
+        """Lấy toàn bộ vector của index hiện tại theo đúng thứ tự vị trí trong index"""
+        if isinstance(self.vector_db.index, faiss.IndexFlat):
+            return self.vector_db.index.reconstruct_n(0, self.vector_db.index.ntotal)
+        texts = [
+            self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[i]).page_content
+            for i in range(len(self.vector_db.index_to_docstore_id))
+        ]
+        vectors, _ = self.chunk_embeddings.embed_chunks(texts)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _apply_index_type(self, index: faiss.Index) -> faiss.Index:
+        """Thay index flat vừa xây dựng bằng loại index trong Config (train nếu cần)"""
+        if Config.FAISS_INDEX_TYPE == 'flat':
+            return index
+        logger.info(f"🏗️ Xây dựng FAISS index '{Config.FAISS_INDEX_TYPE}' từ {index.ntotal} vector")
+        return build_faiss_index(index.reconstruct_n(0, index.ntotal), Config.FAISS_INDEX_TYPE)
+
+    def index_report(self, queries: List[str], k: int = 5, index_types: List[str] = None) -> List[Dict]:
+        """So sánh recall@k, độ trễ và kích thước của các loại FAISS index trên dữ liệu hiện tại"""
+        if not self.vector_db:
+            logger.error("Cơ sở dữ liệu vector chưa được khởi tạo!")
+            return []
+        query_vectors = self.query_embeddings.embed_queries(queries)
+        return compare_index_types(self._index_vectors(), query_vectors, k=k, index_types=index_types)
+
+    @staticmethod
+    def _normalize_filters(filters: Dict) -> Dict[str, Tuple[str, ...]]:
+        """Chuẩn hóa bộ lọc {'category': ..., 'year': ...} thành khóa metadata -> các giá trị cho phép"""
+        keys = {'category': 'file_category', 'year': 'file_year'}
+        normalized = {}
+        for key, values in (filters or {}).items():
+            if values is None:
+                continue
+            if isinstance(values, (str, int)):
+                values = [values]
+            normalized[keys.get(key, key)] = tuple(sorted(str(value) for value in values))
+        return normalized
+
+    def _filter_entry(self, filters: Dict[str, Tuple[str, ...]]) -> Tuple[np.ndarray, np.ndarray, faiss.IDSelector]:
+        """(mặt nạ chunk, bitmap, IDSelector) cho bộ lọc, được cache cho đến khi tải lại index"""
+        key = tuple(sorted(filters.items()))
+        entry = self._filter_cache.get(key)
+        if entry is None:
+            docstore = self.vector_db.docstore
+            if isinstance(docstore, ColumnarDocstore):
+                mask = docstore.chunk_mask(filters)
+            else:
+                mask = np.array([
+                    all(
+                        str(docstore.search(self.vector_db.index_to_docstore_id[i]).metadata.get(field)) in values
+                        for field, values in filters.items()
+                    )
+                    for i in range(len(self.vector_db.index_to_docstore_id))
+                ], dtype=bool)
+            bitmap = np.packbits(mask, bitorder='little')
+            selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+            entry = self._filter_cache[key] = (mask, bitmap, selector)
+        return entry
+
+    def _resolve_filters(self, query: str, filters: Optional[Dict]) -> Optional[Dict[str, Tuple[str, ...]]]:
+        """Bộ lọc tường minh được áp dụng nguyên vẹn; bộ lọc tự suy ra chỉ giữ phần khớp được chunk"""
+        if filters is not None:
+            return self._normalize_filters(filters) or None
+        if not Config.SEARCH_AUTO_FILTERS:
+            return None
+
+        inferred = self._normalize_filters(self.query_expander.parse_filters(query))
+        candidates = [inferred] + [{field: values} for field, values in inferred.items()]
+        for candidate in candidates:
+            if candidate and self._filter_entry(candidate)[0].any():
+                return candidate
+        return None
+
+    def _search_vectors(self, query_vectors: np.ndarray, k: int,
+                        selector: Optional[faiss.IDSelector] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Chạy một lần tìm kiếm FAISS nhiều dòng cho ma trận embedding truy vấn"""
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if getattr(self.vector_db, '_normalize_L2', False):
+            faiss.normalize_L2(query_vectors)
+        with tracer.span('faiss_search', queries=len(query_vectors), k=k, filtered=selector is not None):
+            if selector is None:
+                return self.vector_db.index.search(query_vectors, k)
+            return self.vector_db.index.search(
+                query_vectors, k, params=search_parameters(self.vector_db.index, selector)
+            )
 
-        logger.info(f"Đã lưu cơ sở dữ liệu vector tại: {Config.VECTOR_DB_PATH}")
+    def _search_positions(self, queries: List[str], k: int = 5, k_per_query: int = None,
+                          filters: Optional[Dict[str, Tuple[str, ...]]] = None) -> List[Tuple[int, float]]:
+        """Tìm kiếm gộp cho nhiều truy vấn: một lần embed, một lần tìm kiếm FAISS.
 
-    def search(self, query: str, k: int = 5, use_query_expansion: bool = True) -> List[Dict]:
-        """Tìm kiếm thông tin liên quan đến câu hỏi với tùy chọn mở rộng truy vấn"""
+        Bộ lọc metadata được đẩy xuống FAISS bằng IDSelectorBitmap nên chỉ các
+        chunk thỏa điều kiện được xét. Trả về (vị trí trong index, score) của
+        top k, chưa đọc gì từ docstore.
+        """
+        if not queries:
+            return []
+        k_per_query = k_per_query or k
+
+        with tracer.span('embedding', queries=len(queries)):
+            query_vectors = self.query_embeddings.embed_queries(queries)
+        distances, indices, mask = self._search_filtered(query_vectors, k_per_query, filters)
+        return self._merge_hits(distances, indices, k, mask)
+
+    def _search_filtered(self, query_vectors: np.ndarray, k: int,
+                         filters: Optional[Dict[str, Tuple[str, ...]]] = None
+                         ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Tìm kiếm FAISS nhiều dòng với bộ lọc metadata (nếu có); trả về kèm mặt nạ để `_merge_hits` lọc"""
+        if not filters:
+            distances, indices = self._search_vectors(query_vectors, k)
+            return distances, indices, None
+        mask, _, selector = self._filter_entry(filters)
+        if search_parameters(self.vector_db.index, selector) is not None:
+            distances, indices = self._search_vectors(query_vectors, k, selector)
+        else:
+            # Index không hỗ trợ IDSelector (ví dụ PQ): lấy dư ứng viên rồi lọc
+            fetch = min(self.vector_db.index.ntotal, k * 20)
+            distances, indices = self._search_vectors(query_vectors, fetch)
+        return distances, indices, mask
+
+    @staticmethod
+    def _merge_hits(distances: np.ndarray, indices: np.ndarray, k: int,
+                    mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Gộp kết quả của mọi truy vấn rồi sắp xếp theo score (thấp hơn = tốt hơn)"""
+        distances = distances.ravel()
+        indices = indices.ravel()
+        valid = indices >= 0
+        if mask is not None:
+            valid &= mask[np.where(valid, indices, 0)]
+        distances, indices = distances[valid], indices[valid]
+        order = np.argsort(distances, kind='stable')[:k]
+        return [(int(indices[pos]), float(distances[pos])) for pos in order]
+
+    def _result_at(self, position: int, score: float) -> Optional[SearchResult]:
+        """Tạo kết quả tìm kiếm lazy cho một vị trí trong index"""
+        docstore = self.vector_db.docstore
+        if isinstance(docstore, ColumnarDocstore):
+            return SearchResult(docstore, position, score)
+        doc = docstore.search(self.vector_db.index_to_docstore_id[position])
+        if isinstance(doc, Document):
+            return SearchResult.from_document(doc, score)
+        return None
+
+    def search_many(self, queries: List[str], k: int = 5, k_per_query: int = None) -> List[Tuple[Document, float]]:
+        """Tìm kiếm gộp cho nhiều truy vấn, trả về (Document, score)"""
+        results = []
+        for position, score in self._search_positions(queries, k=k, k_per_query=k_per_query):
+            docstore_id = self.vector_db.index_to_docstore_id[position]
+            doc = self.vector_db.docstore.search(docstore_id)
+            if isinstance(doc, Document):
+                results.append((doc, score))
+        return results
+
+    def _hybrid_positions(self, query: str, dense_queries: List[str], k: int,
+                          filters: Optional[Dict[str, Tuple[str, ...]]] = None) -> List[Tuple[int, float]]:
+        """Kết hợp kết quả FAISS và BM25 bằng Reciprocal Rank Fusion
+
+        Score trả về = 1 / điểm RRF để giữ quy ước "thấp hơn = tốt hơn" như khoảng cách L2.
+        """
+        candidates = max(k, Config.HYBRID_CANDIDATES)
+        rankings = [self._search_positions(dense_queries, k=candidates, k_per_query=candidates, filters=filters)]
+        if self.lexical_index is not None:
+            mask = self._filter_entry(filters)[0] if filters else None
+            with tracer.span('bm25_search'):
+                rankings.append(self.lexical_index.search(query, candidates, mask=mask))
+        else:
+            logger.warning("Chưa có chỉ mục BM25, chế độ hybrid chỉ dùng tìm kiếm vector")
+        return [(position, 1.0 / fused) for position, fused in reciprocal_rank_fusion(rankings, k)]
+
+    def search(self, query: str, k: int = 5, use_query_expansion: bool = True,
+               mode: str = None, filters: Optional[Dict] = None) -> List[SearchResult]:
+        """Tìm kiếm thông tin liên quan đến câu hỏi với tùy chọn mở rộng truy vấn
+
+        `mode`: 'vector' (FAISS), 'bm25' (từ khóa) hoặc 'hybrid' (gộp cả hai bằng RRF);
+        mặc định lấy từ Config.SEARCH_MODE.
+        `filters`: ví dụ {'category': 'quota', 'year': ['2024', '2025']}. Nếu bỏ trống
+        và bật Config.SEARCH_AUTO_FILTERS, bộ lọc được suy ra từ câu hỏi; truyền {}
+        để tắt lọc.
+        """
         if not self.vector_db:
             logger.error("Cơ sở dữ liệu vector chưa được khởi tạo!")
             return []
 
+        mode = mode or Config.SEARCH_MODE
         try:
-            logger.info(f"🔍 Tìm kiếm: '{query}' (k={k}, expansion={use_query_expansion})")
+            logger.info(f"🔍 Tìm kiếm: '{query}' (k={k}, expansion={use_query_expansion}, mode={mode})")
             
             # Mở rộng truy vấn nếu được bật
-            if use_query_expansion:
-                expanded_queries = self.query_expander.expand_query(query, method="combined")
-                logger.info(f"📈 Sử dụng {len(expanded_queries)} truy vấn mở rộng")
-                
-                # Tìm kiếm với tất cả các truy vấn mở rộng
-                all_results = []
-                for exp_query in expanded_queries:
-                    try:
-                        exp_results = self.vector_db.similarity_search_with_score(exp_query, k=k//2)
-                        all_results.extend(exp_results)
-                    except Exception as e:
-                        logger.warning(f"Lỗi khi tìm kiếm với query '{exp_query}': {e}")
-                
-                # Sắp xếp theo score và lấy top k
-                all_results.sort(key=lambda x: x[1])  # Sắp xếp theo score (thấp hơn = tốt hơn)
-                results = all_results[:k]
+            dense_queries = [query]
+            expanded = use_query_expansion and mode != 'bm25'
+            if expanded:
+                dense_queries = self.query_expander.expand_query(query, method="combined")
+                logger.info(f"📈 Sử dụng {len(dense_queries)} truy vấn mở rộng")
+
+            active_filters = self._resolve_filters(query, filters)
+            if active_filters:
+                logger.info(f"🎯 Lọc theo metadata: {active_filters}")
+
+            if mode == 'hybrid':
+                hits = self._hybrid_positions(query, dense_queries, k, filters=active_filters)
+            elif mode == 'bm25':
+                if self.lexical_index is None:
+                    logger.error("Chưa có chỉ mục BM25!")
+                    return []
+                mask = self._filter_entry(active_filters)[0] if active_filters else None
+                # Điểm BM25 cao hơn = tốt hơn; đổi dấu để giữ quy ước "thấp hơn = tốt hơn"
+                with tracer.span('bm25_search'):
+                    hits = [(position, -score) for position, score in self.lexical_index.search(query, k, mask=mask)]
+            elif expanded:
+                # Embed tất cả truy vấn mở rộng trong một lần và tìm kiếm FAISS dạng ma trận
+                hits = self._search_positions(
+                    dense_queries, k=k, k_per_query=max(1, k // 2), filters=active_filters
+                )
             else:
-                results = self.vector_db.similarity_search_with_score(query, k=k)
-
-            formatted_results = []
-            for doc, score in results:
-                formatted_results.append({
-                    'content': doc.page_content,
-                    'source': doc.metadata.get('source', 'Unknown'),
-                    'score': float(score),
-                    'chunk_id': doc.metadata.get('chunk_id', 0),
-                    'total_chunks': doc.metadata.get('total_chunks', 0),
-                    # Metadata nâng cao
-                    'chunk_hash': doc.metadata.get('chunk_hash', ''),
-                    'load_time': doc.metadata.get('load_time', ''),
-                    'file_size': doc.metadata.get('file_size', 0),
-                    'chunk_size': doc.metadata.get('chunk_size', 0),
-                    'file_type': doc.metadata.get('file_type', 'unknown'),
-                    'file_title': doc.metadata.get('file_title', ''),
-                    'file_year': doc.metadata.get('file_year', 'unknown'),
-                    'file_category': doc.metadata.get('file_category', 'general'),
-                    'processing_timestamp': doc.metadata.get('processing_timestamp', 0)
-                })
+                hits = self._search_positions(dense_queries, k=k, filters=active_filters)
+
+            # Kết quả là Mapping lazy: nội dung/metadata chỉ được đọc khi truy cập
+            with tracer.span('format_results', hits=len(hits)):
+                formatted_results = [
+                    result for result in (self._result_at(position, score) for position, score in hits)
+                    if result is not None
+                ]
 
             logger.info(f"✅ Tìm thấy {len(formatted_results)} kết quả từ {len(set(r['source'] for r in formatted_results))} tài liệu")
             for i, result in enumerate(formatted_results[:3], 1):
@@ -191,53 +703,116 @@ class VectorStore:
             logger.error(f"Lỗi khi tìm kiếm: {str(e)}")
             return []
 
-    def get_statistics(self) -> Dict:
-        """Lấy thống kê về cơ sở dữ liệu vector"""
+    def search_batch(self, queries: List[str], k: int = 5, use_query_expansion: bool = True,
+                     mode: str = None) -> List[List[SearchResult]]:
+        """Tìm kiếm cho nhiều câu hỏi độc lập (xử lý hàng loạt), cùng kết quả như gọi `search` từng câu.
+
+        Mọi truy vấn (kể cả truy vấn mở rộng) được embed trong một batch; các câu
+        hỏi được nhóm theo bộ lọc metadata (tường minh hoặc tự suy ra) và mỗi
+        nhóm được tìm kiếm FAISS trong một lần dạng ma trận. Chế độ 'bm25' được
+        tìm riêng bằng `search`.
+        """
         if not self.vector_db:
-            return {'status': 'not_initialized'}
-        
-        try:
-            # Lấy thông tin chi tiết từ vector store
-            total_vectors = len(self.vector_db.index_to_docstore_id)
-            
-            # Thống kê theo category
-            categories = {}
-            years = {}
-            file_sizes = []
-            
-            # Lấy metadata từ tất cả documents (nếu có thể)
-            try:
-                # Thử lấy một số documents để phân tích
-                sample_docs = self.vector_db.similarity_search("", k=min(100, total_vectors))
-                for doc in sample_docs:
-                    category = doc.metadata.get('file_category', 'unknown')
-                    year = doc.metadata.get('file_year', 'unknown')
-                    file_size = doc.metadata.get('file_size', 0)
-                    
-                    categories[category] = categories.get(category, 0) + 1
-                    years[year] = years.get(year, 0) + 1
-                    if file_size > 0:
-                        file_sizes.append(file_size)
-            except:
-                pass
-            
-            return {
-                'status': 'initialized',
-                'total_vectors': total_vectors,
-                'categories': categories,
-                'years': years,
-                'avg_file_size': sum(file_sizes) // len(file_sizes) if file_sizes else 0,
-                'total_files': len(set(years.keys()) - {'unknown'}) if years else 0
-            }
-        except Exception as e:
-            logger.error(f"Lỗi khi lấy thống kê: {str(e)}")
-            return {'status': 'error', 'error': str(e)}
+            logger.error("Cơ sở dữ liệu vector chưa được khởi tạo!")
+            return [[] for _ in queries]
+        mode = mode or Config.SEARCH_MODE
+        if mode == 'bm25':
+            return [self.search(query, k=k, use_query_expansion=use_query_expansion, mode=mode) for query in queries]
+        if not queries:
+            return []
 
+        if mode == 'hybrid':
+            limit = k_per_query = max(k, Config.HYBRID_CANDIDATES)
+        else:
+            limit, k_per_query = k, (max(1, k // 2) if use_query_expansion else k)
+
+        # Bộ lọc -> [(câu hỏi thứ i, các dòng của nó trong ma trận embedding)]
+        groups: Dict[Tuple, Tuple[Optional[Dict], List[Tuple[int, slice]]]] = {}
+        flat_queries = []
+        for i, query in enumerate(queries):
+            dense_queries = self.query_expander.expand_query(query, method="combined") if use_query_expansion else [query]
+            rows = slice(len(flat_queries), len(flat_queries) + len(dense_queries))
+            flat_queries.extend(dense_queries)
+            active_filters = self._resolve_filters(query, None)
+            key = tuple(sorted(active_filters.items())) if active_filters else ()
+            groups.setdefault(key, (active_filters, []))[1].append((i, rows))
+
+        with tracer.span('embedding', queries=len(flat_queries)):
+            query_vectors = np.asarray(self.query_embeddings.embed_queries(flat_queries), dtype=np.float32)
+
+        results: List[List[SearchResult]] = [[] for _ in queries]
+        for active_filters, members in groups.values():
+            group_rows = np.concatenate([np.arange(rows.start, rows.stop) for _, rows in members])
+            distances, indices, mask = self._search_filtered(query_vectors[group_rows], k_per_query, active_filters)
+
+            offset = 0
+            for i, rows in members:
+                count = rows.stop - rows.start
+                own = slice(offset, offset + count)
+                offset += count
+                hits = self._merge_hits(distances[own], indices[own], limit, mask)
+                if mode == 'hybrid':
+                    rankings = [hits]
+                    if self.lexical_index is not None:
+                        with tracer.span('bm25_search'):
+                            rankings.append(self.lexical_index.search(queries[i], limit, mask=mask))
+                    hits = [(position, 1.0 / fused) for position, fused in reciprocal_rank_fusion(rankings, k)]
+                with tracer.span('format_results', hits=len(hits)):
+                    results[i] = [
+                        result for result in (self._result_at(position, score) for position, score in hits)
+                        if result is not None
+                    ]
+
+        logger.info(f"✅ Tìm kiếm hàng loạt {len(queries)} câu hỏi ({len(groups)} lần tìm kiếm FAISS theo bộ lọc)")
+        return results
+
+    async def asearch(self, query: str, k: int = 5, use_query_expansion: bool = True,
+                      mode: str = None, filters: Optional[Dict] = None) -> List[SearchResult]:
+        """Bản async của `search`: embedding và tìm kiếm FAISS/BM25 chạy trong executor CPU có giới hạn"""
+        return await run_cpu_bound(
+            self.search, query, k=k, use_query_expansion=use_query_expansion, mode=mode, filters=filters
+        )
+
+    def get_statistics(self) -> Dict:
+        """Lấy thống kê về cơ sở dữ liệu vector (đọc từ catalog đã tính sẵn, không tìm kiếm)"""
+        runtime = {
+            'embedding': self.embeddings.get_statistics(),
+            'query_cache': self.query_embeddings.get_statistics(),
+            'chunk_cache': self.chunk_embeddings.get_statistics(),
+            'last_build': self.last_build_stats,
+        }
+        if not self.vector_db:
+            return {'status': 'not_initialized', **runtime}
+
+        catalog = self.stats_catalog or {}
+        return {
+            'status': 'initialized',
+            'total_vectors': catalog.get('total_vectors', len(self.vector_db.index_to_docstore_id)),
+            'categories': catalog.get('categories', {}),
+            'years': catalog.get('years', {}),
+            'avg_file_size': catalog.get('avg_file_size', 0),
+            'total_files': catalog.get('total_files', 0),
+            'catalog': catalog,
+            **runtime,
+        }
 
 if __name__ == "__main__":
+    import sys
+    from faiss_index import format_report
+
     vector_store = VectorStore()
     vector_store.build_vector_store(force_rebuild=True)
 
+    if "--index-report" in sys.argv:
+        report_queries = [
+            "chỉ tiêu tuyển sinh 2025",
+            "điểm chuẩn ngành công nghệ thông tin",
+            "quy chế xét tuyển học bạ",
+            "thời gian nộp hồ sơ tuyển sinh",
+            "học phí và học bổng",
+        ]
+        print(format_report(vector_store.index_report(report_queries, k=5)))
+
     # Test tìm kiếm
     test_query = "chỉ tiêu tuyển sinh 2025"
     results = vector_store.search(test_query)